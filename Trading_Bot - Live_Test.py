@@ -1,590 +1,4841 @@
-# paper_bot_live_full.py
-# Paper-Trading Bot + Dashboard (Dark Mode, Live Chart, EMA, RSI, Entries/Exits, SSE realtime)
-#
-# Usage: python paper_bot_live_full.py
-# Requirements: pip install ccxt flask pandas numpy requests
-
-import os
-import time
-import threading
-import json
-from datetime import datetime, timezone
-from io import StringIO
-
-import ccxt
-import pandas as pd
-import numpy as np
-import requests
-from flask import Flask, jsonify, render_template_string, Response, request, send_file
-
-# -------------------------
-# === USER CONFIG ===
-# -------------------------
-# Telegram (put your token & chat id here)
-TELEGRAM_TOKEN = ""   # <-- set your telegram bot token or leave empty to disable telegram
-TELEGRAM_CHAT_ID = "" # <-- set chat id
-
-def send_telegram_message(text: str):
-    if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
-        return
-    try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-        payload = {'chat_id': TELEGRAM_CHAT_ID, 'text': text, 'parse_mode': 'Markdown'}
-        requests.post(url, data=payload, timeout=5)
-    except Exception as e:
-        print("Telegram send error:", e)
-
-# Trading config (paper trading)
-order_size_usdt = 10.0         # fixed per-trade size (paper trading)
-start_capital = 100.0          # starting capital
-fee_pct = 0.0004               # 0.04% per trade (as in your backtest)
-trigger_pct = 1.5              # breakout threshold (%) 
-profit_target = 10.0           # TP (%) from entry (in percent)
-stop_loss = 3.0                # SL (%) from entry
-max_open_per_side = 12         # pyramiding limit per side
-symbol = "BTC/USDT"            # market symbol used
-fetch_limit_2h = 200
-fetch_limit_30m = 400
-loop_sleep = 60                # main loop sleep (seconds)
-chart_history_points = 300
-
-# EMAs / RSI config
-ema_short = 50
-ema_long = 200
-rsi_period = 14
-
-# -------------------------
-# === GLOBAL STATE ===
-# -------------------------
-capital = start_capital
-open_trades = []
-closed_trades = []
-price_history = []   # list of [ts_ms, price]
-capital_history = [] # list of [ts_ms, capital]
-last_status_update = datetime.now(timezone.utc)
-
-# -------------------------
-# === EXCHANGE SETUP ===
-# -------------------------
-exchange = ccxt.binance({'enableRateLimit': True})
-# ensure symbol normalized
-ccxt_symbol = symbol
-
-# -------------------------
-# === FLASK APP + DASH HTML ===
-# -------------------------
-app = Flask(__name__, static_folder=None)
-
-DASH_HTML = """
-<!doctype html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <title>Paper Bot Dashboard — Dark</title>
-  <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-  <style>
-    :root {
-      --bg: #0b1220;
-      --panel: #0f1724;
-      --muted: #9aa6b2;
-      --accent: #19a37b;
-      --danger: #f05252;
-      --text: #e6eef6;
-    }
-    body { background:var(--bg); color:var(--text); font-family: Inter, Arial; margin:16px; }
-    .layout { display:grid; grid-template-columns: 360px 1fr 360px; gap: 16px; }
-    .panel { background:var(--panel); padding:12px; border-radius:8px; box-shadow: 0 6px 18px rgba(0,0,0,0.6); }
-    h1 { margin:0 0 8px 0; font-size:18px; }
-    .muted { color:var(--muted); font-size:13px; }
-    .kpi { display:flex; gap:8px; align-items:center; justify-content:space-between; }
-    .small { font-size:13px; color:var(--muted); }
-    table { width:100%; border-collapse: collapse; margin-top:8px; font-size:13px; }
-    th, td { padding:6px; border-bottom: 1px solid rgba(255,255,255,0.03); text-align:left; color:var(--text); }
-    .progress { height:10px; background:rgba(255,255,255,0.03); border-radius:6px; overflow:hidden; }
-    .prog-fill { height:100%; background: linear-gradient(90deg, #19a37b, #4ad9b2); }
-    .prog-fill.loss { background: linear-gradient(90deg, #f05252, #f79a9a); }
-    .marker { font-size:12px; padding:4px 8px; border-radius:6px; background:rgba(255,255,255,0.03); display:inline-block; }
-    .btn { background:transparent; border:1px solid rgba(255,255,255,0.06); padding:6px 8px; border-radius:6px; color:var(--text); cursor:pointer; }
-    .top-row { display:flex; gap:12px; align-items:center; justify-content:space-between; margin-bottom:8px; }
-    .chart-wrap { grid-column: 2 / 3; }
-  </style>
-</head>
-<body>
-  <div class="top-row">
-    <h1>📊 Paper-Trading Bot — 2h Breakout + 30m Pullback (Dark)</h1>
-    <div>
-      <span class="small">Live Price: </span>
-      <strong id="live_price">...</strong>
-      <span class="small"> USDT</span>
-    </div>
-  </div>
-
-  <div class="layout">
-    <div class="panel">
-      <h3>Kapital</h3>
-      <p class="muted">Startkapital: <strong>{{start_capital}} USDT</strong></p>
-      <p style="font-size:20px"><strong id="live_capital">...</strong> USDT</p>
-      <p class="small">Order size: {{order_size_usdt}} USDT &nbsp; Fee: {{fee_pct*100}}%</p>
-      <div style="margin-top:8px;">
-        <h4 style="margin:6px 0;">Open Trades</h4>
-        <div id="open_trades_panel">Loading...</div>
-      </div>
-      <div style="margin-top:10px;">
-        <h4 style="margin:6px 0;">Recent Activity</h4>
-        <div id="activity">Loading...</div>
-      </div>
-      <div style="margin-top:10px;">
-        <button class="btn" onclick="downloadCSV()">Export Trade History CSV</button>
-      </div>
-    </div>
-
-    <div class="panel chart-wrap">
-      <canvas id="priceChart" height="220"></canvas>
-      <div style="display:flex; gap:16px; margin-top:8px;">
-        <canvas id="rsiChart" height="80" style="flex:1"></canvas>
-        <canvas id="equityChart" height="80" style="width:240px"></canvas>
-      </div>
-      <div class="muted" style="margin-top:8px">Markers: entry=open, exit=closed. TP/SL lines shown on chart.</div>
-    </div>
-
-    <div class="panel">
-      <h4>Stats</h4>
-      <p id="stats">Loading...</p>
-      <h4 style="margin-top:10px">Trade History</h4>
-      <div style="max-height:320px; overflow:auto;">
-        <table id="hist_table">
-          <thead><tr><th>Side</th><th>Entry</th><th>Exit</th><th>PnL (USDT)</th></tr></thead>
-          <tbody id="hist_rows"></tbody>
-        </table>
-      </div>
-    </div>
-  </div>
-
-<script>
-let priceChart, rsiChart, equityChart;
-
-async function fetchState(){
-  const res = await fetch('/api/state');
-  return await res.json();
-}
-
-function formatDate(ts){
-  return new Date(ts).toLocaleString();
-}
-
-function buildOpenTradesHTML(open_trades, latest_price){
-  if(open_trades.length===0) return '<p class="small">Keine offenen Trades</p>';
-  let html = '<table><thead><tr><th>Side</th><th>Entry</th><th>Qty</th><th>Size</th><th>OpenPnL</th><th>Progress</th></tr></thead><tbody>';
-  for(const t of open_trades){
-    const pnl = t.unrealized_pnl.toFixed(2);
-    const pct = ((t.side==='long') ? ((latest_price - t.entry_price)/t.entry_price*100) : ((t.entry_price - latest_price)/t.entry_price*100));
-    // progress: map from -SL..TP to 0..100
-    const totalRange = (t.order_size>0) ? (Math.abs(pct) / ( (pct>0) ? {{profit_target}} : {{stop_loss}} )) : 0;
-    // compute progress in JS below as we don't have server-side template for dynamic numbers
-    html += `<tr>
-      <td>${t.side.toUpperCase()}</td>
-      <td>${t.entry_price.toFixed(2)}</td>
-      <td>${t.amount.toFixed(6)}</td>
-      <td>${t.order_size.toFixed(2)}</td>
-      <td>${pnl}</td>
-      <td><div class="progress"><div class="prog-fill" style="width:${Math.min(100, Math.max(0, ( ( (t.side==='long') ? ( (latest_price - t.entry_price)/t.entry_price*100 ) : ((t.entry_price - latest_price)/t.entry_price*100) ) + {{stop_loss}} ) / ({{profit_target}} + {{stop_loss}}) *100 ))}%"></div></div></td>
-    </tr>`;
-  }
-  html += '</tbody></table>';
-  return html;
-}
-
-async function updateUI(){
-  const s = await fetchState();
-  document.getElementById('live_price').textContent = s.latest_price.toFixed(2);
-  document.getElementById('live_capital').textContent = s.capital.toFixed(2);
-
-  // open trades
-  document.getElementById('open_trades_panel').innerHTML = buildOpenTradesHTML(s.open_trades, s.latest_price);
-
-  // recent activity
-  let act = '';
-  for(const a of s.activity.slice(0,8)) act += `<div class="small">${a}</div>`;
-  document.getElementById('activity').innerHTML = act || '<div class="small">No activity</div>';
-
-  // stats
-  document.getElementById('stats').innerHTML = `Closed: ${s.closed_count} | Winrate: ${s.win_rate.toFixed(2)}% | Max DD: ${s.max_dd.toFixed(2)}%`;
-
-  // history table
-  const rows = document.getElementById('hist_rows');
-  rows.innerHTML = '';
-  for(const h of s.history.slice(0,200).reverse()){
-    const exit = h.exit_time ? new Date(h.exit_time).toLocaleString() : '-';
-    rows.insertAdjacentHTML('beforeend', `<tr><td>${h.side}</td><td>${new Date(h.entry_time).toLocaleString()}</td><td>${exit}</td><td>${(h.pnl_usdt||0).toFixed(2)}</td></tr>`);
-  }
-
-  // Chart data
-  const chart = s.chart;
-  const labels = chart.map(p=> new Date(p[0]).toLocaleTimeString());
-  const prices = chart.map(p=> p[1]);
-  const ema_short = s.ema_short || [];
-  const ema_long = s.ema_long || [];
-  const rsi = s.rsi || [];
-  const markers = s.markers || [];
-
-  if(!priceChart){
-    const ctx = document.getElementById('priceChart').getContext('2d');
-    priceChart = new Chart(ctx, {
-      type: 'line',
-      data: {
-        labels: labels,
-        datasets: [
-          { label:'Price', data: prices, borderColor:'#4fc3f7', tension:0.12, pointRadius:0, borderWidth:1.5 },
-          { label:'EMA'+{{ema_short}}, data: ema_short, borderColor:'#f39c12', tension:0.12, pointRadius:0, borderWidth:1 },
-          { label:'EMA'+{{ema_long}}, data: ema_long, borderColor:'#9b59b6', tension:0.12, pointRadius:0, borderWidth:1 }
-        ]
-      },
-      options: {
-        plugins: { legend:{display:true} },
-        scales: { x:{ display:true }, y:{ display:true } }
-      }
-    });
-  } else {
-    priceChart.data.labels = labels;
-    priceChart.data.datasets[0].data = prices;
-    priceChart.data.datasets[1].data = ema_short;
-    priceChart.data.datasets[2].data = ema_long;
-    priceChart.update();
-  }
-
-  // RSI chart
-  if(!rsiChart){
-    const ctx2 = document.getElementById('rsiChart').getContext('2d');
-    rsiChart = new Chart(ctx2, {
-      type:'line',
-      data:{ labels: labels, datasets:[{ label:'RSI', data: rsi, borderColor:'#7bed9f', pointRadius:0, borderWidth:1 }] },
-      options:{ plugins:{legend:{display:false}}, scales:{ y:{min:0, max:100} } }
-    });
-  } else {
-    rsiChart.data.labels = labels;
-    rsiChart.data.datasets[0].data = rsi;
-    rsiChart.update();
-  }
-
-  // Equity (capital history)
-  const eq = s.capital_history.map(p=> p[1]);
-  const eqLabels = s.capital_history.map(p=> new Date(p[0]).toLocaleTimeString());
-  if(!equityChart){
-    const ctx3 = document.getElementById('equityChart').getContext('2d');
-    equityChart = new Chart(ctx3, {
-      type:'line',
-      data:{ labels:eqLabels, datasets:[{ label:'Equity', data:eq, borderColor:'#19a37b', pointRadius:0, borderWidth:1 }] },
-      options:{ plugins:{legend:{display:false}} }
-    });
-  } else {
-    equityChart.data.labels = eqLabels;
-    equityChart.data.datasets[0].data = eq;
-    equityChart.update();
-  }
-}
-
-async function downloadCSV(){
-  window.location = '/export/history.csv';
-}
-
-// Realtime via SSE - also triggers UI update
-const es = new EventSource('/stream');
-es.onmessage = function(e){
-  // parsed state update (we ignore payload content and just request /api/state to refresh)
-  updateUI();
-};
-
-updateUI();
-setInterval(updateUI, 15000); // fallback polling
-</script>
-</body>
-</html>
-"""
-
-# -------------------------
-# === FLASK ROUTES ===
-# -------------------------
-@app.route('/')
-def home():
-    return render_template_string(DASH_HTML,
-                                  start_capital=start_capital,
-                                  order_size_usdt=order_size_usdt,
-                                  fee_pct=fee_pct,
-                                  ema_short=ema_short,
-                                  ema_long=ema_long,
-                                  profit_target=profit_target,
-                                  stop_loss=stop_loss)
-
-@app.route('/api/state')
-def api_state():
-    # prepare open trades with unrealized pnl using latest price
-    global price_history, capital_history
-    latest_price = price_history[-1][1] if price_history else None
-
-    ot = []
-    for t in open_trades:
-        if latest_price is None:
-            unreal = 0.0
-        else:
-            unreal = (latest_price - t['entry_price']) * t['amount'] if t['side']=='long' else (t['entry_price'] - latest_price) * t['amount']
-        copyt = dict(t)
-        copyt['unrealized_pnl'] = unreal
-        ot.append(copyt)
-
-    # stats
-    closed_count = len(closed_trades)
-    wins = sum(1 for x in closed_trades if x.get('pnl_usdt',0) > 0)
-    win_rate = (wins/closed_count*100) if closed_count>0 else 0.0
-
-    # build chart payload: last N price points
-    chart_data = price_history[-chart_history_points:]
-    # compute EMA & RSI arrays server-side for last chart_history_points
-    prices = pd.Series([p[1] for p in chart_data])
-    ema_s = list(prices.ewm(span=ema_short, adjust=False).mean()) if len(prices)>0 else []
-    ema_l = list(prices.ewm(span=ema_long, adjust=False).mean()) if len(prices)>0 else []
-    # RSI
-    def compute_rsi(series, period):
-        if len(series) < period+1:
-            return [None]*len(series)
-        delta = series.diff()
-        up = delta.clip(lower=0)
-        down = -1*delta.clip(upper=0)
-        ma_up = up.rolling(period).mean()
-        ma_down = down.rolling(period).mean()
-        rs = ma_up / ma_down
-        rsi = 100 - (100 / (1+rs))
-        return rsi.fillna(50).tolist()
-    rsi_vals = compute_rsi(pd.Series([p[1] for p in chart_data]), rsi_period)
-
-    # markers
-    markers = []
-    for t in closed_trades:
-        if t.get('entry_time'):
-            markers.append({'ts': int(t['entry_time'].timestamp()*1000), 'price': t['entry_price'], 'label':'entry', 'side':t['side']})
-        if t.get('exit_time'):
-            markers.append({'ts': int(t['exit_time'].timestamp()*1000), 'price': t['exit_price'], 'label':'exit', 'side':t['side']})
-    for t in open_trades:
-        markers.append({'ts': int(t['entry_time'].timestamp()*1000), 'price': t['entry_price'], 'label':'open', 'side':t['side']})
-
-    # capital history
-    ch = capital_history[-chart_history_points:] if capital_history else []
-
-    return jsonify({
-        'capital': capital,
-        'open_trades': ot,
-        'closed_count': closed_count,
-        'win_rate': win_rate,
-        'max_dd': 0.0,
-        'chart': chart_data,
-        'ema_short': [None if x is None else float(x) for x in ema_s],
-        'ema_long': [None if x is None else float(x) for x in ema_l],
-        'rsi': [None if x is None else float(x) for x in rsi_vals],
-        'markers': markers,
-        'latest_price': price_history[-1][1] if price_history else None,
-        'history': closed_trades,
-        'activity': [ f"{(t.get('side',''))} {t.get('entry_price',0):.2f} -> {t.get('close_reason','')}" for t in closed_trades[-20:] ],
-        'capital_history': ch
-    })
-
-@app.route('/export/history.csv')
-def export_history():
-    si = StringIO()
-    df = pd.DataFrame(closed_trades)
-    if df.empty:
-        si.write("No trades\n")
-    else:
-        # ensure datetimes serializable
-        df2 = df.copy()
-        if 'entry_time' in df2.columns:
-            df2['entry_time'] = df2['entry_time'].astype(str)
-        if 'exit_time' in df2.columns:
-            df2['exit_time'] = df2['exit_time'].astype(str)
-        df2.to_csv(si, index=False)
-    output = si.getvalue()
-    return Response(output, mimetype="text/csv", headers={"Content-disposition":"attachment; filename=trade_history.csv"})
-
-@app.route('/stream')
-def stream():
-    def event_stream():
-        while True:
-            # send a small heartbeat with timestamp (frontend will pull /api/state)
-            yield f"data: {json.dumps({'ts': int(time.time()*1000)})}\n\n"
-            time.sleep(5)
-    return Response(event_stream(), mimetype="text/event-stream")
-
-# -------------------------
-# === STRATEGY HELPERS ===
-# -------------------------
-def fetch_ohlcv_ccxt(timeframe='2h', limit=200):
-    try:
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    except Exception as e:
-        print("fetch_ohlcv error:", e)
-        return pd.DataFrame(columns=['timestamp','open','high','low','close','volume']).set_index('timestamp')
-    df = pd.DataFrame(ohlcv, columns=['timestamp','open','high','low','close','volume'])
-    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-    df.set_index('timestamp', inplace=True)
-    return df
-
-def try_enter_from_2h_breakout(df_2h, df_30m, t_trigger_pct, t_fee):
-    new_trades = []
-    if len(df_2h) < 2:
-        return new_trades
-
-    current_price_2h = float(df_2h['close'].iloc[-1])
-    lowest_2h = float(df_2h['low'][:-1].min())
-    highest_2h = float(df_2h['high'][:-1].max())
-
-    change_up = (current_price_2h - lowest_2h) / lowest_2h * 100 if lowest_2h > 0 else 0
-    change_down = (current_price_2h - highest_2h) / highest_2h * 100 if highest_2h > 0 else 0
-
-    signal = None
-    if change_up >= t_trigger_pct:
-        signal = 'long'
-    elif change_down <= -t_trigger_pct:
-        signal = 'short'
-    if not signal: return new_trades
-
-    start_time = df_2h.index[-2]
-    end_time = df_2h.index[-1]
-    df30_window = df_30m[(df_30m.index > start_time) & (df_30m.index <= end_time)]
-    if df30_window.empty: return new_trades
-
-    for ts, row in df30_window.iterrows():
-        price_30m = float(row['close'])
-        # check capital sufficiency and order size will be enforced by caller
-        if signal == 'long' and price_30m <= current_price_2h:
-            entry_price = price_30m * (1 + t_fee)
-            qty = order_size_usdt / entry_price
-            trade = {
-                'side': 'long',
-                'entry_price': entry_price,
-                'entry_time': ts.to_pydatetime(),
-                'amount': qty,
-                'order_size': order_size_usdt,
-                'status': 'open'
-            }
-            new_trades.append(trade)
-            break
-        elif signal == 'short' and price_30m >= current_price_2h:
-            entry_price = price_30m * (1 - t_fee)
-            qty = order_size_usdt / entry_price
-            trade = {
-                'side': 'short',
-                'entry_price': entry_price,
-                'entry_time': ts.to_pydatetime(),
-                'amount': qty,
-                'order_size': order_size_usdt,
-                'status': 'open'
-            }
-            new_trades.append(trade)
-            break
-    return new_trades
-
-def evaluate_and_close_trades(df_2h, t_fee, t_tp, t_sl):
-    global open_trades, closed_trades, capital, capital_history
-    if len(df_2h) == 0:
-        return
-    current_price_2h = float(df_2h['close'].iloc[-1])
-    to_close = []
-    for t in list(open_trades):
-        if t['side'] == 'long':
-            pnl_pct = (current_price_2h - t['entry_price']) / t['entry_price'] * 100
-        else:
-            pnl_pct = (t['entry_price'] - current_price_2h) / t['entry_price'] * 100
-        reason = None
-        if pnl_pct >= t_tp:
-            reason = 'TP'
-        elif pnl_pct <= -t_sl:
-            reason = 'SL'
-        if reason:
-            exit_price = current_price_2h * (1 - t_fee if t['side']=='long' else 1 + t_fee)
-            if t['side']=='long':
-                pnl_usdt = (exit_price - t['entry_price']) * t['order_size'] / t['entry_price']
-            else:
-                pnl_usdt = (t['entry_price'] - exit_price) * t['order_size'] / t['entry_price']
-            t_closed = dict(t)
-            t_closed.update({'exit_price': exit_price, 'exit_time': df_2h.index[-1].to_pydatetime(), 'close_reason': reason, 'pnl_usdt': pnl_usdt})
-            closed_trades.append(t_closed)
-            capital += pnl_usdt
-            capital_history.append([int(time.time()*1000), capital])
-            to_close.append(t)
-            # notify telegram
-            send_telegram_message(f"Exit {t['side'].upper()} {reason} | Entry: {t['entry_price']:.2f} Exit: {exit_price:.2f} PnL: {pnl_usdt:.2f} USDT")
-    for t in to_close:
-        if t in open_trades:
-            open_trades.remove(t)
-
-# -------------------------
-# === MAIN PAPER-TRADING LOOP ===
-# -------------------------
-def run_live_paper_bot():
-    global open_trades, closed_trades, price_history, capital, capital_history, last_status_update
-
-    print("Starting live paper bot loop (Binance public data) — strategy exact")
-    send_telegram_message("Paper bot started (paper mode) — strategy active.") if TELEGRAM_TOKEN else None
-
-    while True:
-        try:
-            df_2h = fetch_ohlcv_ccxt('2h', limit=fetch_limit_2h)
-            df_30m = fetch_ohlcv_ccxt('30m', limit=fetch_limit_30m)
-
-            # get latest price from ticker (more granular)
-            try:
-                ticker = exchange.fetch_ticker(symbol)
-                latest_price = float(ticker['last'])
-                ts_ms = int(time.time()*1000)
-            except Exception:
-                if not df_30m.empty:
-                    latest_price = float(df_30m['close'].iloc[-1])
-                    ts_ms = int(df_30m.index[-1].timestamp()*1000)
-                else:
-                    time.sleep(loop_sleep); continue
-
-            price_history.append([ts_ms, latest_price])
-            if len(price_history) > 2000:
-                price_history = price_history[-2000:]
-
-            # 1) entries
-            new_candidates = try_enter_from_2h_breakout(df_2h, df_30m, trigger_pct, fee_pct)
-            for c in new_candidates:
-                # check capital sufficiency
-                if capital < order_size_usdt - 1e-9:
-                    print("Insufficient capital for order_size_usdt, skipping entry.")
-                    continue
-                side = c['side']
-                open_side_count = sum(1 for t in open_trades if t['side']==side)
-                if open_side_count < max_open_per_side:
-                    # open trade (paper)
-                    open_trades.append(c)
-                    send_telegram_message(f"OPEN {c['side'].upper()} Entry: {c['entry_price']:.2f} | Size: {c['order_size']:.2f} USDT")
-                    # capital remains until close (we don't deduct margin here; paper logic)
-                else:
-                    print(f"Pyramiding limit reached for {side}, skip.")
-
-            # 2) evaluate and close
-            evaluate_and_close_trades(df_2h, fee_pct, profit_target, stop_loss)
-
-            # periodic status
-            now = datetime.now(timezone.utc)
-            if (now - last_status_update).total_seconds() >= 15*60:
-                print(f"[STATUS {now.isoformat()}] Capital: {capital:.2f} | Open trades: {len(open_trades)} | Closed trades: {len(closed_trades)}")
-                last_status_update = now
-
-            time.sleep(loop_sleep)
-        except Exception as e:
-            print("ERROR main loop:", e)
-            time.sleep(5)
-
-# -------------------------
-# === START THREAD + APP ===
-# -------------------------
-if __name__ == '__main__':
-    # ensure initial capital history
-    capital_history.append([int(time.time()*1000), capital])
-
-    t = threading.Thread(target=run_live_paper_bot, daemon=True)
-    t.start()
-
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host='0.0.0.0', port=port, threaded=True)
+# paper_bot_live_full.py
+# Paper-Trading Bot + Dashboard (Dark Mode, Live Chart, EMA, RSI, Entries/Exits, SSE realtime)
+#
+# Usage: python paper_bot_live_full.py
+#        python paper_bot_live_full.py replay --days 30 --speed 0 [--data candle_data/] [--no-server]
+#        python paper_bot_live_full.py backtest --since 2021-01-01 [--until 2024-01-01] [--out trades.csv]
+#        python paper_bot_live_full.py sweep --since 2023-01-01 --trigger 1:3:0.25 --tp 4,6,8,10 --sl 1,2,3
+#        SERVER_MODE=gevent python paper_bot_live_full.py sse-loadtest --clients 100,1000,5000
+#        python paper_bot_live_full.py state-stress --readers 1,4,16,64 --rate 5
+#        python paper_bot_live_full.py journal-bench --trades 50000 --kills 5
+#        python paper_bot_live_full.py notify-bench --ticks 20 --burst 12 --latency 0.5
+#        python paper_bot_live_full.py exchange-bench --latency 0.2 --fail-rate 0.2   (--serve: fake Binance for EXCHANGE_API=...)
+#        python paper_bot_live_full.py bench --out bench.json [--compare baseline.json]
+#        python paper_bot_live_full.py candles-verify [--fixtures fixtures/ | --synthetic]   (record them with: bench --record fixtures/)
+# Requirements: pip install ccxt flask pandas numpy requests
+
+import os
+
+# SERVER_MODE=gevent serves the dashboard from greenlets (thousands of idle SSE clients
+# without thousands of threads); patching has to happen before anything else is imported
+SERVER_MODE = os.environ.get("SERVER_MODE", "threaded")
+if SERVER_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import time
+import heapq
+import random
+import queue
+import asyncio
+import argparse
+import atexit
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import threading
+import json
+import hashlib
+import shutil
+import platform
+import subprocess
+import sys
+import bisect
+import math
+import ipaddress
+import contextlib
+import traceback
+import zipfile
+import http.server
+import urllib.parse
+import zlib
+import tempfile
+from datetime import datetime, timezone
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import ccxt
+import pandas as pd
+import numpy as np
+import requests
+from flask import Flask, jsonify, render_template_string, Response, request, abort
+
+# -------------------------
+# === USER CONFIG ===
+# -------------------------
+# Telegram (put your token & chat id here)
+TELEGRAM_TOKEN = ""   # <-- set your telegram bot token or leave empty to disable telegram
+TELEGRAM_CHAT_ID = "" # <-- set chat id
+TELEGRAM_API = os.environ.get("TELEGRAM_API", "https://api.telegram.org")
+telegram_queue_size = 256      # pending notifications; beyond that new ones are dropped (and counted)
+telegram_max_rps = 1.0         # messages per second to the Telegram API (token bucket)
+telegram_burst = 3
+telegram_coalesce = 0.5        # seconds to collect a burst of events into one digest message
+
+# Trading config (paper trading)
+order_size_usdt = 10.0         # fixed per-trade size (paper trading)
+start_capital = 100.0          # starting capital
+fee_pct = 0.0004               # 0.04% per trade (as in your backtest)
+trigger_pct = 1.5              # breakout threshold (%) 
+profit_target = 10.0           # TP (%) from entry (in percent)
+stop_loss = 3.0                # SL (%) from entry
+max_open_per_side = 12         # pyramiding limit per side
+symbol = "BTC/USDT"            # market symbol used (default / first in the dashboard)
+symbols = [x.strip() for x in os.environ.get("SYMBOLS", symbol).split(',') if x.strip()]  # e.g. SYMBOLS=BTC/USDT,ETH/USDT
+exchange_max_rps = 10          # global request budget shared by all symbols (token bucket)
+exchange_burst = 20
+fetch_workers = 8              # pooled threads (and HTTP connections) for concurrent exchange requests
+exchange_retries = 4           # retries of a failed request (timeouts, 5xx, 429) with jittered exponential backoff
+exchange_backoff = 0.25        # seconds, first backoff; doubles per retry up to exchange_backoff_max
+exchange_backoff_max = 8.0
+exchange_breaker_threshold = 5 # consecutive failed requests that open the circuit breaker
+exchange_breaker_cooldown = 30.0  # seconds requests fail fast before one trial request is let through
+EXCHANGE_API = os.environ.get("EXCHANGE_API")  # e.g. http://127.0.0.1:8800 from `exchange-bench --serve`, default: Binance
+tick_feed_mode = os.environ.get("TICK_FEED", "auto")  # TP/SL on every trade: auto/ws (websocket, poll fallback) | poll | off
+tick_poll_interval = 2.0       # seconds between ticker polls when no websocket feed is available
+fetch_limit_2h = 200
+fetch_limit_30m = 400
+loop_sleep = 60                # main loop sleep (seconds)
+chart_history_points = 300
+history_rows = 200             # closed trades shipped with /api/state, older ones via /api/trades
+analytics_window = 100         # capital changes in the rolling Sharpe/Sortino window
+sse_queue_size = 64            # buffered SSE frames per client before it counts as stalled
+sse_keepalive = 15             # seconds between keep-alive comments on an idle stream
+price_history_max = 2000       # raw price / equity points kept in memory
+history_tiers = (('1m', 60_000, 2 * 1440), ('1h', 3_600_000, 24 * 120), ('1d', 86_400_000, 3650))  # OHLC bars kept behind them
+history_max_points = 5000      # upper bound of the /api/history point budget
+profiler_interval = 0.01       # seconds between stack samples while /debug/profiler is running
+profiler_min_interval = 0.001  # floor for ?interval=, sampling faster than this starves the bot threads
+profiler_remote = os.environ.get("PROFILER_REMOTE") == "1"  # /debug/profiler answers loopback clients only unless set
+candle_store_dir = "candle_data"  # local OHLCV cache, only new candles are fetched per loop
+fixtures_dir = "fixtures"      # recorded exchange responses (bench --record) used by bench and candles-verify
+candle_base_timeframe = "30m"  # only this timeframe is fetched; 2h bars + latest price are derived from it
+aggregate_candles = True       # False: fetch 2h, 30m and the ticker separately (3 requests per symbol)
+shadow_grid = os.environ.get("SHADOW_GRID", "")  # e.g. "trigger=1:3:0.25;tp=4,6,8,10;sl=1,2,3": paper-trade every combination alongside
+journal_dir = "journal_data"   # write-ahead trade journal + snapshots, replayed on startup
+journal_fsync_interval = 0.2   # seconds: journal records are written + fsynced in batches
+journal_snapshot_every = 2000  # journal records per symbol before a compact snapshot is written
+
+# EMAs / RSI config
+ema_short = 50
+ema_long = 200
+rsi_period = 14
+
+# -------------------------
+# === STREAMING INDICATORS ===
+# -------------------------
+# EMA short/long + RSI updated in O(1) per appended price (same definitions as
+# pandas ewm(span, adjust=False) and the rolling-mean RSI). Values live in preallocated
+# arrays of 2x capacity; when the write position reaches the end the last `capacity`
+# points are moved to the front, so tail() is always a contiguous slice.
+
+class IndicatorEngine:
+    def __init__(self, capacity=price_history_max, span_short=ema_short, span_long=ema_long, period=rsi_period):
+        self.capacity = capacity
+        self.alpha_s = 2.0 / (span_short + 1)
+        self.alpha_l = 2.0 / (span_long + 1)
+        self.period = period
+        size = 2 * capacity
+        self.ts = np.zeros(size, dtype=np.int64)
+        self.price = np.zeros(size, dtype=np.float64)
+        self.ema_s = np.zeros(size, dtype=np.float64)
+        self.ema_l = np.zeros(size, dtype=np.float64)
+        self.rsi = np.full(size, np.nan, dtype=np.float64)
+        self._pos = 0
+        self.count = 0                              # total prices seen
+        self._ups = np.zeros(period, dtype=np.float64)
+        self._downs = np.zeros(period, dtype=np.float64)
+        self._sum_up = 0.0
+        self._sum_down = 0.0
+
+    def update(self, ts_ms, price):
+        if self._pos == len(self.price):
+            keep = self.capacity
+            for arr in (self.ts, self.price, self.ema_s, self.ema_l, self.rsi):
+                arr[:keep] = arr[self._pos - keep:self._pos]
+            self._pos = keep
+        i = self._pos
+        self.ts[i] = ts_ms
+        self.price[i] = price
+        self.rsi[i] = np.nan
+        if self.count == 0:
+            self.ema_s[i] = price
+            self.ema_l[i] = price
+        else:
+            prev = self.price[i - 1]
+            self.ema_s[i] = self.ema_s[i - 1] + self.alpha_s * (price - self.ema_s[i - 1])
+            self.ema_l[i] = self.ema_l[i - 1] + self.alpha_l * (price - self.ema_l[i - 1])
+            # rolling mean of gains/losses over the last `period` deltas
+            k = (self.count - 1) % self.period
+            delta = price - prev
+            up, down = max(delta, 0.0), max(-delta, 0.0)
+            self._sum_up += up - self._ups[k]
+            self._sum_down += down - self._downs[k]
+            self._ups[k], self._downs[k] = up, down
+            if k == self.period - 1:
+                # re-sum once per window to keep the running sums from drifting
+                self._sum_up, self._sum_down = float(self._ups.sum()), float(self._downs.sum())
+            if self.count >= self.period:
+                ma_up, ma_down = self._sum_up / self.period, self._sum_down / self.period
+                if ma_down > 0:
+                    self.rsi[i] = 100 - (100 / (1 + ma_up / ma_down))
+                elif ma_up > 0:
+                    self.rsi[i] = 100.0
+        self._pos += 1
+        self.count += 1
+
+    def tail(self, n):
+        start = max(0, self._pos - min(n, self.count, self.capacity))
+        return (self.ts[start:self._pos], self.price[start:self._pos], self.ema_s[start:self._pos],
+                self.ema_l[start:self._pos], self.rsi[start:self._pos])
+
+# -------------------------
+# === HISTORY TIERS ===
+# -------------------------
+# Price and equity history in constant memory: the newest raw points plus 1m/1h/1d OHLC
+# bars, each tier a fixed-size ring (same 2x-array layout as the indicator engine, so the
+# retained rows are always one contiguous slice). range() answers a time range from the
+# finest tier that still reaches back far enough and thins it to a point budget: LTTB for
+# the line, merged bars for the OHLC.
+
+class RingBuffer:
+    def __init__(self, capacity, width):
+        self.capacity = capacity
+        self._buf = np.zeros((2 * capacity, width), dtype=np.float64)
+        self._pos = 0
+        self.count = 0          # rows ever appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, row):
+        if self._pos == len(self._buf):
+            self._buf[:self.capacity] = self._buf[self._pos - self.capacity:self._pos]
+            self._pos = self.capacity
+        self._buf[self._pos] = row
+        self._pos += 1
+        self.count += 1
+
+    @property
+    def last(self):
+        # writable view of the newest row
+        return self._buf[self._pos - 1] if self._pos else None
+
+    def view(self):
+        return self._buf[self._pos - len(self):self._pos]
+
+    def load(self, rows, count):
+        rows = rows[-self.capacity:]
+        self._buf[:len(rows)] = rows
+        self._pos = len(rows)
+        self.count = max(int(count), len(rows))
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape.
+    # First and last point stay; per bucket the point spanning the largest triangle with the
+    # previous pick and the next bucket's mean is kept.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+class TieredSeries:
+    def __init__(self, raw_points=price_history_max, tiers=history_tiers):
+        self.raw = RingBuffer(raw_points, 2)                                  # ts, value
+        self.tiers = [(name, ms, RingBuffer(n, 5)) for name, ms, n in tiers]  # bucket start, o, h, l, c
+        self._cur = [None] * len(self.tiers)
+
+    def __len__(self):
+        # points ever appended (a running counter for delta publishing)
+        return self.raw.count
+
+    def append(self, ts_ms, value):
+        self.raw.append((ts_ms, value))
+        for i, (_, ms, ring) in enumerate(self.tiers):
+            bucket = ts_ms - ts_ms % ms
+            cur = self._cur[i]          # [bucket, high, low] of the newest bar, mirrored in Python
+            if cur is not None and bucket <= cur[0]:
+                # same bar (a slightly late point from the other feed is folded into the newest bar)
+                if value > cur[1]:
+                    cur[1] = value
+                if value < cur[2]:
+                    cur[2] = value
+                ring.last[2:] = (cur[1], cur[2], value)
+            else:
+                ring.append((bucket, value, value, value, value))
+                self._cur[i] = [bucket, value, value]
+
+    @property
+    def last(self):
+        row = self.raw.last
+        return None if row is None else (int(row[0]), float(row[1]))
+
+    def tail(self, n):
+        rows = self.raw.view()[len(self.raw) - min(n, len(self.raw)):]
+        return rows[:, 0].astype(np.int64), rows[:, 1]
+
+    def points(self, n):
+        # newest n raw points as [[ts, value], ...] for JSON
+        ts, v = self.tail(n)
+        return [list(p) for p in zip(ts.tolist(), v.tolist())]
+
+    def frozen(self):
+        # read-only copy of the retained rows (published state snapshots)
+        twin = TieredSeries.__new__(TieredSeries)
+        def copy(ring):
+            c = RingBuffer.__new__(RingBuffer)
+            c.capacity, c.count = ring.capacity, ring.count
+            c._buf = ring.view().copy()
+            c._pos = len(c._buf)
+            return c
+        twin.raw = copy(self.raw)
+        twin.tiers = [(name, ms, copy(ring)) for name, ms, ring in self.tiers]
+        twin._cur = None
+        return twin
+
+    def state(self):
+        # copies of the retained rows per tier + counters (journal snapshots)
+        rings = [('raw', self.raw)] + [(name, ring) for name, _, ring in self.tiers]
+        out = {name: ring.view().copy() for name, ring in rings}
+        out['counts'] = np.array([ring.count for _, ring in rings], dtype=np.int64)
+        return out
+
+    def load(self, state):
+        rings = [('raw', self.raw)] + [(name, ring) for name, _, ring in self.tiers]
+        for (name, ring), count in zip(rings, state['counts']):
+            if name in state:
+                ring.load(np.asarray(state[name], dtype=np.float64), count)
+        self._cur = [None if ring.last is None else [float(ring.last[0]), float(ring.last[2]), float(ring.last[3])]
+                     for _, _, ring in self.tiers]
+
+    def range(self, start_ms=None, end_ms=None, points=500):
+        # finest tier that never dropped a row or whose oldest row is not after start_ms,
+        # else the coarsest one
+        rings = [('raw', 1, self.raw)] + self.tiers
+        for name, width, ring in rings:
+            rows = ring.view()
+            if ring.count <= ring.capacity or (start_ms is not None and len(rows) and rows[0, 0] <= start_ms):
+                break
+        ts = rows[:, 0]
+        lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms - width + 1))
+        hi = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, side='right'))
+        rows = rows[lo:hi]
+        if name == 'raw':
+            o = h = l = c = rows[:, 1]
+        else:
+            o, h, l, c = rows[:, 1], rows[:, 2], rows[:, 3], rows[:, 4]
+        ts = rows[:, 0].astype(np.int64)
+        keep = lttb(ts, c, points)
+        line = [list(p) for p in zip(ts[keep].tolist(), c[keep].tolist())]
+        ohlc = []
+        if len(rows):
+            group = -(-len(rows) // points)
+            starts = np.arange(0, len(rows), group)
+            ends = np.minimum(starts + group, len(rows)) - 1
+            ohlc = [list(b) for b in zip(ts[starts].tolist(), o[starts].tolist(), np.maximum.reduceat(h, starts).tolist(),
+                                         np.minimum.reduceat(l, starts).tolist(), c[ends].tolist())]
+        return {'resolution': name, 'count': len(rows), 'line': line, 'ohlc': ohlc}
+
+# -------------------------
+# === POSITION BOOK ===
+# -------------------------
+# Open positions indexed by their TP/SL trigger prices: one heap per (side, reason),
+# min-heap where a rising price triggers (long TP, short SL) and max-heap where a falling
+# price triggers (long SL, short TP). pop_crossed(price) only touches the positions the
+# price actually crossed -> O(log n + k) instead of scanning every open trade.
+# Removed positions are dropped from the heaps lazily; per-side counts are maintained.
+
+class PositionBook:
+    # +1: triggers when price >= level, -1: triggers when price <= level (stored negated)
+    HEAPS = {('long', 'TP'): 1, ('long', 'SL'): -1, ('short', 'TP'): -1, ('short', 'SL'): 1}
+
+    def __init__(self, t_tp=profit_target, t_sl=stop_loss):
+        self.t_tp = t_tp
+        self.t_sl = t_sl
+        self.trades = {}                   # id -> trade, in open order
+        self.counts = {'long': 0, 'short': 0}
+        self._heaps = {key: [] for key in self.HEAPS}
+        self._stale = 0
+
+    def __len__(self):
+        return len(self.trades)
+
+    def __iter__(self):
+        return iter(list(self.trades.values()))
+
+    def count(self, side):
+        return self.counts[side]
+
+    def newer_than(self, tid):
+        # trades opened after trade id `tid` (ids grow with every open)
+        out = []
+        for t in reversed(self.trades.values()):
+            if t['id'] <= tid:
+                break
+            out.append(t)
+        return out[::-1]
+
+    def _levels(self, t):
+        e = t['entry_price']
+        if t['side'] == 'long':
+            return {'TP': e * (1 + self.t_tp / 100), 'SL': e * (1 - self.t_sl / 100)}
+        return {'TP': e * (1 - self.t_tp / 100), 'SL': e * (1 + self.t_sl / 100)}
+
+    def _push(self, t):
+        for reason, level in self._levels(t).items():
+            key = (t['side'], reason)
+            heapq.heappush(self._heaps[key], (level * self.HEAPS[key], t['id']))
+
+    def _rebuild(self):
+        self._heaps = {key: [] for key in self.HEAPS}
+        for t in self.trades.values():
+            self._push(t)
+        self._stale = 0
+
+    def add(self, t):
+        self.trades[t['id']] = t
+        self.counts[t['side']] += 1
+        self._push(t)
+
+    def remove(self, tid, popped=0):
+        # popped: heap entries of this trade already taken off by pop_crossed
+        t = self.trades.pop(tid, None)
+        if t is not None:
+            self.counts[t['side']] -= 1
+            self._stale += 2 - popped
+            if self._stale > 2 * len(self.trades) + 64:
+                self._rebuild()
+        return t
+
+    def pop_crossed(self, price, t_tp, t_sl):
+        # returns [(trade, 'TP'|'SL')] in open order and removes them from the book
+        if (t_tp, t_sl) != (self.t_tp, self.t_sl):
+            self.t_tp, self.t_sl = t_tp, t_sl
+            self._rebuild()
+        slack = abs(price) * 1e-12
+        hits = []
+        for key, sign in self.HEAPS.items():
+            side, reason = key
+            heap = self._heaps[key]
+            retry = []
+            while heap:
+                k, tid = heap[0]
+                level = k * sign
+                if (sign > 0 and level > price + slack) or (sign < 0 and level < price - slack):
+                    break
+                heapq.heappop(heap)
+                t = self.trades.get(tid)
+                if t is None:
+                    self._stale -= 1
+                    continue
+                # confirm with the exact pnl_pct rule so rounding at the level can't change outcomes
+                e = t['entry_price']
+                pnl_pct = (price - e) / e * 100 if side == 'long' else (e - price) / e * 100
+                if (pnl_pct >= t_tp) if reason == 'TP' else (pnl_pct <= -t_sl):
+                    hits.append((t, reason))
+                else:
+                    retry.append((k, tid))
+            for item in retry:
+                heapq.heappush(heap, item)
+        hits.sort(key=lambda h: h[0]['id'])
+        for t, _ in hits:
+            self.remove(t['id'], popped=1)
+        return hits
+
+# -------------------------
+# === TRADE LEDGER ===
+# -------------------------
+# Closed trades as fixed-size chunks of a structured NumPy array (epoch-ms timestamps,
+# side/reason as small ints). Chunks are never reallocated, so appending stays O(1) and
+# a reader holding a chunk is never invalidated. Queries and exports work column-wise.
+
+SIDE_LONG = 1
+SIDE_SHORT = -1
+SIDE_CODES = {'long': SIDE_LONG, 'short': SIDE_SHORT}
+SIDE_NAMES = {SIDE_LONG: 'long', SIDE_SHORT: 'short'}
+REASON_CODES = {'TP': 1, 'SL': 2}
+REASON_NAMES = {v: k for k, v in REASON_CODES.items()}
+
+LEDGER_DTYPE = np.dtype([
+    ('id', 'i8'), ('side', 'i1'), ('reason', 'i1'),
+    ('entry_time', 'i8'), ('exit_time', 'i8'),
+    ('entry_price', 'f8'), ('exit_price', 'f8'),
+    ('amount', 'f8'), ('order_size', 'f8'), ('pnl_usdt', 'f8'),
+])
+
+def _dt_to_ms(dt):
+    return int(dt.timestamp()*1000)
+
+class TradeLedger:
+    def __init__(self, chunk_size=4096):
+        self.chunk_size = chunk_size
+        self._chunks = []
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def append(self, t):
+        i = self._n % self.chunk_size
+        if i == 0:
+            self._chunks.append(np.zeros(self.chunk_size, dtype=LEDGER_DTYPE))
+        self._chunks[-1][i] = (t.get('id', 0), SIDE_CODES[t['side']], REASON_CODES[t['close_reason']],
+                               _dt_to_ms(t['entry_time']), _dt_to_ms(t['exit_time']),
+                               t['entry_price'], t['exit_price'], t['amount'], t['order_size'], t['pnl_usdt'])
+        self._n += 1
+
+    def extend(self, rows):
+        # bulk append of LEDGER_DTYPE rows (snapshot restore)
+        pos = 0
+        while pos < len(rows):
+            i = self._n % self.chunk_size
+            if i == 0:
+                self._chunks.append(np.zeros(self.chunk_size, dtype=LEDGER_DTYPE))
+            k = min(self.chunk_size - i, len(rows) - pos)
+            self._chunks[-1][i:i + k] = rows[pos:pos + k]
+            self._n += k
+            pos += k
+
+    def _chunk_views(self, n=None):
+        # (global offset, filled part of chunk) for the first n rows
+        n = self._n if n is None else n
+        for ci, chunk in enumerate(self._chunks):
+            start = ci * self.chunk_size
+            if start >= n:
+                break
+            yield start, chunk[:min(self.chunk_size, n - start)]
+
+    def rows(self, start=0, stop=None):
+        stop = self._n if stop is None else min(stop, self._n)
+        parts = [c[max(0, start - off):stop - off] for off, c in self._chunk_views(stop) if off + len(c) > start]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=LEDGER_DTYPE)
+
+    def column(self, name):
+        return self.rows()[name]
+
+    @staticmethod
+    def _mask(rows, start_ms, end_ms, side):
+        mask = np.ones(len(rows), dtype=bool)
+        if start_ms is not None:
+            mask &= rows['exit_time'] >= start_ms
+        if end_ms is not None:
+            mask &= rows['exit_time'] <= end_ms
+        if side is not None:
+            mask &= rows['side'] == SIDE_CODES[side]
+        return mask
+
+    def views(self):
+        # filled rows are never rewritten, so these views stay valid after the lock is released
+        return [rows for _, rows in self._chunk_views()]
+
+    @staticmethod
+    def scan(views, start_ms=None, end_ms=None, side=None):
+        # oldest-first matching rows, one chunk at a time
+        for rows in views:
+            mask = TradeLedger._mask(rows, start_ms, end_ms, side)
+            if mask.all():
+                yield rows
+            elif mask.any():
+                yield rows[mask]
+
+    def query(self, start_ms=None, end_ms=None, side=None, offset=0, limit=100, newest_first=True):
+        # filter on exit time / side, page through the matches; returns (total matches, rows)
+        return TradeLedger.page(self.views(), start_ms, end_ms, side, offset, limit, newest_first)
+
+    @staticmethod
+    def position(views, trade_id):
+        # ledger index of closed trade `trade_id` (rows are in close order), None if it isn't there
+        base = 0
+        for rows in views:
+            hit = np.flatnonzero(rows['id'] == trade_id)
+            if len(hit):
+                return base + int(hit[0])
+            base += len(rows)
+        return None
+
+    @staticmethod
+    def page(views, start_ms=None, end_ms=None, side=None, offset=0, limit=100, newest_first=True, before=None):
+        # before: only rows ahead of that ledger index, a cursor that stays put while new trades close
+        if before is not None:
+            cut, left = [], before
+            for rows in views:
+                if left <= 0:
+                    break
+                cut.append(rows[:left])
+                left -= len(rows)
+            views = cut
+        views = views[::-1] if newest_first else views
+        total, picked = 0, []
+        for rows in views:
+            idx = np.flatnonzero(TradeLedger._mask(rows, start_ms, end_ms, side))
+            if newest_first:
+                idx = idx[::-1]
+            lo, hi = max(0, offset - total), min(len(idx), offset + limit - total)
+            if lo < hi:
+                picked.append(rows[idx[lo:hi]])
+            total += len(idx)
+        return total, (np.concatenate(picked) if picked else np.zeros(0, dtype=LEDGER_DTYPE))
+
+    @staticmethod
+    def markers(views, since_ms):
+        # entry/exit marker columns for trades that closed inside the chart window
+        rows = TradeLedger.page(views, start_ms=since_ms, limit=sum(map(len, views)), newest_first=False)[1]
+        return {'entry_ts': rows['entry_time'].tolist(), 'entry_price': rows['entry_price'].tolist(),
+                'exit_ts': rows['exit_time'].tolist(), 'exit_price': rows['exit_price'].tolist(),
+                'side': [SIDE_NAMES[x] for x in rows['side'].tolist()]}
+
+    @staticmethod
+    def to_dicts(rows):
+        cols = {name: rows[name].tolist() for name in LEDGER_DTYPE.names}
+        return [{
+            'id': cols['id'][i],
+            'side': SIDE_NAMES[cols['side'][i]],
+            'entry_price': cols['entry_price'][i],
+            'entry_time': cols['entry_time'][i],
+            'amount': cols['amount'][i],
+            'order_size': cols['order_size'][i],
+            'exit_price': cols['exit_price'][i],
+            'exit_time': cols['exit_time'][i],
+            'close_reason': REASON_NAMES[cols['reason'][i]],
+            'pnl_usdt': cols['pnl_usdt'][i],
+        } for i in range(len(rows))]
+
+# -------------------------
+# === PORTFOLIO ANALYTICS ===
+# -------------------------
+# Running stats, updated in O(1) per event instead of rescanning the ledger per request:
+# on_open/on_close/on_capital are called by the trading code, summary() is what the
+# dashboard, /api/stats and the SSE deltas serve. Sharpe/Sortino are per capital change
+# (not annualized) over the last `window` changes, kept as running sums that are re-summed
+# from the window once per `window` changes (as in IndicatorEngine) so rounding can't pile up.
+
+class PortfolioAnalytics:
+    def __init__(self, window=analytics_window):
+        self.closed = 0
+        self.wins = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.streak = 0                    # >0 wins in a row, <0 losses in a row
+        self.max_win_streak = 0
+        self.max_loss_streak = 0
+        self.side = {side: {'closed': 0, 'wins': 0, 'pnl': 0.0, 'open': 0, 'exposure': 0.0} for side in ('long', 'short')}
+        self.peak = None
+        self.drawdown = 0.0
+        self.max_dd = 0.0
+        self.last_capital = None
+        self._returns = deque(maxlen=window)
+        self._sum = 0.0
+        self._sumsq = 0.0
+        self._downsq = 0.0
+        self._updates = 0
+
+    def on_open(self, t):
+        st = self.side[t['side']]
+        st['open'] += 1
+        st['exposure'] += t['order_size']
+
+    def on_close(self, t, pnl):
+        st = self.side[t['side']]
+        st['open'] -= 1
+        st['exposure'] -= t['order_size']
+        st['closed'] += 1
+        st['pnl'] += pnl
+        self.closed += 1
+        if pnl > 0:
+            self.wins += 1
+            st['wins'] += 1
+            self.gross_profit += pnl
+            self.streak = self.streak + 1 if self.streak > 0 else 1
+            self.max_win_streak = max(self.max_win_streak, self.streak)
+        else:
+            self.gross_loss -= pnl
+            self.streak = self.streak - 1 if self.streak < 0 else -1
+            self.max_loss_streak = max(self.max_loss_streak, -self.streak)
+
+    def on_capital(self, cap):
+        if self.peak is None or cap > self.peak:
+            self.peak = cap
+        self.drawdown = (self.peak - cap) / self.peak * 100 if self.peak > 0 else 0.0
+        self.max_dd = max(self.max_dd, self.drawdown)
+        if self.last_capital:
+            r = cap / self.last_capital - 1
+            if len(self._returns) == self._returns.maxlen:
+                old = self._returns[0]
+                self._sum -= old
+                self._sumsq -= old * old
+                self._downsq -= min(old, 0.0) ** 2
+            self._returns.append(r)
+            self._sum += r
+            self._sumsq += r * r
+            self._downsq += min(r, 0.0) ** 2
+            self._updates += 1
+            if self._updates % self._returns.maxlen == 0:
+                self._resum()
+        self.last_capital = cap
+
+    def _resum(self):
+        arr = np.fromiter(self._returns, dtype=np.float64, count=len(self._returns))
+        self._sum, self._sumsq = float(arr.sum()), float((arr * arr).sum())
+        self._downsq = float((np.minimum(arr, 0.0) ** 2).sum())
+
+    def snapshot(self):
+        state = {k: v for k, v in self.__dict__.items() if not k.startswith('_')}
+        state['side'] = {side: dict(st) for side, st in self.side.items()}
+        state.update(returns=list(self._returns), window=self._returns.maxlen,
+                     sums=[self._sum, self._sumsq, self._downsq])
+        return state
+
+    def restore(self, state):
+        state = dict(state)
+        self._returns = deque(state.pop('returns'), maxlen=state.pop('window'))
+        state.pop('sums')               # re-summed from the restored window below
+        self.__dict__.update(state)
+        self._resum()
+
+    def summary(self):
+        n = len(self._returns)
+        sharpe = sortino = None
+        if n >= 2:
+            mean = self._sum / n
+            var = max(0.0, (self._sumsq - n * mean * mean) / (n - 1))
+            sharpe = mean / var ** 0.5 if var > 0 else None
+            # a downside sum within rounding noise of the running sums means no downside at all
+            down = (self._downsq / n) ** 0.5 if self._downsq > 1e-12 * self._sumsq else 0.0
+            sortino = mean / down if down > 0 else None
+        return {
+            'closed_count': self.closed,
+            'win_rate': (self.wins/self.closed*100) if self.closed else 0.0,
+            'max_dd': self.max_dd,
+            'drawdown': self.drawdown,
+            'peak': self.peak,
+            'profit_factor': (self.gross_profit / self.gross_loss) if self.gross_loss > 0 else None,
+            'gross_profit': self.gross_profit,
+            'gross_loss': self.gross_loss,
+            'streak': self.streak,
+            'max_win_streak': self.max_win_streak,
+            'max_loss_streak': self.max_loss_streak,
+            'sharpe': sharpe,
+            'sortino': sortino,
+            'per_side': {side: dict(st, win_rate=(st['wins']/st['closed']*100) if st['closed'] else 0.0)
+                         for side, st in self.side.items()},
+        }
+
+# -------------------------
+# === TRADE JOURNAL ===
+# -------------------------
+# Write-ahead journal per symbol: every open, close and capital change is appended as one
+# CRC-checked JSON line. The trading thread only enqueues the record; a single writer
+# thread encodes, writes and fsyncs them in batches (group commit every
+# journal_fsync_interval). Every journal_snapshot_every records the portfolio is written as
+# a compact .npz snapshot (tmp file + fsync + atomic rename) and a new log segment is
+# started, so recovery loads one snapshot and replays only the short tail after it.
+# A kill -9 can lose at most the last unsynced batch; a torn last line fails its CRC and is
+# ignored.
+
+class JournalWriter:
+    def __init__(self, fsync_interval=journal_fsync_interval):
+        self.fsync_interval = fsync_interval
+        self._q = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {'records': 0, 'batches': 0, 'snapshots': 0, 'errors': 0, 'last_batch_ms': 0.0}
+
+    def submit(self, journal, kind, payload):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        self._q.put((journal, kind, payload))
+
+    def flush(self, timeout=None):
+        # blocks until everything submitted so far is on disk
+        done = threading.Event()
+        self.submit(None, 'flush', done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.fsync_interval
+            while batch[-1][1] != 'flush':
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._q.get(timeout=left))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        t0 = time.perf_counter()
+        dirty, waiters = {}, []
+        try:
+            for journal, kind, payload in batch:
+                if kind == 'flush':
+                    waiters.append(payload)
+                elif kind == 'snapshot':
+                    journal._write_snapshot(payload)
+                    dirty.pop(id(journal), None)
+                    self.stats['snapshots'] += 1
+                else:
+                    journal._write_record(payload)
+                    dirty[id(journal)] = journal
+                    self.stats['records'] += 1
+            for journal in dirty.values():
+                journal._sync()
+        except Exception as e:
+            self.stats['errors'] += 1
+            print("Journal write error:", e)
+        finally:
+            for done in waiters:
+                done.set()
+        self.stats['batches'] += 1
+        self.stats['last_batch_ms'] = (time.perf_counter() - t0) * 1000
+
+journal_writer = JournalWriter()
+
+def _trade_record(t):
+    return {'id': t['id'], 'side': t['side'], 'entry_price': t['entry_price'], 'entry_time': _dt_to_ms(t['entry_time']),
+            'amount': t['amount'], 'order_size': t['order_size']}
+
+def _trade_from_record(r):
+    return {'id': r['id'], 'side': r['side'], 'entry_price': r['entry_price'], 'entry_time': _ms_to_dt(r['entry_time']),
+            'amount': r['amount'], 'order_size': r['order_size'], 'status': 'open'}
+
+class TradeJournal:
+    def __init__(self, sym, directory=journal_dir, writer=None, snapshot_every=journal_snapshot_every):
+        self.symbol = sym
+        self.directory = directory
+        self.writer = writer or journal_writer
+        self.snapshot_every = snapshot_every
+        self.prefix = os.path.join(directory, sym.replace('/', ''))
+        self.snapshot_path = self.prefix + '.snapshot.npz'
+        self.segment = 0        # log segment new records go to (writer thread)
+        self.pending = 0        # records since the last snapshot
+        self.max_id = 0         # highest trade id seen by recover()
+        self._f = None
+
+    # --- trading thread: enqueue only ---
+    def log_open(self, t):
+        self._log(dict(_trade_record(t), op='open'))
+
+    def log_close(self, t_closed):
+        self._log({'op': 'close', 'id': t_closed['id'], 'exit_price': t_closed['exit_price'],
+                   'exit_time': _dt_to_ms(t_closed['exit_time']), 'reason': t_closed['close_reason'],
+                   'pnl_usdt': t_closed['pnl_usdt']})
+
+    def log_capital(self, ts_ms, capital):
+        self._log({'op': 'capital', 'ts': ts_ms, 'capital': capital})
+
+    def _log(self, rec):
+        self.pending += 1
+        self.writer.submit(self, 'record', rec)
+
+    def snapshot_due(self):
+        return self.pending >= self.snapshot_every
+
+    def snapshot(self, pf):
+        # caller holds pf.lock. Filled ledger rows are never rewritten, so the chunk views
+        # can go to the writer thread without copying them here.
+        state = {
+            'capital': pf.capital,
+            'positions': [_trade_record(t) for t in pf.positions],
+            'ledger': [rows for _, rows in pf.ledger._chunk_views()],
+            'capital_history': pf.capital_history.state(),
+            'price_history': pf.price_history.state(),
+            'analytics': pf.analytics.snapshot(),
+        }
+        self.pending = 0
+        self.writer.submit(self, 'snapshot', state)
+
+    # --- writer thread ---
+    def _segment_path(self, seg):
+        return f"{self.prefix}.{seg:06d}.log"
+
+    def _segments(self):
+        base = os.path.basename(self.prefix) + '.'
+        if not os.path.isdir(self.directory):
+            return []
+        segs = []
+        for name in os.listdir(self.directory):
+            num = name[len(base):-4]
+            if name.startswith(base) and name.endswith('.log') and num.isdigit():
+                segs.append(int(num))
+        return sorted(segs)
+
+    def _write_record(self, rec):
+        if self._f is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._f = open(self._segment_path(self.segment), 'ab')
+        body = json.dumps(rec, separators=(',', ':')).encode()
+        self._f.write(b'%08x %s\n' % (zlib.crc32(body), body))
+
+    def _sync(self):
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def _write_snapshot(self, state):
+        # the snapshot covers every record logged before it: seal the current segment,
+        # point the snapshot at the next one, then drop the segments it replaces
+        self._sync()
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        self.segment += 1
+        os.makedirs(self.directory, exist_ok=True)
+        meta = {k: state[k] for k in ('capital', 'positions', 'analytics')}
+        meta.update(symbol=self.symbol, segment=self.segment, written_ms=int(time.time()*1000))
+        ledger = np.concatenate(state['ledger']) if state['ledger'] else np.zeros(0, dtype=LEDGER_DTYPE)
+        tmp = self.snapshot_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            tiers = {f"{series}.{name}": rows for series in ('capital_history', 'price_history')
+                     for name, rows in state[series].items()}
+            np.savez(f, meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), ledger=ledger, **tiers)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        for seg in self._segments():
+            if seg < self.segment:
+                os.remove(self._segment_path(seg))
+
+    # --- startup ---
+    def recover(self, pf):
+        # loads snapshot + log tail into a fresh portfolio; returns the number of replayed records.
+        # New records go to a fresh segment, never behind a possibly torn tail.
+        first_seg = 0
+        if os.path.exists(self.snapshot_path):
+            with np.load(self.snapshot_path, allow_pickle=False) as z:
+                meta = json.loads(z['meta'].tobytes().decode())
+                pf.ledger.extend(z['ledger'])
+                for series in ('capital_history', 'price_history'):
+                    history = getattr(pf, series)
+                    if series in z.files:       # snapshot from before the history tiers: plain [ts, value] rows
+                        for ts_ms, value in z[series].tolist():
+                            history.append(int(ts_ms), value)
+                    else:
+                        prefix = series + '.'
+                        history.load({k[len(prefix):]: z[k] for k in z.files if k.startswith(prefix)})
+            first_seg = meta['segment']
+            pf.capital = meta['capital']
+            pf.analytics.restore(meta['analytics'])
+            for r in meta['positions']:
+                pf.positions.add(_trade_from_record(r))
+            for ts_ms, price in zip(*pf.price_history.tail(price_history_max)):
+                pf.indicators.update(int(ts_ms), float(price))
+        replayed = 0
+        segs = [seg for seg in self._segments() if seg >= first_seg]
+        for seg in segs:
+            with open(self._segment_path(seg), 'rb') as f:
+                for line in f:
+                    body = line[9:-1]
+                    if not line.endswith(b'\n') or line[:8] != b'%08x' % zlib.crc32(body):
+                        print(f"[JOURNAL] {self.symbol}: torn record in segment {seg}, ignoring the rest of it")
+                        break
+                    self._apply(pf, json.loads(body))
+                    replayed += 1
+        self.segment = max(segs[-1] + 1 if segs else 0, first_seg)
+        self.pending = replayed
+        ids = [t['id'] for t in pf.positions]
+        if len(pf.ledger):
+            ids.append(int(pf.ledger.column('id').max()))
+        self.max_id = max(ids, default=0)
+        return replayed
+
+    @staticmethod
+    def _apply(pf, rec):
+        op = rec['op']
+        if op == 'open':
+            t = _trade_from_record(rec)
+            pf.positions.add(t)
+            pf.analytics.on_open(t)
+        elif op == 'close':
+            t = pf.positions.remove(rec['id'])
+            if t is None:
+                return
+            pf.ledger.append(dict(t, exit_price=rec['exit_price'], exit_time=_ms_to_dt(rec['exit_time']),
+                                  close_reason=rec['reason'], pnl_usdt=rec['pnl_usdt']))
+            pf.analytics.on_close(t, rec['pnl_usdt'])
+            pf.capital += rec['pnl_usdt']
+        elif op == 'capital':
+            pf.capital = rec['capital']
+            pf.capital_history.append(rec['ts'], rec['capital'])
+            pf.analytics.on_capital(rec['capital'])
+
+# -------------------------
+# === SIGNAL KERNEL ===
+# -------------------------
+# Array-native pieces of the 2h breakout entry. RollingExtrema keeps min(low)/max(high)
+# of the closed 2h bars with monotonic deques, so a tick only pushes the bars that closed
+# since the last one (O(1) amortized) instead of rescanning the window. score_entries()
+# takes one row per symbol or parameter set and finds the first 30m pullback bar of every
+# row with a single vectorized comparison.
+
+class RollingExtrema:
+    def __init__(self):
+        self.last_ts = None
+        self._lows = deque()    # (ts, low), lows increasing -> front is the window minimum
+        self._highs = deque()   # (ts, high), highs decreasing -> front is the window maximum
+
+    def reset(self):
+        self.last_ts = None
+        self._lows.clear()
+        self._highs.clear()
+
+    def _push(self, ts, low, high):
+        while self._lows and self._lows[-1][1] >= low:
+            self._lows.pop()
+        self._lows.append((ts, low))
+        while self._highs and self._highs[-1][1] <= high:
+            self._highs.pop()
+        self._highs.append((ts, high))
+        self.last_ts = ts
+
+    def sync(self, ts, low, high):
+        # ts/low/high: the 2h window incl. the still-forming last bar. Returns (min low, max high)
+        # of the closed bars ts[:-1], pushing only bars newer than the last sync.
+        n = len(ts) - 1
+        if n < 1:
+            return np.nan, np.nan
+        if self.last_ts is not None and ts[0] <= self.last_ts <= ts[n - 1]:
+            start = int(np.searchsorted(ts[:n], self.last_ts, side='right'))
+        else:
+            self.reset()        # first call, or the window jumped past everything seen
+            start = 0
+        for i in range(start, n):
+            self._push(int(ts[i]), float(low[i]), float(high[i]))
+        first = ts[0]
+        while self._lows[0][0] < first:
+            self._lows.popleft()
+        while self._highs[0][0] < first:
+            self._highs.popleft()
+        return self._lows[0][1], self._highs[0][1]
+
+def breakout_side(current, lowest, highest, t_trigger_pct):
+    # SIDE_LONG / SIDE_SHORT / 0 per row; all arguments broadcast
+    current, lowest, highest = (np.asarray(x, dtype=np.float64) for x in (current, lowest, highest))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_up = np.where(lowest > 0, (current - lowest) / lowest * 100, 0.0)
+        change_down = np.where(highest > 0, (current - highest) / highest * 100, 0.0)
+    return np.where(change_up >= t_trigger_pct, SIDE_LONG,
+                    np.where(change_down <= -t_trigger_pct, SIDE_SHORT, 0)).astype(np.int8)
+
+def score_entries(current, lowest, highest, close30, t_trigger_pct, t_fee):
+    # current/lowest/highest/t_trigger_pct/t_fee: scalars or one value per row.
+    # close30: the 30m closes of the signal window, shape (W,) shared by all rows or (rows, W)
+    # NaN-padded. Returns (side, index of the first pullback bar or -1, entry price) per row.
+    side = np.atleast_1d(breakout_side(current, lowest, highest, t_trigger_pct))
+    close30 = np.asarray(close30, dtype=np.float64)
+    if close30.ndim == 1:
+        close30 = close30[None, :]
+    rows = max(len(side), len(close30))
+    side = np.broadcast_to(side, (rows,))
+    level = np.broadcast_to(np.asarray(current, dtype=np.float64), (rows,))[:, None]
+    if close30.shape[1] == 0:
+        return side, np.full(rows, -1), np.full(rows, np.nan)
+    hit = np.where((side == SIDE_LONG)[:, None], close30 <= level,
+                   (side == SIDE_SHORT)[:, None] & (close30 >= level))
+    found = hit.any(axis=1)
+    k = np.where(found, hit.argmax(axis=1), -1)
+    px = np.broadcast_to(close30, (rows, close30.shape[1]))[np.arange(rows), np.maximum(k, 0)]
+    fee = np.broadcast_to(np.asarray(t_fee, dtype=np.float64), (rows,))
+    entry_price = np.where(side == SIDE_LONG, px * (1 + fee), px * (1 - fee))
+    return side, k, np.where(found, entry_price, np.nan)
+
+# -------------------------
+# === CLOCK ===
+# -------------------------
+# The trading loop reads time only through `clock`. WallClock is the real one; replay mode
+# swaps in a ReplayClock whose time moves only inside sleep(), so a replayed run makes the
+# same decisions at any speed: speed=N waits 1/N of each sleep in real time, 0 not at all.
+
+class WallClock:
+    def time(self):
+        return time.time()
+
+    def ms(self):
+        return int(self.time() * 1000)
+
+    def now(self):
+        return datetime.fromtimestamp(self.time(), timezone.utc)
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class ReplayClock(WallClock):
+    def __init__(self, start_ms, speed=1000.0):
+        self._t = start_ms / 1000
+        self.speed = speed
+
+    def time(self):
+        return self._t
+
+    def sleep(self, seconds):
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        self._t += seconds
+
+clock = WallClock()
+
+# -------------------------
+# === GLOBAL STATE ===
+# -------------------------
+# every traded symbol gets its own isolated portfolio (see `portfolios` below)
+class Portfolio:
+    def __init__(self, sym, capital=start_capital):
+        self.symbol = sym
+        self.capital = capital
+        self.positions = PositionBook()
+        self.ledger = TradeLedger()   # closed trades
+        self.analytics = PortfolioAnalytics()
+        self.analytics.on_capital(capital)
+        self.price_history = TieredSeries()    # [ts_ms, price]: raw tail + 1m/1h/1d bars
+        self.capital_history = TieredSeries()  # [ts_ms, capital]
+        self.indicators = IndicatorEngine()
+        self.extrema = RollingExtrema()   # 2h breakout window, fed by the candle loop
+        self.publisher = StatePublisher(self)
+        self.journal = None           # TradeJournal once journaling is enabled (live mode)
+        # candle loop and tick feed both mutate the portfolio; lock order is pf.lock -> publisher lock
+        self.lock = threading.RLock()
+
+trade_ids = itertools.count(1)
+last_status_update = clock.now()
+
+# -------------------------
+# === METRICS ===
+# -------------------------
+# In-process counters, gauges and histograms, rendered in Prometheus text format on
+# /metrics. Hot-path cost is a dict lookup + bisect under a lock per observation.
+# Gauges that already live elsewhere (SSE clients, notifier backlog, ...) are read
+# through callbacks at scrape time instead of being pushed.
+
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}          # name -> (type, help, buckets)
+        self._values = {}        # name -> {labels tuple: value | [bucket counts, sum, count]}
+        self._callbacks = {}     # name -> fn() -> {labels tuple: value}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+        self._values.setdefault(name, {})
+
+    def gauge_fn(self, name, help_text, fn, kind='gauge'):
+        self.describe(name, kind, help_text)
+        self._callbacks[name] = fn
+
+    def inc(self, name, amount=1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            vals = self._values[name]
+            vals[key] = vals.get(key, 0.0) + amount
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._meta[name][2]
+        with self._lock:
+            h = self._values[name].get(key)
+            if h is None:
+                h = self._values[name][key] = [[0] * len(buckets), 0.0, 0]
+            i = bisect.bisect_left(buckets, value)
+            if i < len(buckets):
+                h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    def total(self, name):
+        # counter summed over all label sets
+        with self._lock:
+            return sum(self._values[name].values())
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0, **labels)
+
+    @staticmethod
+    def _labels(key, extra=()):
+        items = list(key) + list(extra)
+        if not items:
+            return ''
+        return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items) + '}'
+
+    def render(self):
+        out = []
+        with self._lock:
+            values = {name: dict(vals) for name, vals in self._values.items()}
+            hists = {name: {k: (list(h[0]), h[1], h[2]) for k, h in vals.items()}
+                     for name, vals in values.items() if self._meta[name][0] == 'histogram'}
+        for name, (kind, help_text, buckets) in self._meta.items():
+            if name in self._callbacks:
+                try:
+                    values[name] = self._callbacks[name]()
+                except Exception as e:
+                    print(f"metrics callback error ({name}):", e)
+                    continue
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for key, (counts, total, n) in hists[name].items():
+                    acc = 0
+                    for le, c in zip(buckets, counts):
+                        acc += c
+                        out.append(f"{name}_bucket{self._labels(key, [('le', le)])} {acc}")
+                    out.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {n}")
+                    out.append(f"{name}_sum{self._labels(key)} {total!r}")
+                    out.append(f"{name}_count{self._labels(key)} {n}")
+            else:
+                for key, v in values[name].items():
+                    out.append(f"{name}{self._labels(key)} {float(v)!r}")
+        return '\n'.join(out) + '\n'
+
+metrics = Metrics()
+metrics.describe('bot_stage_seconds', 'histogram', "Duration of one trading loop stage", STAGE_BUCKETS)
+metrics.describe('bot_loop_seconds', 'histogram', "Duration of one full trading loop iteration", STAGE_BUCKETS)
+metrics.describe('bot_loop_drift_seconds', 'gauge', "Last loop start interval minus loop_sleep")
+metrics.describe('bot_loop_iterations_total', 'counter', "Trading loop iterations")
+metrics.describe('bot_errors_total', 'counter', "Exceptions caught in the trading loop")
+metrics.describe('exchange_requests_total', 'counter', "Exchange API calls")
+metrics.describe('exchange_errors_total', 'counter', "Exchange API calls that raised")
+metrics.describe('exchange_retries_total', 'counter', "Exchange API calls retried after a transient error")
+metrics.describe('exchange_deduplicated_total', 'counter', "Exchange API calls served by an identical in-flight request")
+metrics.describe('exchange_breaker_open', 'gauge', "1 while the exchange circuit breaker rejects requests")
+metrics.describe('entries_skipped_total', 'counter', "Entry signals not taken")
+metrics.describe('trades_opened_total', 'counter', "Opened paper trades")
+metrics.describe('trades_closed_total', 'counter', "Closed paper trades")
+metrics.describe('http_request_seconds', 'histogram', "Request handling time", STAGE_BUCKETS)
+metrics.describe('sse_fanout_seconds', 'histogram', "Time to hand one published frame to all SSE clients", STAGE_BUCKETS)
+
+class SamplingProfiler:
+    # samples the stacks of all other threads every `interval` s; dump() returns
+    # collapsed stacks ("outer;inner count" lines) for flamegraph tools
+    def __init__(self):
+        self.interval = profiler_interval
+        self.samples = {}
+        self.started = None
+        self._stop = None
+
+    @property
+    def running(self):
+        return self._stop is not None
+
+    def start(self, interval=None):
+        if interval is not None and not (math.isfinite(interval) and interval > 0):
+            raise ValueError(f"profiler interval must be a positive number of seconds, got {interval!r}")
+        if self.running:
+            return
+        if interval is not None:
+            self.interval = max(profiler_min_interval, interval)
+        self.samples = {}
+        self.started = time.time()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), daemon=True).start()
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, stop):
+        me = threading.get_ident()
+        while not stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = ';'.join(f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+                                 for fs in traceback.extract_stack(frame))
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def dump(self):
+        return ''.join(f"{stack} {n}\n" for stack, n in sorted(self.samples.items(), key=lambda kv: -kv[1]))
+
+profiler = SamplingProfiler()
+
+# -------------------------
+# === EXCHANGE SETUP ===
+# -------------------------
+# requests are paced by rate_limiter (shared across symbols and threads) instead of
+# ccxt's per-instance throttle, which is not meant for concurrent callers. Every call goes
+# through exchange_call(): identical calls already in flight share one request, transient
+# errors (timeouts, 5xx, 429) are retried with jittered exponential backoff, and after
+# exchange_breaker_threshold failures in a row the circuit breaker fails calls fast until
+# exchange_breaker_cooldown has passed and a trial request succeeds again.
+exchange = ccxt.binance({'enableRateLimit': False, 'options': {'fetchMarkets': {'types': ['spot']}}})
+# one keep-alive connection per fetch worker instead of requests' default pool of 10 per host
+exchange.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=fetch_workers))
+exchange.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=fetch_workers))
+# ensure symbol normalized
+ccxt_symbol = symbol
+
+def use_exchange_api(base_url):
+    # point the public Binance endpoints at another host (the local fake exchange)
+    api = exchange.urls['api']
+    api['public'] = f"{base_url.rstrip('/')}/api/v3"
+    api['v1'] = f"{base_url.rstrip('/')}/api/v1"
+
+if EXCHANGE_API:
+    use_exchange_api(EXCHANGE_API)
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1.0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                wait = (cost - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CircuitOpen(ccxt.ExchangeNotAvailable):
+    pass
+
+class CircuitBreaker:
+    # closed -> open after `threshold` consecutive failures; open rejects calls for `cooldown`
+    # seconds, then half-open lets a single trial call through: success closes, failure reopens
+    def __init__(self, threshold=exchange_breaker_threshold, cooldown=exchange_breaker_cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half-open' if time.monotonic() - self.opened_at >= self.cooldown else 'open'
+
+    def retry_in(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.opened_at is not None or self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+            self.trial = False
+            metrics.set('exchange_breaker_open', 0 if self.opened_at is None else 1)
+
+def backoff_delay(attempt, base=exchange_backoff, cap=exchange_backoff_max):
+    # "full jitter": uniform in [0, base * 2**attempt], so retrying callers spread out
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+rate_limiter = TokenBucket(exchange_max_rps, exchange_burst)
+fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch')
+breaker = CircuitBreaker()
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _call_with_retry(method, args, kwargs, retries):
+    for attempt in range(retries + 1):
+        if not breaker.allow():
+            metrics.inc('exchange_errors_total', method=method, kind='CircuitOpen')
+            raise CircuitOpen(f"circuit open, {method} not sent (retry in {breaker.retry_in():.1f} s)")
+        rate_limiter.acquire()
+        metrics.inc('exchange_requests_total', method=method)
+        try:
+            result = getattr(exchange, method)(*args, **kwargs)
+        except ccxt.OperationFailed as e:
+            # ccxt's "may succeed on retry" branch: timeouts, 5xx, 429/418, Binance -1001 internal errors
+            breaker.record(False)
+            metrics.inc('exchange_errors_total', method=method, kind=type(e).__name__)
+            if attempt == retries:
+                raise
+            metrics.inc('exchange_retries_total', method=method)
+            time.sleep(backoff_delay(attempt))
+            continue
+        except Exception as e:
+            # a definite answer (bad symbol, bad params): retrying won't help, but the exchange is up
+            breaker.record(True)
+            metrics.inc('exchange_errors_total', method=method, kind=type(e).__name__)
+            raise
+        breaker.record(True)
+        return result
+
+def exchange_call(method, *args, retries=exchange_retries, **kwargs):
+    key = (method, repr(args), repr(sorted(kwargs.items())))
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = _inflight[key] = Future()
+    if not owner:
+        metrics.inc('exchange_deduplicated_total', method=method)
+        return fut.result()
+    try:
+        result = _call_with_retry(method, args, kwargs, retries)
+        fut.set_result(result)
+        return result
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+# -------------------------
+# === NOTIFICATIONS ===
+# -------------------------
+# send_telegram_message() only puts the text on a bounded queue; a background thread
+# sends it over a pooled HTTP session, paced by a token bucket. Events arriving within
+# telegram_coalesce seconds (or while waiting for the rate limit) go out as one digest,
+# so e.g. 12 pyramided entries in one tick cost a single request. A full queue drops the
+# new event instead of blocking the trading loop; drops and backlog are in stats.
+
+class TelegramNotifier:
+    MAX_TEXT = 4096   # Telegram message limit
+
+    def __init__(self, token, chat_id, api_base=TELEGRAM_API, queue_size=telegram_queue_size,
+                 rate=telegram_max_rps, burst=telegram_burst, coalesce=telegram_coalesce, timeout=5):
+        self.url = f"{api_base.rstrip('/')}/bot{token}/sendMessage"
+        self.enabled = bool(token and chat_id)
+        self.chat_id = chat_id
+        self.coalesce = coalesce
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.limiter = TokenBucket(rate, burst)
+        self._q = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.stats = {'queued': 0, 'dropped': 0, 'events_sent': 0, 'messages_sent': 0,
+                      'errors': 0, 'last_error': None}
+
+    def send(self, text):
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        try:
+            self._q.put_nowait(text)
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def summary(self):
+        return dict(self.stats, backlog=self._q.qsize(), queue_size=self._q.maxsize, enabled=self.enabled)
+
+    def _run(self):
+        while True:
+            texts = [self._q.get()]
+            deadline = time.monotonic() + self.coalesce
+            while True:
+                left = deadline - time.monotonic()
+                try:
+                    texts.append(self._q.get(timeout=left) if left > 0 else self._q.get_nowait())
+                except queue.Empty:
+                    break
+            self._deliver(texts)
+
+    def _digests(self, texts):
+        # one message per burst, split only where it would exceed the Telegram limit
+        head = f"{len(texts)} events:\n" if len(texts) > 1 else ""
+        msg, n = head, 0
+        for text in texts:
+            if n and len(msg) + len(text) + 1 > self.MAX_TEXT:
+                yield msg[:self.MAX_TEXT], n
+                msg, n = "", 0
+            msg += text + "\n" if len(texts) > 1 else text
+            n += 1
+        yield msg[:self.MAX_TEXT], n
+
+    def _deliver(self, texts):
+        for msg, n in self._digests(texts):
+            self.limiter.acquire()
+            data = {'chat_id': self.chat_id, 'text': msg, 'parse_mode': 'Markdown'}
+            try:
+                r = self.session.post(self.url, data=data, timeout=self.timeout)
+                if r.status_code == 429:
+                    # flood control: wait as told, then retry once
+                    time.sleep(float(r.json().get('parameters', {}).get('retry_after', 1)))
+                    r = self.session.post(self.url, data=data, timeout=self.timeout)
+                r.raise_for_status()
+                self.stats['messages_sent'] += 1
+                self.stats['events_sent'] += n
+            except Exception as e:
+                self.stats['errors'] += 1
+                self.stats['last_error'] = str(e)
+                print("Telegram send error:", e)
+
+notifier = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+
+def send_telegram_message(text: str):
+    with metrics.timer('bot_stage_seconds', stage='notify'):
+        notifier.send(text)
+
+# -------------------------
+# === FLASK APP + DASH HTML ===
+# -------------------------
+app = Flask(__name__, static_folder=None)
+
+DASH_HTML = """
+<!doctype html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <title>Paper Bot Dashboard — Dark</title>
+  <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
+  <style>
+    :root {
+      --bg: #0b1220;
+      --panel: #0f1724;
+      --muted: #9aa6b2;
+      --accent: #19a37b;
+      --danger: #f05252;
+      --text: #e6eef6;
+    }
+    body { background:var(--bg); color:var(--text); font-family: Inter, Arial; margin:16px; }
+    .layout { display:grid; grid-template-columns: 360px 1fr 360px; gap: 16px; }
+    .panel { background:var(--panel); padding:12px; border-radius:8px; box-shadow: 0 6px 18px rgba(0,0,0,0.6); }
+    h1 { margin:0 0 8px 0; font-size:18px; }
+    .muted { color:var(--muted); font-size:13px; }
+    .kpi { display:flex; gap:8px; align-items:center; justify-content:space-between; }
+    .small { font-size:13px; color:var(--muted); }
+    table { width:100%; border-collapse: collapse; margin-top:8px; font-size:13px; }
+    th, td { padding:6px; border-bottom: 1px solid rgba(255,255,255,0.03); text-align:left; color:var(--text); }
+    .progress { height:10px; background:rgba(255,255,255,0.03); border-radius:6px; overflow:hidden; }
+    .prog-fill { height:100%; background: linear-gradient(90deg, #19a37b, #4ad9b2); }
+    .prog-fill.loss { background: linear-gradient(90deg, #f05252, #f79a9a); }
+    .marker { font-size:12px; padding:4px 8px; border-radius:6px; background:rgba(255,255,255,0.03); display:inline-block; }
+    .btn { background:transparent; border:1px solid rgba(255,255,255,0.06); padding:6px 8px; border-radius:6px; color:var(--text); cursor:pointer; }
+    .top-row { display:flex; gap:12px; align-items:center; justify-content:space-between; margin-bottom:8px; }
+    .chart-wrap { grid-column: 2 / 3; }
+  </style>
+</head>
+<body>
+  <div class="top-row">
+    <h1>📊 Paper-Trading Bot — 2h Breakout + 30m Pullback (Dark)</h1>
+    <div>
+      <select id="symbol_select" class="btn" onchange="switchSymbol(this.value)">
+        {% for sym in symbols %}<option value="{{sym}}">{{sym}}</option>{% endfor %}
+      </select>
+      <span class="small">Live Price: </span>
+      <strong id="live_price">...</strong>
+      <span class="small"> USDT</span>
+    </div>
+  </div>
+
+  <div class="layout">
+    <div class="panel">
+      <h3>Kapital</h3>
+      <p class="muted">Startkapital: <strong>{{start_capital}} USDT</strong></p>
+      <p style="font-size:20px"><strong id="live_capital">...</strong> USDT</p>
+      <p class="small">Order size: {{order_size_usdt}} USDT &nbsp; Fee: {{fee_pct*100}}%</p>
+      <div style="margin-top:8px;">
+        <h4 style="margin:6px 0;">Open Trades</h4>
+        <div id="open_trades_panel">Loading...</div>
+      </div>
+      <div style="margin-top:10px;">
+        <h4 style="margin:6px 0;">Recent Activity</h4>
+        <div id="activity">Loading...</div>
+      </div>
+      <div style="margin-top:10px;">
+        <button class="btn" onclick="downloadCSV()">Export Trade History CSV</button>
+      </div>
+    </div>
+
+    <div class="panel chart-wrap">
+      <canvas id="priceChart" height="220"></canvas>
+      <div style="display:flex; gap:16px; margin-top:8px;">
+        <canvas id="rsiChart" height="80" style="flex:1"></canvas>
+        <canvas id="equityChart" height="80" style="width:240px"></canvas>
+      </div>
+      <div class="muted" style="margin-top:8px">Markers: entry=open, exit=closed. TP/SL lines shown on chart.</div>
+    </div>
+
+    <div class="panel">
+      <h4>Stats</h4>
+      <p id="stats">Loading...</p>
+      <h4 style="margin-top:10px">Trade History</h4>
+      <div style="max-height:320px; overflow:auto;">
+        <table id="hist_table">
+          <thead><tr><th>Side</th><th>Entry</th><th>Exit</th><th>PnL (USDT)</th></tr></thead>
+          <tbody id="hist_rows"></tbody>
+        </table>
+        <button class="btn" id="older_btn" onclick="loadOlder()" style="margin-top:6px">Load older</button>
+      </div>
+    </div>
+  </div>
+
+<script>
+let priceChart, rsiChart, equityChart;
+let S = null;      // local copy of /api/state, kept current by /stream deltas
+let es = null;
+const CHART_POINTS = {{chart_history_points}};
+let SYMBOL = document.getElementById('symbol_select').value;
+let older = [];    // history rows paged in from /api/trades (beyond what /api/state carries)
+
+async function fetchState(){
+  // server answers 304 (ETag) when nothing changed, the browser then reuses its cached copy
+  const res = await fetch('/api/state?symbol=' + encodeURIComponent(SYMBOL), {cache: 'no-cache'});
+  return await res.json();
+}
+
+function formatDate(ts){
+  return new Date(ts).toLocaleString();
+}
+
+function buildOpenTradesHTML(open_trades, latest_price){
+  if(open_trades.length===0) return '<p class="small">Keine offenen Trades</p>';
+  let html = '<table><thead><tr><th>Side</th><th>Entry</th><th>Qty</th><th>Size</th><th>OpenPnL</th><th>Progress</th></tr></thead><tbody>';
+  for(const t of open_trades){
+    const unreal = (latest_price==null) ? 0 : ((t.side==='long') ? (latest_price - t.entry_price)*t.amount : (t.entry_price - latest_price)*t.amount);
+    const pnl = unreal.toFixed(2);
+    const pct = ((t.side==='long') ? ((latest_price - t.entry_price)/t.entry_price*100) : ((t.entry_price - latest_price)/t.entry_price*100));
+    // progress: map from -SL..TP to 0..100
+    const totalRange = (t.order_size>0) ? (Math.abs(pct) / ( (pct>0) ? {{profit_target}} : {{stop_loss}} )) : 0;
+    // compute progress in JS below as we don't have server-side template for dynamic numbers
+    html += `<tr>
+      <td>${t.side.toUpperCase()}</td>
+      <td>${t.entry_price.toFixed(2)}</td>
+      <td>${t.amount.toFixed(6)}</td>
+      <td>${t.order_size.toFixed(2)}</td>
+      <td>${pnl}</td>
+      <td><div class="progress"><div class="prog-fill" style="width:${Math.min(100, Math.max(0, ( ( (t.side==='long') ? ( (latest_price - t.entry_price)/t.entry_price*100 ) : ((t.entry_price - latest_price)/t.entry_price*100) ) + {{stop_loss}} ) / ({{profit_target}} + {{stop_loss}}) *100 ))}%"></div></div></td>
+    </tr>`;
+  }
+  html += '</tbody></table>';
+  return html;
+}
+
+function applyDelta(d){
+  if(d.prices){
+    for(const p of d.prices){
+      S.chart.push([p[0], p[1]]);
+      S.ema_short.push(p[2]);
+      S.ema_long.push(p[3]);
+      S.rsi.push(p[4]);
+    }
+    const cut = Math.max(0, S.chart.length - CHART_POINTS);
+    S.chart = S.chart.slice(cut);
+    S.ema_short = S.ema_short.slice(cut);
+    S.ema_long = S.ema_long.slice(cut);
+    S.rsi = S.rsi.slice(cut);
+    S.latest_price = S.chart[S.chart.length-1][1];
+  }
+  if(d.opened) S.open_trades.push(...d.opened);
+  if(d.closed){
+    const ids = new Set(d.closed.map(t=> t.id));
+    S.open_trades = S.open_trades.filter(t=> !ids.has(t.id));
+    S.history.push(...d.closed);
+    // rows pushed out of the live window move to the front of the paged-in ones, so both stay contiguous
+    const drop = S.history.length - {{history_rows}};
+    if(drop > 0){
+      if(older.length) older = S.history.slice(0, drop).reverse().concat(older);
+      S.history = S.history.slice(drop);
+    }
+    for(const t of d.closed) S.activity.push(`${t.side} ${t.entry_price.toFixed(2)} -> ${t.close_reason}`);
+    S.activity = S.activity.slice(-20);
+  }
+  if(d.capital_history){
+    S.capital_history.push(...d.capital_history);
+    S.capital_history = S.capital_history.slice(-CHART_POINTS);
+  }
+  S.capital = d.capital;
+  S.closed_count = d.closed_count;
+  S.win_rate = d.win_rate;
+  S.max_dd = d.max_dd;
+  S.stats = d.stats;
+}
+
+function render(){
+  const s = S;
+  document.getElementById('live_price').textContent = (s.latest_price==null) ? '...' : s.latest_price.toFixed(2);
+  document.getElementById('live_capital').textContent = s.capital.toFixed(2);
+
+  // open trades
+  document.getElementById('open_trades_panel').innerHTML = buildOpenTradesHTML(s.open_trades, s.latest_price);
+
+  // recent activity
+  let act = '';
+  for(const a of s.activity.slice(0,8)) act += `<div class="small">${a}</div>`;
+  document.getElementById('activity').innerHTML = act || '<div class="small">No activity</div>';
+
+  // stats
+  const st = s.stats || {};
+  const fmt = (x, d) => (x==null) ? '-' : x.toFixed(d);
+  document.getElementById('stats').innerHTML = `Closed: ${s.closed_count} | Winrate: ${s.win_rate.toFixed(2)}% | Max DD: ${s.max_dd.toFixed(2)}%`
+    + `<br><span class="small">PF: ${fmt(st.profit_factor, 2)} | Sharpe: ${fmt(st.sharpe, 2)} | Sortino: ${fmt(st.sortino, 2)} | Streak: ${st.streak||0}`
+    + (st.per_side ? ` | L/S exposure: ${st.per_side.long.exposure.toFixed(0)}/${st.per_side.short.exposure.toFixed(0)} USDT` : '') + `</span>`;
+
+  // history table
+  const rows = document.getElementById('hist_rows');
+  rows.innerHTML = '';
+  for(const h of s.history.slice().reverse().concat(older)){
+    const exit = h.exit_time ? new Date(h.exit_time).toLocaleString() : '-';
+    rows.insertAdjacentHTML('beforeend', `<tr><td>${h.side}</td><td>${new Date(h.entry_time).toLocaleString()}</td><td>${exit}</td><td>${(h.pnl_usdt||0).toFixed(2)}</td></tr>`);
+  }
+  document.getElementById('older_btn').style.display = (s.closed_count > s.history.length + older.length) ? '' : 'none';
+
+  // Chart data
+  const chart = s.chart;
+  const labels = chart.map(p=> new Date(p[0]).toLocaleTimeString());
+  const prices = chart.map(p=> p[1]);
+  const ema_short = s.ema_short || [];
+  const ema_long = s.ema_long || [];
+  const rsi = s.rsi || [];
+  const markers = s.markers || [];
+
+  if(!priceChart){
+    const ctx = document.getElementById('priceChart').getContext('2d');
+    priceChart = new Chart(ctx, {
+      type: 'line',
+      data: {
+        labels: labels,
+        datasets: [
+          { label:'Price', data: prices, borderColor:'#4fc3f7', tension:0.12, pointRadius:0, borderWidth:1.5 },
+          { label:'EMA'+{{ema_short}}, data: ema_short, borderColor:'#f39c12', tension:0.12, pointRadius:0, borderWidth:1 },
+          { label:'EMA'+{{ema_long}}, data: ema_long, borderColor:'#9b59b6', tension:0.12, pointRadius:0, borderWidth:1 }
+        ]
+      },
+      options: {
+        plugins: { legend:{display:true} },
+        scales: { x:{ display:true }, y:{ display:true } }
+      }
+    });
+  } else {
+    priceChart.data.labels = labels;
+    priceChart.data.datasets[0].data = prices;
+    priceChart.data.datasets[1].data = ema_short;
+    priceChart.data.datasets[2].data = ema_long;
+    priceChart.update();
+  }
+
+  // RSI chart
+  if(!rsiChart){
+    const ctx2 = document.getElementById('rsiChart').getContext('2d');
+    rsiChart = new Chart(ctx2, {
+      type:'line',
+      data:{ labels: labels, datasets:[{ label:'RSI', data: rsi, borderColor:'#7bed9f', pointRadius:0, borderWidth:1 }] },
+      options:{ plugins:{legend:{display:false}}, scales:{ y:{min:0, max:100} } }
+    });
+  } else {
+    rsiChart.data.labels = labels;
+    rsiChart.data.datasets[0].data = rsi;
+    rsiChart.update();
+  }
+
+  // Equity (capital history)
+  const eq = s.capital_history.map(p=> p[1]);
+  const eqLabels = s.capital_history.map(p=> new Date(p[0]).toLocaleTimeString());
+  if(!equityChart){
+    const ctx3 = document.getElementById('equityChart').getContext('2d');
+    equityChart = new Chart(ctx3, {
+      type:'line',
+      data:{ labels:eqLabels, datasets:[{ label:'Equity', data:eq, borderColor:'#19a37b', pointRadius:0, borderWidth:1 }] },
+      options:{ plugins:{legend:{display:false}} }
+    });
+  } else {
+    equityChart.data.labels = eqLabels;
+    equityChart.data.datasets[0].data = eq;
+    equityChart.update();
+  }
+}
+
+async function updateUI(){
+  const sym = SYMBOL;
+  const state = await fetchState();
+  if(sym !== SYMBOL) return;      // symbol switched while loading
+  S = state;
+  render();
+  connectStream();
+}
+
+async function downloadCSV(){
+  window.location = '/export/history.csv?symbol=' + encodeURIComponent(SYMBOL);
+}
+
+function switchSymbol(sym){
+  SYMBOL = sym;
+  if(es){ es.close(); es = null; }
+  S = null;
+  older = [];
+  updateUI();
+}
+
+async function loadOlder(){
+  // newest-first paging from the oldest trade on screen, so live closes can't shift the page
+  const oldest = older.length ? older[older.length-1] : S.history[0];
+  if(!oldest) return;
+  const res = await fetch(`/api/trades?symbol=${encodeURIComponent(SYMBOL)}&before=${oldest.id}&limit=200`);
+  if(!res.ok) return;
+  const page = await res.json();
+  older = older.concat(page.trades);
+  render();
+}
+
+// Realtime via SSE: server pushes only what changed since our version
+function connectStream(){
+  if(es && es.readyState !== EventSource.CLOSED) return;
+  es = new EventSource('/stream?symbol=' + encodeURIComponent(SYMBOL) + '&v=' + S.version);
+  es.onmessage = function(e){
+    const m = JSON.parse(e.data);
+    if(m.full || !S){ es.close(); older = []; updateUI(); return; }
+    for(const d of m.deltas) applyDelta(d);
+    S.version = m.version;
+    render();
+  };
+}
+
+updateUI();
+setInterval(function(){ if(!es || es.readyState !== EventSource.OPEN) updateUI(); }, 15000); // fallback polling
+</script>
+</body>
+</html>
+"""
+
+# -------------------------
+# === SSE BROADCAST HUB ===
+# -------------------------
+# One publisher, many subscribers: every published frame is formatted once and put on
+# each client's bounded queue. A client whose queue is full (stalled browser) is evicted
+# instead of backing up the publisher; EventSource reconnects and catches up from the
+# delta log via Last-Event-ID.
+
+class SSEHub:
+    EVICTED = object()
+
+    def __init__(self, queue_size=sse_queue_size):
+        self.queue_size = queue_size
+        self._subs = set()
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.published = 0
+
+    def subscribe(self, first_frame=None):
+        q = queue.Queue(maxsize=self.queue_size)
+        if first_frame is not None:
+            q.put_nowait(first_frame)
+        with self._lock:
+            self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subs.discard(q)
+
+    def broadcast(self, frame):
+        with self._lock:
+            subs = list(self._subs)
+        self.published += 1
+        for q in subs:
+            try:
+                q.put_nowait(frame)
+            except queue.Full:
+                self.unsubscribe(q)
+                self.evicted += 1
+                try:
+                    q.get_nowait()              # make room for the eviction marker
+                    q.put_nowait(SSEHub.EVICTED)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def __len__(self):
+        return len(self._subs)
+
+def process_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def sse_frame(version, payload):
+    return f"id: {version}\ndata: {payload}\n\n"
+
+# -------------------------
+# === VERSIONED STATE ===
+# -------------------------
+# The bot loop calls publish() once per tick. Each publish that changed something gets
+# the next version and a delta (new price points, opened/closed trades, capital). /stream
+# sends clients only the deltas after their version, /api/state is served with an ETag.
+# Versions start at boot time in ms so they never repeat across restarts.
+# The writer (holding pf.lock) captures what readers need into an immutable StateSnapshot
+# and swaps it in with one attribute assignment. Under the lock it only takes scalars,
+# small copies and references to data that is never rewritten (open trade dicts, ledger
+# views, frozen history series, re-frozen only when points were added). The JSON bodies
+# are built once per version by the first reader that asks, outside pf.lock. Flask threads
+# only read `publisher.snapshot`: they never take pf.lock and never wait for a tick, and a
+# reader that grabbed an older snapshot still sees a consistent one.
+
+class StateSnapshot:
+    __slots__ = ('version', 'deltas', 'ledger', 'price_history', 'capital_history', 'inputs',
+                 '_state', '_stats', '_lock')
+
+    def __init__(self, version, deltas, ledger, price_history, capital_history, inputs):
+        self.version = version
+        self.deltas = deltas
+        self.ledger = ledger
+        self.price_history = price_history
+        self.capital_history = capital_history
+        self.inputs = inputs            # state_inputs() of this version
+        self._state = self._stats = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    payload = build_state_payload(self.inputs, self.ledger, self.capital_history)
+                    self._state = app.json.dumps(dict(payload, version=self.version))
+        return self._state
+
+    @property
+    def stats(self):
+        if self._stats is None:
+            src = self.inputs
+            self._stats = app.json.dumps(dict(src['stats'], symbol=src['symbol'], capital=src['capital']))
+        return self._stats
+
+class StatePublisher:
+    def __init__(self, pf, log_size=500):
+        self.pf = pf
+        self.hub = SSEHub()
+        self.version = int(time.time()*1000)
+        self._lock = threading.RLock()
+        self._deltas = deque(maxlen=log_size)   # (version, delta)
+        self.snapshot = None                    # StateSnapshot, replaced (never mutated) per version
+        self._frozen = {}                       # series name -> (points, frozen copy)
+        self._price_count = 0
+        self._closed_count = 0
+        self._capital_points = 0
+        self._last_open_id = 0
+
+    def publish(self):
+        pf = self.pf
+        delta = {}
+        new_prices = pf.indicators.count - self._price_count
+        if new_prices > 0:
+            ts, px, ema_s, ema_l, rsi_vals = pf.indicators.tail(min(new_prices, chart_history_points))
+            rsi_vals = rsi_to_json(pf.indicators, rsi_vals)
+            delta['prices'] = [[int(a), float(b), float(c), float(d), e]
+                               for a, b, c, d, e in zip(ts, px, ema_s, ema_l, rsi_vals)]
+            self._price_count = pf.indicators.count
+        opened = pf.positions.newer_than(self._last_open_id)
+        if opened:
+            # trade times go out as epoch ms, like the ledger rows
+            delta['opened'] = [dict(t, entry_time=_dt_to_ms(t['entry_time'])) for t in opened]
+            self._last_open_id = opened[-1]['id']
+        if len(pf.ledger) > self._closed_count:
+            delta['closed'] = TradeLedger.to_dicts(pf.ledger.rows(self._closed_count))
+            self._closed_count = len(pf.ledger)
+        if len(pf.capital_history) > self._capital_points:
+            delta['capital_history'] = pf.capital_history.points(min(len(pf.capital_history) - self._capital_points,
+                                                                     chart_history_points))
+            self._capital_points = len(pf.capital_history)
+        if not delta:
+            return self.version
+        stats = pf.analytics.summary()
+        delta.update({'capital': pf.capital, 'closed_count': stats['closed_count'],
+                      'win_rate': stats['win_rate'], 'max_dd': stats['max_dd'], 'stats': stats})
+        with self._lock:
+            self.version += 1
+            payload = app.json.dumps(dict(delta, version=self.version))
+            self._deltas.append((self.version, payload))
+            self._swap()
+            # subscribers are at version-1, so the single new delta is all they need
+            with metrics.timer('sse_fanout_seconds'):
+                self.hub.broadcast(sse_frame(self.version, '{"version": %d, "published_ms": %d, "deltas": [%s]}'
+                                            % (self.version, int(time.time()*1000), payload)))
+        return self.version
+
+    def reset(self):
+        # state was loaded wholesale (journal recovery): no deltas for it, clients resync in full
+        pf = self.pf
+        with self._lock:
+            self._price_count = pf.indicators.count
+            self._closed_count = len(pf.ledger)
+            self._capital_points = len(pf.capital_history)
+            self._last_open_id = max((t['id'] for t in pf.positions), default=0)
+            self._deltas.clear()
+            self._frozen.clear()
+            self.version += 1
+            self._swap()
+
+    def _swap(self):
+        # caller holds pf.lock + self._lock: captures only, no serialization (see StateSnapshot)
+        pf = self.pf
+        snap = StateSnapshot(self.version, tuple(self._deltas), tuple(pf.ledger.views()),
+                             self._freeze('price_history'), self._freeze('capital_history'), state_inputs(pf))
+        self.snapshot = snap
+        return snap
+
+    def _freeze(self, name):
+        # the previous copy is reused until points were appended to the series
+        series = getattr(self.pf, name)
+        n, twin = self._frozen.get(name, (None, None))
+        if n != len(series):
+            twin = series.frozen()
+            self._frozen[name] = (len(series), twin)
+        return twin
+
+    def current(self):
+        # latest snapshot; only a reader arriving before the very first publish has to build one
+        snap = self.snapshot
+        if snap is None:
+            with self.pf.lock, self._lock:
+                snap = self.snapshot or self._swap()
+        return snap
+
+    def full_state(self):
+        snap = self.current()
+        return snap.version, snap.state
+
+    def message_since(self, v, snap=None):
+        # SSE payload for a client at version v, None if it is up to date
+        snap = snap or self.current()
+        if v == snap.version:
+            return None
+        deltas = snap.deltas
+        if v is None or v > snap.version or not deltas or v < deltas[0][0] - 1:
+            return snap.version, json.dumps({'version': snap.version, 'full': True})
+        parts = [d for ver, d in deltas if ver > v]
+        return snap.version, '{"version": %d, "deltas": [%s]}' % (snap.version, ', '.join(parts))
+
+    def subscribe(self, v):
+        # catch-up frame and hub registration under one lock, so no publish falls in between
+        self.current()      # built outside self._lock: lock order is pf.lock -> publisher lock
+        with self._lock:
+            msg = self.message_since(v, self.snapshot)
+            return self.hub.subscribe(sse_frame(*msg) if msg else None)
+
+portfolios = {sym: Portfolio(sym) for sym in symbols}
+
+def get_portfolio():
+    pf = portfolios.get(request.args.get('symbol', symbols[0]))
+    if pf is None:
+        abort(404)
+    return pf
+
+# -------------------------
+# === FLASK ROUTES ===
+# -------------------------
+@app.route('/')
+def home():
+    return render_template_string(DASH_HTML,
+                                  start_capital=start_capital,
+                                  order_size_usdt=order_size_usdt,
+                                  fee_pct=fee_pct,
+                                  ema_short=ema_short,
+                                  ema_long=ema_long,
+                                  profit_target=profit_target,
+                                  stop_loss=stop_loss,
+                                  chart_history_points=chart_history_points,
+                                  symbols=symbols,
+                                  history_rows=history_rows)
+
+def rsi_to_json(indicators, rsi_vals):
+    # same convention as the old compute_rsi: None until enough prices, warm-up NaN -> 50
+    if indicators.count < rsi_period + 1:
+        return [None] * len(rsi_vals)
+    return np.where(np.isnan(rsi_vals), 50.0, rsi_vals).tolist()
+
+def state_inputs(pf):
+    # everything build_state_payload needs beyond the ledger views and the capital history,
+    # taken under pf.lock: scalars, small copies and the (never mutated) open trade dicts
+    last = pf.price_history.last
+    ts, px, ema_s, ema_l, rsi_vals = pf.indicators.tail(chart_history_points)
+    return {'symbol': pf.symbol, 'capital': pf.capital, 'open_trades': list(pf.positions),
+            'latest_price': last[1] if last else None, 'stats': pf.analytics.summary(),
+            'ts': ts.tolist(), 'price': px.tolist(), 'ema_short': ema_s.tolist(), 'ema_long': ema_l.tolist(),
+            'rsi': rsi_to_json(pf.indicators, rsi_vals)}
+
+def build_state_payload(src, views, capital_history):
+    # src: state_inputs(pf), views: ledger views, capital_history: a frozen TieredSeries
+    # prepare open trades with unrealized pnl using latest price
+    open_trades, latest_price = src['open_trades'], src['latest_price']
+
+    ot = []
+    for t in open_trades:
+        if latest_price is None:
+            unreal = 0.0
+        else:
+            unreal = (latest_price - t['entry_price']) * t['amount'] if t['side']=='long' else (t['entry_price'] - latest_price) * t['amount']
+        ot.append(dict(t, entry_time=_dt_to_ms(t['entry_time']), unrealized_pnl=unreal))
+
+    # stats (maintained incrementally by the portfolio analytics)
+    stats = src['stats']
+    closed_count = stats['closed_count']
+
+    # build chart payload: last N price points, EMA & RSI come precomputed from the indicator engine
+    chart_data = [list(p) for p in zip(src['ts'], src['price'])]
+
+    # markers: trades closed inside the chart window + open entries
+    markers = TradeLedger.markers(views, chart_data[0][0] if chart_data else 0)
+    markers['open'] = [{'ts': _dt_to_ms(t['entry_time']), 'price': t['entry_price'], 'side': t['side']} for t in open_trades]
+    n_closed = sum(map(len, views))
+    recent = TradeLedger.to_dicts(TradeLedger.page(views, offset=max(0, n_closed - history_rows), limit=history_rows,
+                                                   newest_first=False)[1])
+
+    # capital history
+    ch = capital_history.points(chart_history_points)
+
+    return {
+        'symbol': src['symbol'],
+        'capital': src['capital'],
+        'open_trades': ot,
+        'closed_count': closed_count,
+        'win_rate': stats['win_rate'],
+        'max_dd': stats['max_dd'],
+        'stats': stats,
+        'chart': chart_data,
+        'ema_short': src['ema_short'],
+        'ema_long': src['ema_long'],
+        'rsi': src['rsi'],
+        'markers': markers,
+        'latest_price': latest_price,
+        'history': recent,
+        'activity': [ f"{(t.get('side',''))} {t.get('entry_price',0):.2f} -> {t.get('close_reason','')}" for t in recent[-20:] ],
+        'capital_history': ch
+    }
+
+@app.route('/api/state')
+def api_state():
+    with metrics.timer('http_request_seconds', route='api_state'):
+        version, body = get_portfolio().publisher.full_state()
+        if request.if_none_match.contains(str(version)):
+            resp = Response(status=304)
+        else:
+            resp = app.response_class(body, mimetype='application/json')
+        resp.set_etag(str(version))
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+
+def _ms_arg(name):
+    # epoch ms or ISO date/datetime
+    v = request.args.get(name)
+    if not v:
+        return None
+    if v.lstrip('-').isdigit():
+        return int(v)
+    ts = pd.Timestamp(v)
+    return int((ts.tz_localize('UTC') if ts.tzinfo is None else ts).timestamp()*1000)
+
+# Exports stream the ledger chunk by chunk (?symbol=&from=&to=&side=), so memory stays at
+# one chunk no matter how long the history is, and the lock is only held to take the
+# chunk list. /export/history.npz is the columnar format for offline analysis: one array
+# per ledger column (times in epoch ms, side/reason as codes), np.load() reads it.
+
+def _range_args():
+    side = request.args.get('side') or None
+    if side not in (None, 'long', 'short'):
+        abort(400)
+    try:
+        return _ms_arg('from'), _ms_arg('to'), side
+    except ValueError:
+        abort(400)
+
+def _export_response(pf, body, ext, mimetype):
+    fname = f"trade_history_{pf.symbol.replace('/', '')}.{ext}"
+    return Response(body, mimetype=mimetype, headers={"Content-disposition": f"attachment; filename={fname}"})
+
+def csv_chunks(chunks):
+    # columns and values as the original export (incl. its 'status', which was always the
+    # open-trade field carried over), the trade id is appended as the last column
+    header = True
+    for rows in chunks:
+        df = pd.DataFrame({
+            'side': np.where(rows['side'] == SIDE_LONG, 'long', 'short'),
+            'entry_price': rows['entry_price'],
+            'entry_time': pd.to_datetime(rows['entry_time'], unit='ms', utc=True).astype(str),
+            'amount': rows['amount'],
+            'order_size': rows['order_size'],
+            'status': 'open',
+            'exit_price': rows['exit_price'],
+            'exit_time': pd.to_datetime(rows['exit_time'], unit='ms', utc=True).astype(str),
+            'close_reason': np.where(rows['reason'] == REASON_CODES['TP'], 'TP', 'SL'),
+            'pnl_usdt': rows['pnl_usdt'],
+            'id': rows['id'],
+        })
+        yield df.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield "No trades\n"
+
+class _StreamSink:
+    # write-only file object for zipfile: collects bytes for the response generator to drain
+    def __init__(self):
+        self.parts = []
+
+    def write(self, b):
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out, self.parts = b''.join(self.parts), []
+        return out
+
+def npz_chunks(scan):
+    # zip written on the fly (no seeking: sizes go into data descriptors); each column is an
+    # .npy member whose header needs the row count, so the matches are counted first
+    total = sum(len(rows) for rows in scan())
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for name in LEDGER_DTYPE.names:
+            dtype = LEDGER_DTYPE[name]
+            with zf.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                np.lib.format.write_array_header_1_0(member, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                             'fortran_order': False, 'shape': (total,)})
+                for rows in scan():
+                    member.write(np.ascontiguousarray(rows[name]).tobytes())
+                    yield sink.drain()
+    yield sink.drain()
+
+@app.route('/export/history.csv')
+def export_history():
+    pf = get_portfolio()
+    start_ms, end_ms, side = _range_args()
+    views = pf.publisher.current().ledger
+    return _export_response(pf, csv_chunks(TradeLedger.scan(views, start_ms, end_ms, side)), 'csv', "text/csv")
+
+@app.route('/export/history.npz')
+def export_history_npz():
+    pf = get_portfolio()
+    start_ms, end_ms, side = _range_args()
+    views = pf.publisher.current().ledger
+    return _export_response(pf, npz_chunks(lambda: TradeLedger.scan(views, start_ms, end_ms, side)),
+                            'npz', "application/octet-stream")
+
+@app.route('/api/stats')
+def api_stats():
+    return app.response_class(get_portfolio().publisher.current().stats, mimetype='application/json')
+
+@app.route('/api/trades')
+def api_trades():
+    # paginated closed-trade history: ?symbol=&offset=&limit=&from=&to=&side=long|short&order=desc|asc
+    # &before=<trade id>: only trades that closed before that one (offset then counts from there)
+    pf = get_portfolio()
+    start_ms, end_ms, side = _range_args()
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(1000, max(1, int(request.args.get('limit', 100))))
+        before_id = int(request.args['before']) if 'before' in request.args else None
+    except ValueError:
+        abort(400)
+    views = pf.publisher.current().ledger
+    before = None if before_id is None else TradeLedger.position(views, before_id)
+    if before_id is not None and before is None:
+        abort(404)
+    total, rows = TradeLedger.page(views, start_ms, end_ms, side, offset, limit,
+                                   newest_first=request.args.get('order', 'desc') != 'asc', before=before)
+    return jsonify({'symbol': pf.symbol, 'total': total, 'offset': offset, 'limit': limit,
+                    'trades': TradeLedger.to_dicts(rows)})
+
+@app.route('/api/history')
+def api_history():
+    # price or equity over any time range at a fixed point budget:
+    # ?symbol=&series=price|equity&from=&to=&points= -> resolution used, LTTB line, OHLC bars
+    pf = get_portfolio()
+    snap = pf.publisher.current()
+    series = {'price': snap.price_history, 'equity': snap.capital_history}.get(request.args.get('series', 'price'))
+    try:
+        start_ms, end_ms = _ms_arg('from'), _ms_arg('to')
+        points = min(history_max_points, max(3, int(request.args.get('points', chart_history_points))))
+    except ValueError:
+        abort(400)
+    if series is None:
+        abort(400)
+    with metrics.timer('http_request_seconds', route='api_history'):
+        res = series.range(start_ms, end_ms, points)
+        return jsonify(dict(res, symbol=pf.symbol, series=request.args.get('series', 'price'), points=points))
+
+@app.route('/api/shadow/leaderboard')
+def api_shadow_leaderboard():
+    # shadow configurations ranked: ?symbol=&sort=pnl|equity|capital|closed|win_rate|max_dd|profit_factor|open&order=desc|asc&limit=
+    pf = get_portfolio()
+    book = shadow_books.get(pf.symbol)
+    if book is None:
+        abort(404)
+    sort = request.args.get('sort', 'pnl')
+    if sort not in ('pnl', 'equity', 'capital', 'closed', 'win_rate', 'max_dd', 'profit_factor', 'open'):
+        abort(400)
+    try:
+        limit = min(1000, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        abort(400)
+    snap = book.snapshot
+    with metrics.timer('http_request_seconds', route='api_shadow_leaderboard'):
+        rows = ShadowBook.leaderboard(book.grid, snap, sort=sort, limit=limit,
+                                      ascending=request.args.get('order', 'desc') == 'asc')
+        return jsonify({'symbol': pf.symbol, 'configs': len(book.grid), 'ticks': snap['ticks'],
+                        'sort': sort, 'rows': rows})
+
+@app.route('/stream')
+def stream():
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('v')
+    try:
+        v = int(last_id) if last_id else None
+    except ValueError:
+        v = None
+    pub = get_portfolio().publisher
+    q = pub.subscribe(v)
+
+    def event_stream():
+        try:
+            while True:
+                try:
+                    frame = q.get(timeout=sse_keepalive)
+                except queue.Empty:
+                    yield ": ping\n\n"   # keep-alive comment, ignored by EventSource
+                    continue
+                if frame is SSEHub.EVICTED:
+                    return
+                yield frame
+        finally:
+            pub.hub.unsubscribe(q)
+    return Response(event_stream(), mimetype="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
+@app.route('/api/stream/stats')
+def stream_stats():
+    hubs = [pf.publisher.hub for pf in portfolios.values()]
+    return jsonify({'subscribers': sum(len(h) for h in hubs), 'evicted': sum(h.evicted for h in hubs),
+                    'published': sum(h.published for h in hubs), 'rss_mb': process_rss_mb(), 'server_mode': SERVER_MODE})
+
+@app.route('/api/feed/stats')
+def feed_stats():
+    return jsonify(dict(tick_latency.summary(), feed=tick_feed_state['feed'], mode=tick_feed_mode))
+
+@app.route('/api/notify/stats')
+def notify_stats():
+    return jsonify(notifier.summary())
+
+def _per_symbol(fn):
+    return lambda: {(('symbol', sym),): fn(pf) for sym, pf in portfolios.items()}
+
+metrics.gauge_fn('portfolio_capital_usdt', "Paper capital", _per_symbol(lambda pf: pf.capital))
+metrics.gauge_fn('portfolio_open_positions', "Open paper positions", _per_symbol(lambda pf: len(pf.positions)))
+metrics.gauge_fn('sse_clients', "Connected /stream clients", _per_symbol(lambda pf: len(pf.publisher.hub)))
+metrics.gauge_fn('notifier_backlog', "Telegram notifications waiting to be sent", lambda: {(): notifier._q.qsize()})
+metrics.gauge_fn('notifier_dropped_total', "Telegram notifications dropped on a full queue",
+                 lambda: {(): notifier.stats['dropped']}, kind='counter')
+metrics.gauge_fn('journal_backlog', "Journal records waiting for the writer thread", lambda: {(): journal_writer._q.qsize()})
+metrics.gauge_fn('tick_decision_p99_seconds', "p99 per-tick TP/SL decision latency (recent ticks)",
+                 lambda: {(): tick_latency.summary().get('p99_us', 0.0) / 1e6})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/debug/profiler')
+def debug_profiler():
+    # ?action=start[&interval=0.005] | stop | dump: collapsed stacks of every thread
+    # the app listens on 0.0.0.0 without auth, so only local clients may drive it (PROFILER_REMOTE=1 lifts that)
+    if not (profiler_remote or ipaddress.ip_address(request.remote_addr or '0.0.0.0').is_loopback):
+        abort(403)
+    action = request.args.get('action', 'dump')
+    if action == 'start':
+        try:
+            profiler.start(float(request.args['interval']) if 'interval' in request.args else None)
+        except ValueError:
+            abort(400)
+    elif action == 'stop':
+        profiler.stop()
+    elif action != 'dump':
+        abort(400)
+    if action != 'dump':
+        return jsonify({'running': profiler.running, 'interval': profiler.interval, 'stacks': len(profiler.samples)})
+    return Response(profiler.dump(), mimetype='text/plain')
+
+# -------------------------
+# === CANDLE STORE ===
+# -------------------------
+# Persistent OHLCV cache per symbol + timeframe. Candles are kept as fixed-width float64
+# rows [ts_ms, open, high, low, close, volume] in a preallocated buffer and mirrored to an
+# append-only binary file, so a restart loads them back in one read. sync() only asks the
+# exchange for candles from the last stored timestamp on: that still-forming candle is
+# patched in place, newer ones are appended. window() hands out views, no copies.
+
+OHLCV_COLUMNS = ['timestamp','open','high','low','close','volume']
+
+def ohlcv_to_df(ohlcv):
+    df = pd.DataFrame(ohlcv, columns=OHLCV_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    df.set_index('timestamp', inplace=True)
+    return df
+
+class CandleStore:
+    ROW_BYTES = 6 * 8
+
+    def __init__(self, sym, timeframe, directory=candle_store_dir, page_limit=1000):
+        self.symbol = sym
+        self.timeframe = timeframe
+        self.tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        self.page_limit = page_limit
+        self.path = os.path.join(directory, f"{sym.replace('/', '')}_{timeframe}.f64") if directory else None
+        self._buf = np.empty((1024, 6), dtype=np.float64)
+        self._n = 0
+        if self.path and os.path.exists(self.path):
+            rows = np.fromfile(self.path, dtype=np.float64)
+            rows = rows[:len(rows) - len(rows) % 6].reshape(-1, 6)   # drop a torn trailing row
+            self._append(rows)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def last_ts(self):
+        return int(self._buf[self._n - 1, 0]) if self._n else None
+
+    def _append(self, rows):
+        need = self._n + len(rows)
+        if need > len(self._buf):
+            grown = np.empty((max(need, len(self._buf) * 2), 6), dtype=np.float64)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+        self._buf[self._n:need] = rows
+        self._n = need
+
+    def _persist(self, first_row):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        mode = 'r+b' if os.path.exists(self.path) else 'wb'
+        with open(self.path, mode) as f:
+            f.seek(first_row * self.ROW_BYTES)
+            f.write(self._buf[first_row:self._n].tobytes())
+            f.truncate()
+
+    def merge(self, ohlcv):
+        # ohlcv: ccxt rows (or an (n, 6) array), ascending. Returns index of the first row that changed.
+        if len(ohlcv) == 0:
+            return self._n
+        rows = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+        first_changed = self._n
+        if self._n:
+            last = self._buf[self._n - 1, 0]
+            same = rows[:, 0] == last
+            if same.any():
+                self._buf[self._n - 1] = rows[same][-1]
+                first_changed = self._n - 1
+            rows = rows[rows[:, 0] > last]
+        if len(rows):
+            self._append(rows)
+        return first_changed
+
+    def sync(self, limit):
+        # fetch only what is missing since the last stored candle (incl. the forming one)
+        first_changed = self._n
+        if not self._n and limit <= self.page_limit:
+            first_changed = min(first_changed, self.merge(exchange_call('fetch_ohlcv', self.symbol, timeframe=self.timeframe, limit=limit)))
+        else:
+            # cold start beyond one page: page forward from `limit` candles ago
+            since = self.last_ts if self._n else exchange.milliseconds() - limit * self.tf_ms
+            while True:
+                missing = (exchange.milliseconds() - since) // self.tf_ms + 2
+                page = int(min(self.page_limit, max(2, missing)))
+                batch = exchange_call('fetch_ohlcv', self.symbol, timeframe=self.timeframe, since=since, limit=page)
+                first_changed = min(first_changed, self.merge(batch))
+                if len(batch) < page or self.last_ts == since:
+                    break
+                since = self.last_ts
+        if first_changed < self._n:
+            self._persist(first_changed)
+
+    def apply_tick(self, ts_ms, price, qty=0.0):
+        # a trade updates the forming candle in place, or opens the next one
+        bar_ts = ts_ms - ts_ms % self.tf_ms
+        if self._n and self._buf[self._n - 1, 0] == bar_ts:
+            row = self._buf[self._n - 1]
+            row[2] = max(row[2], price)
+            row[3] = min(row[3], price)
+            row[4] = price
+            row[5] += qty
+        elif not self._n or bar_ts > self._buf[self._n - 1, 0]:
+            self._append(np.array([[bar_ts, price, price, price, price, qty]]))
+
+    def window(self, limit):
+        return self._buf[max(0, self._n - limit):self._n]
+
+    def window_df(self, limit):
+        rows = self.window(limit)
+        index = pd.DatetimeIndex(pd.to_datetime(rows[:, 0].astype(np.int64), unit='ms', utc=True), name='timestamp')
+        return pd.DataFrame(rows[:, 1:], index=index, columns=OHLCV_COLUMNS[1:], copy=False)
+
+class AggregatedCandles(CandleStore):
+    # higher timeframe rolled up from a base CandleStore (e.g. 30m -> 2h) instead of fetched.
+    # update() re-aggregates only from the first base row of the last bar on: the forming
+    # bar is rewritten in place, completed bars are appended. Buckets are aligned to epoch
+    # multiples of the timeframe, like the exchange's own candles.
+
+    def __init__(self, base, timeframe):
+        super().__init__(base.symbol, timeframe, directory=None)
+        if self.tf_ms % base.tf_ms:
+            raise ValueError(f"{timeframe} is not a multiple of {base.timeframe}")
+        self.base = base
+        self.ratio = self.tf_ms // base.tf_ms
+        self._base_from = 0     # first base row of the last (possibly partial) bar
+
+    def sync(self, limit):
+        self.base.sync((limit + 1) * self.ratio)
+        self.update()
+
+    def update(self):
+        rows = self.base._buf[self._base_from:self.base._n]
+        if not len(rows):
+            return
+        bucket = rows[:, 0] - rows[:, 0] % self.tf_ms
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(rows)] - 1
+        agg = np.column_stack([bucket[starts], rows[starts, 1],
+                               np.maximum.reduceat(rows[:, 2], starts), np.minimum.reduceat(rows[:, 3], starts),
+                               rows[ends, 4], np.add.reduceat(rows[:, 5], starts)])
+        keep = self._n - 1 if self._n and self._buf[self._n - 1, 0] == agg[0, 0] else self._n
+        self._n = keep
+        self._append(agg)
+        self._base_from += int(starts[-1])
+
+def base_limit(timeframe, limit):
+    # base candles needed for `limit` complete bars of `timeframe`
+    ratio = exchange.parse_timeframe(timeframe) // exchange.parse_timeframe(candle_base_timeframe)
+    return (limit + 1) * max(1, ratio)
+
+candle_stores = {}
+
+def get_candle_store(sym, timeframe):
+    key = (sym, timeframe)
+    if key not in candle_stores:
+        if aggregate_candles and timeframe != candle_base_timeframe:
+            candle_stores[key] = AggregatedCandles(get_candle_store(sym, candle_base_timeframe), timeframe)
+        else:
+            candle_stores[key] = CandleStore(sym, timeframe)
+    return candle_stores[key]
+
+def fetch_symbol_candles(sym):
+    # one base-timeframe request per symbol: 2h/30m windows and the latest price all come from
+    # the same stream, so they are consistent with each other by construction
+    base = get_candle_store(sym, candle_base_timeframe)
+    try:
+        base.sync(max(base_limit('2h', fetch_limit_2h), base_limit('30m', fetch_limit_30m)))
+    except Exception as e:
+        print(f"fetch_ohlcv error ({sym} {candle_base_timeframe}):", e)
+        empty = pd.DataFrame(columns=OHLCV_COLUMNS).set_index('timestamp')
+        return empty, empty, None
+    return symbol_frames(sym)
+
+def symbol_frames(sym):
+    # strategy inputs from the (already synced) base store: 2h + 30m windows, latest price
+    base = get_candle_store(sym, candle_base_timeframe)
+    frames = []
+    for timeframe, limit in (('2h', fetch_limit_2h), ('30m', fetch_limit_30m)):
+        store = get_candle_store(sym, timeframe)
+        if store is not base:
+            store.update()
+        frames.append(store.window_df(limit))
+    ticker = {'last': float(base.window(1)[-1, 4])} if len(base) else None
+    return frames[0], frames[1], ticker
+
+class CandleReplay:
+    # recorded base candles per symbol, released into the in-memory candle stores as the clock
+    # passes their close time; fetch() then returns what fetch_symbol_candles() would have
+    def __init__(self, rows_by_sym, timeframe=candle_base_timeframe, warmup=None):
+        self.tf_ms = exchange.parse_timeframe(timeframe) * 1000
+        self.rows = {sym: np.asarray(rows, dtype=np.float64).reshape(-1, 6) for sym, rows in rows_by_sym.items()}
+        warmup = warmup or max(base_limit('2h', fetch_limit_2h), base_limit('30m', fetch_limit_30m))
+        n = min(len(r) for r in self.rows.values())
+        if n <= warmup:
+            raise ValueError(f"replay needs more than {warmup} {timeframe} candles per symbol, got {n}")
+        # starts once a full strategy window is closed, ends with the last close of the shortest series
+        self.start_ms = int(max(r[warmup - 1, 0] for r in self.rows.values())) + self.tf_ms
+        self.end_ms = int(min(r[-1, 0] for r in self.rows.values())) + self.tf_ms
+        self._fed = dict.fromkeys(self.rows, 0)
+        for sym in self.rows:
+            base = candle_stores[(sym, timeframe)] = CandleStore(sym, timeframe, directory=None)
+            for tf in ('2h', '30m'):
+                if tf != timeframe:
+                    candle_stores[(sym, tf)] = AggregatedCandles(base, tf)
+
+    def finished(self, now_ms):
+        return now_ms >= self.end_ms
+
+    def fetch(self, sym, now_ms):
+        rows = self.rows[sym]
+        n = int(np.searchsorted(rows[:, 0], now_ms - self.tf_ms, side='right'))
+        if n > self._fed[sym]:
+            get_candle_store(sym, candle_base_timeframe).merge(rows[self._fed[sym]:n])
+            self._fed[sym] = n
+        return symbol_frames(sym)
+
+def load_replay_rows(directory, sym, timeframe=candle_base_timeframe):
+    # a live run's candle cache (candle_data/*.f64) or `bench --record` fixtures (*.json)
+    name = os.path.join(directory, f"{sym.replace('/', '')}_{timeframe}")
+    if os.path.exists(name + '.f64'):
+        rows = np.fromfile(name + '.f64', dtype=np.float64)
+        return rows[:len(rows) - len(rows) % 6].reshape(-1, 6)
+    with open(name + '.json') as f:
+        return np.asarray(json.load(f), dtype=np.float64)
+
+# -------------------------
+# === STRATEGY HELPERS ===
+# -------------------------
+def fetch_ohlcv_ccxt(timeframe='2h', limit=200, sym=symbol):
+    store = get_candle_store(sym, timeframe)
+    try:
+        store.sync(limit)
+    except Exception as e:
+        print(f"fetch_ohlcv error ({sym} {timeframe}):", e)
+        return pd.DataFrame(columns=OHLCV_COLUMNS).set_index('timestamp')
+    return store.window_df(limit)
+
+def try_enter_from_2h_breakout(df_2h, df_30m, t_trigger_pct, t_fee, extrema=None):
+    # extrema: the portfolio's RollingExtrema, so the 2h window isn't rescanned every tick
+    new_trades = []
+    if len(df_2h) < 2:
+        return new_trades
+
+    ts2h = df_2h.index.as_unit('ms').asi8
+    low2h, high2h = df_2h['low'].to_numpy(), df_2h['high'].to_numpy()
+    current_price_2h = float(df_2h['close'].iat[-1])
+    if extrema is not None:
+        lowest_2h, highest_2h = extrema.sync(ts2h, low2h, high2h)
+    else:
+        lowest_2h, highest_2h = float(low2h[:-1].min()), float(high2h[:-1].max())
+
+    # 30m candles inside (index[-2], index[-1]] of the 2h window
+    ts30 = df_30m.index.as_unit('ms').asi8
+    lo, hi = np.searchsorted(ts30, ts2h[-2:], side='right')
+    side, k, entry_price = score_entries(current_price_2h, lowest_2h, highest_2h,
+                                         df_30m['close'].to_numpy()[lo:hi], t_trigger_pct, t_fee)
+    if k[0] < 0:
+        return new_trades
+    entry_price = float(entry_price[0])
+    new_trades.append({
+        'side': SIDE_NAMES[int(side[0])],
+        'entry_price': entry_price,
+        'entry_time': df_30m.index[lo + int(k[0])].to_pydatetime(),
+        'amount': order_size_usdt / entry_price,
+        'order_size': order_size_usdt,
+        'status': 'open'
+    })
+    return new_trades
+
+def record_capital(pf, ts_ms):
+    pf.capital_history.append(ts_ms, pf.capital)
+    pf.analytics.on_capital(pf.capital)
+    if pf.journal is not None:
+        pf.journal.log_capital(ts_ms, pf.capital)
+
+def close_trade(pf, t, exit_price, exit_time, reason):
+    if t['side']=='long':
+        pnl_usdt = (exit_price - t['entry_price']) * t['order_size'] / t['entry_price']
+    else:
+        pnl_usdt = (t['entry_price'] - exit_price) * t['order_size'] / t['entry_price']
+    t_closed = dict(t)
+    t_closed.update({'exit_price': exit_price, 'exit_time': exit_time, 'close_reason': reason, 'pnl_usdt': pnl_usdt})
+    pf.ledger.append(t_closed)
+    if pf.journal is not None:
+        pf.journal.log_close(t_closed)
+    pf.analytics.on_close(t, pnl_usdt)
+    metrics.inc('trades_closed_total', symbol=pf.symbol, reason=reason)
+    pf.capital += pnl_usdt
+    record_capital(pf, clock.ms())
+    # notify telegram
+    send_telegram_message(f"[{pf.symbol}] Exit {t['side'].upper()} {reason} | Entry: {t['entry_price']:.2f} Exit: {exit_price:.2f} PnL: {pnl_usdt:.2f} USDT")
+    return t_closed
+
+def evaluate_exits_at_price(pf, price, exit_time, t_fee, t_tp, t_sl):
+    # TP/SL check against one price (2h close or a single tick): only crossed positions are touched
+    hits = pf.positions.pop_crossed(price, t_tp, t_sl)
+    for t, reason in hits:
+        exit_price = price * (1 - t_fee if t['side']=='long' else 1 + t_fee)
+        close_trade(pf, t, exit_price, exit_time, reason)
+    return len(hits)
+
+def evaluate_and_close_trades(pf, df_2h, t_fee, t_tp, t_sl):
+    if len(df_2h) == 0:
+        return
+    current_price_2h = float(df_2h['close'].iloc[-1])
+    evaluate_exits_at_price(pf, current_price_2h, df_2h.index[-1].to_pydatetime(), t_fee, t_tp, t_sl)
+
+# -------------------------
+# === TICK FEED ===
+# -------------------------
+# Exits are also evaluated on every incoming trade/ticker price, not only on the 2h close
+# of the minute loop. Feeds are pluggable: run(on_tick) blocks and calls
+# on_tick(symbol, ts_ms, price) per update until stop(). BinanceTradeFeed uses the public
+# websocket trade stream (optional websocket-client package), PollingTickerFeed is the
+# fallback, ReplayFeed plays recorded/synthetic ticks for tests and benchmarks.
+
+class LatencyStats:
+    def __init__(self, size=10000):
+        self.samples = deque(maxlen=size)   # recent per-tick decision times (ns)
+        self.count = 0
+        self.max_ns = 0
+
+    def add(self, ns):
+        self.samples.append(ns)
+        self.count += 1
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def summary(self):
+        arr = np.fromiter(self.samples, dtype=np.int64, count=len(self.samples))
+        if not len(arr):
+            return {'count': self.count}
+        p50, p99 = np.percentile(arr, [50, 99]) / 1000
+        return {'count': self.count, 'p50_us': round(float(p50), 2), 'p99_us': round(float(p99), 2),
+                'max_us': round(self.max_ns / 1000, 2)}
+
+class PriceFeed:
+    name = 'feed'
+
+    def __init__(self):
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, on_tick):
+        raise NotImplementedError
+
+class ReplayFeed(PriceFeed):
+    name = 'replay'
+
+    def __init__(self, ticks, speed=None):
+        # ticks: iterable of (symbol, ts_ms, price); speed None = as fast as possible
+        super().__init__()
+        self.ticks = ticks
+        self.speed = speed
+
+    def run(self, on_tick):
+        prev_ts = None
+        for sym, ts_ms, price in self.ticks:
+            if self._stop.is_set():
+                break
+            if self.speed and prev_ts is not None and ts_ms > prev_ts:
+                time.sleep((ts_ms - prev_ts) / 1000 / self.speed)
+            prev_ts = ts_ms
+            on_tick(sym, ts_ms, price)
+
+class PollingTickerFeed(PriceFeed):
+    name = 'poll'
+
+    def __init__(self, syms, interval=tick_poll_interval):
+        super().__init__()
+        self.syms = list(syms)
+        self.interval = interval
+
+    def run(self, on_tick):
+        while not self._stop.is_set():
+            try:
+                # one request for all symbols
+                tickers = exchange_call('fetch_tickers', self.syms)
+                for sym in self.syms:
+                    t = tickers.get(sym)
+                    if t and t.get('last') is not None:
+                        on_tick(sym, int(t.get('timestamp') or time.time()*1000), float(t['last']))
+            except Exception as e:
+                print("ticker poll error:", e)
+            self._stop.wait(self.interval)
+
+class BinanceTradeFeed(PriceFeed):
+    name = 'ws'
+    url = "wss://stream.binance.com:9443/stream?streams="
+
+    def __init__(self, syms):
+        super().__init__()
+        self.ids = {sym.replace('/', '').upper(): sym for sym in syms}
+
+    def run(self, on_tick):
+        import websocket   # optional: pip install websocket-client
+        streams = '/'.join(f"{mid.lower()}@trade" for mid in self.ids)
+        ws = websocket.create_connection(self.url + streams, timeout=30)
+        try:
+            while not self._stop.is_set():
+                d = json.loads(ws.recv()).get('data', {})
+                sym = self.ids.get(d.get('s'))
+                if sym:
+                    on_tick(sym, int(d['T']), float(d['p']))
+        finally:
+            ws.close()
+
+def make_tick_handler(pfs, stats, t_fee=fee_pct, t_tp=profit_target, t_sl=stop_loss):
+    def on_tick(sym, ts_ms, price):
+        pf = pfs.get(sym)
+        if pf is None:
+            return
+        t0 = time.perf_counter_ns()
+        with pf.lock:
+            closed = evaluate_exits_at_price(pf, price, _ms_to_dt(ts_ms), t_fee, t_tp, t_sl)
+            if closed:
+                pf.publisher.publish()
+        stats.add(time.perf_counter_ns() - t0)      # decision + publish, as the feed sees it
+        book = shadow_books.get(sym)
+        if book is not None:
+            book.on_price(price)
+    return on_tick
+
+tick_latency = LatencyStats()
+tick_feed_state = {'feed': None}
+
+def run_tick_feed(mode=tick_feed_mode):
+    on_tick = make_tick_handler(portfolios, tick_latency)
+    while True:
+        if mode in ('auto', 'ws'):
+            feed = BinanceTradeFeed(symbols)
+            tick_feed_state['feed'] = feed.name
+            try:
+                feed.run(on_tick)
+            except ImportError:
+                print("websocket-client not installed, tick feed falls back to ticker polling")
+                mode = 'poll'
+            except Exception as e:
+                print("tick feed (ws) error:", e)
+        # poll fallback: permanently in 'poll' mode, for a minute after a websocket error otherwise
+        feed = PollingTickerFeed(symbols)
+        tick_feed_state['feed'] = feed.name
+        if mode != 'poll':
+            threading.Timer(60, feed.stop).start()
+        feed.run(on_tick)
+
+# -------------------------
+# === VECTORIZED BACKTEST ===
+# -------------------------
+# Runs the same rules as try_enter_from_2h_breakout + evaluate_and_close_trades over a
+# full OHLCV history. Every 2h candle is treated as one loop tick: it is the "current"
+# candle, the (window_2h - 1) candles before it give lowest/highest, entries are taken
+# first and TP/SL is checked afterwards on the same close (same order as the live loop).
+# Signals and pullback bars are computed as array ops, only accepted entries are walked.
+
+def fetch_ohlcv_history(timeframe, since_ms, until_ms=None, page_limit=1000, sym=symbol):
+    # paginated download for backtests (fetch_ohlcv_ccxt only returns the last `limit` candles)
+    tf_ms = exchange.parse_timeframe(timeframe) * 1000
+    rows = []
+    cursor = since_ms
+    while True:
+        batch = exchange_call('fetch_ohlcv', sym, timeframe=timeframe, since=cursor, limit=page_limit)
+        if not batch:
+            break
+        rows.extend(batch)
+        cursor = batch[-1][0] + tf_ms
+        if len(batch) < page_limit or (until_ms is not None and cursor > until_ms):
+            break
+    df = ohlcv_to_df(rows)
+    df = df[~df.index.duplicated(keep='last')]
+    if until_ms is not None:
+        df = df[df.index <= pd.Timestamp(until_ms, unit='ms', tz='UTC')]
+    return df
+
+def ohlcv_arrays(df_2h, df_30m):
+    # plain numpy columns (epoch ms timestamps) consumed by the backtest core
+    return {
+        't2h': df_2h.index.as_unit('ms').asi8,
+        'low2h': df_2h['low'].to_numpy(dtype=np.float64),
+        'high2h': df_2h['high'].to_numpy(dtype=np.float64),
+        'close2h': df_2h['close'].to_numpy(dtype=np.float64),
+        't30': df_30m.index.as_unit('ms').asi8,
+        'close30': df_30m['close'].to_numpy(dtype=np.float64),
+    }
+
+def breakout_candidates(arrs, t_trigger_pct, t_fee, window_2h=fetch_limit_2h):
+    # one candidate entry per 2h tick at most (try_enter_from_2h_breakout breaks after the first match)
+    t2h, low2h, high2h, close2h = arrs['t2h'], arrs['low2h'], arrs['high2h'], arrs['close2h']
+    t30, close30 = arrs['t30'], arrs['close30']
+    lookback = window_2h - 1             # df_2h['low'][:-1] of a window_2h sized fetch
+    n = len(close2h)
+    empty = np.empty(0, dtype=np.int64)
+    if n <= lookback or lookback < 1 or len(t30) == 0:
+        return empty, empty, np.empty(0), empty
+
+    bars = np.arange(lookback, n)
+    lowest = np.lib.stride_tricks.sliding_window_view(low2h[:-1], lookback).min(axis=1)
+    highest = np.lib.stride_tricks.sliding_window_view(high2h[:-1], lookback).max(axis=1)
+    signal = np.zeros(n, dtype=np.int8)
+    signal[bars] = breakout_side(close2h[bars], lowest, highest, t_trigger_pct)
+
+    # owner[j] = 2h tick whose window (index[-2], index[-1]] contains the 30m candle j
+    owner = np.searchsorted(t2h, t30, side='left')
+    valid = (owner >= lookback) & (owner < n)
+    owner_c = np.where(valid, owner, 0)
+    sig30 = np.where(valid, signal[owner_c], 0)
+    cur30 = close2h[owner_c]
+    hit = ((sig30 == SIDE_LONG) & (close30 <= cur30)) | ((sig30 == SIDE_SHORT) & (close30 >= cur30))
+    hit_idx = np.flatnonzero(hit)
+    cand_bar, first = np.unique(owner[hit_idx], return_index=True)
+    j = hit_idx[first]
+    side = signal[cand_bar].astype(np.int64)
+    entry_price = np.where(side == SIDE_LONG, close30[j] * (1 + t_fee), close30[j] * (1 - t_fee))
+    return cand_bar.astype(np.int64), side, entry_price, t30[j]
+
+def _first_exit_bar(close2h, bar, side, entry_price, t_tp, t_sl):
+    # first tick >= bar where evaluate_and_close_trades would close; scanned in growing chunks
+    n = len(close2h)
+    start, step = bar, 64
+    while start < n:
+        stop = min(n, start + step)
+        px = close2h[start:stop]
+        if side == SIDE_LONG:
+            pnl_pct = (px - entry_price) / entry_price * 100
+        else:
+            pnl_pct = (entry_price - px) / entry_price * 100
+        hit = (pnl_pct >= t_tp) | (pnl_pct <= -t_sl)
+        if hit.any():
+            k = int(np.argmax(hit))
+            return start + k, ('TP' if pnl_pct[k] >= t_tp else 'SL')
+        start, step = stop, step * 4
+    return -1, None
+
+def backtest_core(arrs, t_trigger_pct=trigger_pct, t_fee=fee_pct, t_tp=profit_target, t_sl=stop_loss,
+                  t_max_open=max_open_per_side, t_order_size=order_size_usdt,
+                  t_start_capital=start_capital, window_2h=fetch_limit_2h, candidates=None):
+    # returns closed/open trades as tuples + equity curve; no globals are touched
+    # (candidates only depend on trigger/fee and can be passed in precomputed)
+    t2h, close2h = arrs['t2h'], arrs['close2h']
+    if candidates is None:
+        candidates = breakout_candidates(arrs, t_trigger_pct, t_fee, window_2h)
+    cand_bar, cand_side, cand_price, cand_time = candidates
+
+    cap = t_start_capital
+    equity = [[int(t2h[min(window_2h - 1, len(t2h) - 1)]) if len(t2h) else 0, cap]]
+    open_count = {SIDE_LONG: 0, SIDE_SHORT: 0}
+    pending = []        # heap of (exit_bar, seq, trade) for positions with a known exit
+    still_open = []     # positions that never hit TP/SL within the data
+    closed = []
+
+    def close_until(bar_limit):
+        nonlocal cap
+        while pending and pending[0][0] < bar_limit:
+            exit_bar, _, tr = heapq.heappop(pending)
+            side, entry_t, entry_px, qty, size, reason = tr
+            px = float(close2h[exit_bar])
+            if side == SIDE_LONG:
+                exit_px = px * (1 - t_fee)
+                pnl = (exit_px - entry_px) * size / entry_px
+            else:
+                exit_px = px * (1 + t_fee)
+                pnl = (entry_px - exit_px) * size / entry_px
+            cap += pnl
+            open_count[side] -= 1
+            closed.append((side, entry_t, entry_px, qty, size, int(t2h[exit_bar]), exit_px, reason, pnl))
+            equity.append([int(t2h[exit_bar]), cap])
+
+    for k in range(len(cand_bar)):
+        bar, side = int(cand_bar[k]), int(cand_side[k])
+        # exits of earlier ticks happen before this tick's entries
+        close_until(bar)
+        if cap < t_order_size - 1e-9:
+            continue
+        if open_count[side] >= t_max_open:
+            continue
+        entry_px = float(cand_price[k])
+        tr_exit, reason = _first_exit_bar(close2h, bar, side, entry_px, t_tp, t_sl)
+        tr = (side, int(cand_time[k]), entry_px, t_order_size / entry_px, t_order_size, reason)
+        open_count[side] += 1
+        if tr_exit < 0:
+            still_open.append(tr)
+        else:
+            heapq.heappush(pending, (tr_exit, k, tr))
+    close_until(len(close2h))
+    return closed, still_open, cap, equity
+
+def _ms_to_dt(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+
+def run_backtest(df_2h, df_30m, **params):
+    # closed/open trades as dicts with the live trade fields, equity in the capital_history format
+    closed, still_open, cap, equity = backtest_core(ohlcv_arrays(df_2h, df_30m), **params)
+    side_name = SIDE_NAMES
+    closed_list = [{
+        'side': side_name[side],
+        'entry_price': entry_px,
+        'entry_time': _ms_to_dt(entry_t),
+        'amount': qty,
+        'order_size': size,
+        'status': 'open',
+        'exit_price': exit_px,
+        'exit_time': _ms_to_dt(exit_t),
+        'close_reason': reason,
+        'pnl_usdt': pnl,
+    } for side, entry_t, entry_px, qty, size, exit_t, exit_px, reason, pnl in closed]
+    open_list = [{
+        'side': side_name[side],
+        'entry_price': entry_px,
+        'entry_time': _ms_to_dt(entry_t),
+        'amount': qty,
+        'order_size': size,
+        'status': 'open',
+    } for side, entry_t, entry_px, qty, size, _ in still_open]
+    return {'capital': cap, 'closed_trades': closed_list, 'open_trades': open_list, 'capital_history': equity}
+
+# -------------------------
+# === PARAMETER SWEEP ===
+# -------------------------
+# Evaluates many parameter sets with backtest_core on a process pool. The OHLCV columns
+# are copied once into shared memory; workers attach read-only views instead of getting
+# the arrays pickled with every task.
+
+SWEEP_PARAMS = ('t_trigger_pct', 't_fee', 't_tp', 't_sl', 't_max_open', 't_order_size')  # product order: (trigger, fee) varies slowest
+
+_sweep_arrs = None
+_sweep_shm = []
+_sweep_cand_cache = {}
+
+def _sweep_share_arrays(arrs):
+    spec, blocks = {}, []
+    for name, arr in arrs.items():
+        arr = np.ascontiguousarray(arr)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        spec[name] = (shm.name, arr.shape, arr.dtype.str)
+        blocks.append(shm)
+    return spec, blocks
+
+def _sweep_worker_init(spec):
+    global _sweep_arrs
+    _sweep_arrs = {}
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        view.flags.writeable = False
+        _sweep_arrs[name] = view
+        _sweep_shm.append(shm)
+
+def summarize_backtest(closed, cap, equity, t_start_capital):
+    pnl = [x[-1] for x in closed]
+    wins = sum(1 for x in pnl if x > 0)
+    eq = np.array([p[1] for p in equity], dtype=np.float64)
+    peak = np.maximum.accumulate(eq) if len(eq) else eq
+    max_dd = float(((peak - eq) / peak * 100).max()) if len(eq) else 0.0
+    return {
+        'pnl_usdt': cap - t_start_capital,
+        'capital': cap,
+        'trades': len(closed),
+        'win_rate': (wins/len(closed)*100) if closed else 0.0,
+        'max_dd': max_dd,
+    }
+
+def _sweep_worker_run(params):
+    key = (params['t_trigger_pct'], params['t_fee'])
+    cands = _sweep_cand_cache.get(key)
+    if cands is None:
+        if len(_sweep_cand_cache) > 64:
+            _sweep_cand_cache.clear()
+        cands = breakout_candidates(_sweep_arrs, params['t_trigger_pct'], params['t_fee'])
+        _sweep_cand_cache[key] = cands
+    closed, _, cap, equity = backtest_core(_sweep_arrs, candidates=cands, **params)
+    row = dict(params)
+    row.update(summarize_backtest(closed, cap, equity, params.get('t_start_capital', start_capital)))
+    return row
+
+SWEEP_DEFAULTS = {'t_trigger_pct': trigger_pct, 't_tp': profit_target, 't_sl': stop_loss,
+                  't_max_open': max_open_per_side, 't_fee': fee_pct, 't_order_size': order_size_usdt}
+
+def sweep_grid(**values):
+    # cartesian product, ordered so equal (trigger, fee) pairs land next to each other;
+    # parameters not given stay at the live config values
+    axes = [values.get(n, [SWEEP_DEFAULTS[n]]) for n in SWEEP_PARAMS]
+    return [dict(zip(SWEEP_PARAMS, combo)) for combo in itertools.product(*axes)]
+
+def run_parameter_sweep(df_2h, df_30m, grid, workers=None, chunksize=16):
+    arrs = ohlcv_arrays(df_2h, df_30m)
+    spec, blocks = _sweep_share_arrays(arrs)
+    try:
+        with multiprocessing.Pool(processes=workers or os.cpu_count(),
+                                  initializer=_sweep_worker_init, initargs=(spec,)) as pool:
+            rows = list(pool.imap_unordered(_sweep_worker_run, grid, chunksize=chunksize))
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+    df = pd.DataFrame(rows)
+    if df.empty:
+        return df
+    df = df.sort_values(['pnl_usdt', 'max_dd'], ascending=[False, True]).reset_index(drop=True)
+    df.index += 1
+    df.index.name = 'rank'
+    return df
+
+# -------------------------
+# === SHADOW PORTFOLIOS ===
+# -------------------------
+# Many strategy configurations paper-traded on the candles the live loop already fetched.
+# One ShadowBook per symbol holds every configuration as a row: capital and stats are
+# (C,) arrays, open positions live in (C, slots) arrays. Per tick, score_entries() finds
+# the entries of all rows at once and one comparison over all open slots finds the exits,
+# so C configurations cost no extra requests or threads. Rules are the live ones
+# (try_enter_from_2h_breakout, capital and pyramiding checks, pnl_pct TP/SL, fees), and
+# closes are applied in open order, so a row with the live parameters tracks the live
+# portfolio exactly. Readers get an immutable snapshot of the arrays swapped in per tick.
+
+SHADOW_KEYS = {'trigger': 't_trigger_pct', 'tp': 't_tp', 'sl': 't_sl', 'max_open': 't_max_open',
+               'fee': 't_fee', 'size': 't_order_size'}
+
+def parse_shadow_grid(text):
+    # "trigger=1:3:0.25;tp=4,6,8,10;sl=1,2,3" (sweep value syntax) -> list of config dicts
+    values = {}
+    for part in filter(None, (p.strip() for p in text.split(';'))):
+        key, _, spec = part.partition('=')
+        if key.strip() not in SHADOW_KEYS:
+            raise ValueError(f"unknown shadow parameter {key!r}, use {', '.join(SHADOW_KEYS)}")
+        name = SHADOW_KEYS[key.strip()]
+        values[name] = parse_sweep_values(spec, int if name == 't_max_open' else float)
+    return sweep_grid(**values)
+
+class ShadowBook:
+    def __init__(self, sym, grid, capital=start_capital):
+        self.symbol = sym
+        self.grid = grid
+        col = lambda name, dtype=np.float64: np.array([g[name] for g in grid], dtype=dtype)
+        self.trigger, self.tp, self.sl = col('t_trigger_pct'), col('t_tp'), col('t_sl')
+        self.fee, self.size, self.max_open = col('t_fee'), col('t_order_size'), col('t_max_open', np.int64)
+        n, slots = len(grid), 2 * int(self.max_open.max())
+        self.capital = np.full(n, float(capital))
+        self.active = np.zeros((n, slots), dtype=bool)
+        self.side = np.zeros((n, slots), dtype=np.int8)
+        self.entry = np.ones((n, slots))
+        self.order_size = np.zeros((n, slots))
+        self.seq = np.zeros((n, slots), dtype=np.int64)      # open order, for closing in sequence
+        self.counts = np.zeros((n, 2), dtype=np.int64)       # open longs, shorts
+        self.closed = np.zeros(n, dtype=np.int64)
+        self.wins = np.zeros(n, dtype=np.int64)
+        self.gross_profit = np.zeros(n)
+        self.gross_loss = np.zeros(n)
+        self.peak = self.capital.copy()
+        self.max_dd = np.zeros(n)
+        self.extrema = RollingExtrema()
+        self.last_price = None
+        self.ticks = 0
+        self._next_seq = 0
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self._swap()
+
+    def tick(self, df_2h, df_30m):
+        # one candle-loop iteration: entries, then exits on the 2h close (as run_symbol_tick)
+        if len(df_2h) == 0:
+            return
+        with self.lock:
+            if len(df_2h) >= 2:
+                self._entries(df_2h, df_30m)
+            self._exits(float(df_2h['close'].iat[-1]))
+            self.ticks += 1
+            self._swap()
+
+    def on_price(self, price):
+        # exits on a single tick price (tick feed)
+        with self.lock:
+            if self.active.any() and self._exits(price):
+                self._swap()
+
+    def _entries(self, df_2h, df_30m):
+        ts2h = df_2h.index.as_unit('ms').asi8
+        lowest, highest = self.extrema.sync(ts2h, df_2h['low'].to_numpy(), df_2h['high'].to_numpy())
+        ts30 = df_30m.index.as_unit('ms').asi8
+        lo, hi = np.searchsorted(ts30, ts2h[-2:], side='right')
+        side, k, price = score_entries(float(df_2h['close'].iat[-1]), lowest, highest,
+                                       df_30m['close'].to_numpy()[lo:hi], self.trigger, self.fee)
+        col = np.where(side == SIDE_LONG, 0, 1)
+        rows = np.flatnonzero((k >= 0) & (self.capital >= self.size - 1e-9)
+                              & (self.counts[np.arange(len(side)), col] < self.max_open))
+        if not len(rows):
+            return
+        slot = np.argmin(self.active[rows], axis=1)           # first free slot per row
+        self.active[rows, slot] = True
+        self.side[rows, slot] = side[rows]
+        self.entry[rows, slot] = price[rows]
+        self.order_size[rows, slot] = self.size[rows]
+        self.seq[rows, slot] = self._next_seq + np.arange(len(rows))
+        self._next_seq += len(rows)
+        self.counts[rows, col[rows]] += 1
+
+    def _exits(self, price):
+        self.last_price = price
+        r, c = np.nonzero(self.active)
+        if not len(r):
+            return 0
+        e, long_ = self.entry[r, c], self.side[r, c] == SIDE_LONG
+        pnl_pct = np.where(long_, (price - e) / e * 100, (e - price) / e * 100)
+        tp_hit = pnl_pct >= self.tp[r]
+        hit = tp_hit | (pnl_pct <= -self.sl[r])
+        if not hit.any():
+            return 0
+        r, c, e, long_, tp_hit = r[hit], c[hit], e[hit], long_[hit], tp_hit[hit]
+        exit_price = np.where(long_, price * (1 - self.fee[r]), price * (1 + self.fee[r]))
+        size = self.order_size[r, c]
+        pnl = np.where(long_, (exit_price - e) * size / e, (e - exit_price) * size / e)
+        self.active[r, c] = False
+        np.subtract.at(self.counts, (r, np.where(long_, 0, 1)), 1)
+        n = len(self.capital)
+        self.closed += np.bincount(r, minlength=n)
+        self.wins += np.bincount(r[pnl > 0], minlength=n)
+        self.gross_profit += np.bincount(r, weights=np.where(pnl > 0, pnl, 0.0), minlength=n)
+        self.gross_loss -= np.bincount(r, weights=np.where(pnl > 0, 0.0, pnl), minlength=n)
+        # capital path per row in open order: column 0 = capital before, then one close per column
+        order = np.lexsort((self.seq[r, c], r))
+        r, pnl = r[order], pnl[order]
+        rows, first, per_row = np.unique(r, return_index=True, return_counts=True)
+        path = np.full((len(rows), per_row.max() + 1), np.nan)
+        path[:, 0] = self.capital[rows]
+        path[np.repeat(np.arange(len(rows)), per_row), np.arange(len(r)) - np.repeat(first, per_row) + 1] = pnl
+        path = np.cumsum(path, axis=1)      # same summation order as capital += pnl per close
+        peak = np.fmax.accumulate(np.column_stack([self.peak[rows], path[:, 1:]]), axis=1)
+        dd = (peak - path) / peak * 100
+        self.capital[rows] = path[np.arange(len(rows)), per_row]
+        self.peak[rows] = np.fmax(peak[:, -1], self.peak[rows])
+        self.max_dd[rows] = np.fmax(self.max_dd[rows], np.nanmax(dd[:, 1:], axis=1))
+        return len(r)
+
+    def _swap(self):
+        # caller holds self.lock (or is __init__)
+        px = self.last_price
+        unreal = 0.0
+        if px is not None:
+            e = self.entry
+            unreal = np.where(self.active, np.where(self.side == SIDE_LONG, px - e, e - px) * self.order_size / e, 0.0).sum(axis=1)
+        self.snapshot = {'ticks': self.ticks, 'capital': self.capital.copy(), 'equity': self.capital + unreal,
+                         'closed': self.closed.copy(), 'wins': self.wins.copy(), 'max_dd': self.max_dd.copy(),
+                         'gross_profit': self.gross_profit.copy(), 'gross_loss': self.gross_loss.copy(),
+                         'open': self.counts.sum(axis=1)}
+
+    @staticmethod
+    def leaderboard(grid, snap, capital=start_capital, sort='pnl', limit=50, ascending=False):
+        closed, gl = snap['closed'], snap['gross_loss']
+        cols = {
+            'pnl': snap['capital'] - capital,
+            'equity': snap['equity'],
+            'capital': snap['capital'],
+            'closed': closed,
+            'win_rate': np.divide(snap['wins'] * 100.0, closed, out=np.zeros(len(closed)), where=closed > 0),
+            'max_dd': snap['max_dd'],
+            'profit_factor': np.divide(snap['gross_profit'], gl, out=np.full(len(gl), np.nan), where=gl > 0),
+            'open': snap['open'],
+        }
+        key = np.nan_to_num(cols[sort], nan=np.inf)
+        order = np.argsort(key if ascending else -key, kind='stable')[:limit]
+        rows = []
+        for rank, i in enumerate(order.tolist(), 1):
+            row = {'rank': rank, 'config': i, **{k[2:]: v for k, v in grid[i].items()}}
+            row.update({k: (None if np.isnan(v[i]) else float(v[i])) if v.dtype.kind == 'f' else int(v[i])
+                        for k, v in cols.items()})
+            rows.append(row)
+        return rows
+
+shadow_books = {}    # symbol -> ShadowBook, filled by enable_shadow()
+
+def enable_shadow(spec):
+    grid = parse_shadow_grid(spec)
+    for sym in symbols:
+        shadow_books[sym] = ShadowBook(sym, grid)
+    print(f"[SHADOW] {len(grid)} configurations per symbol on {', '.join(symbols)}")
+
+# -------------------------
+# === MAIN PAPER-TRADING LOOP ===
+# -------------------------
+def record_price(pf, ts_ms, price):
+    pf.price_history.append(ts_ms, price)
+    pf.indicators.update(ts_ms, price)
+
+market_replay = None   # CandleReplay in replay mode: candles come from recorded data, not the exchange
+
+def fetch_market_data(syms):
+    # all requests of one tick go out concurrently through the pooled executor; the shared
+    # token bucket keeps the total request rate inside the exchange limits. With
+    # aggregate_candles that is one base-candle request per symbol, else 2h + 30m + ticker.
+    def ticker(sym):
+        try:
+            return exchange_call('fetch_ticker', sym)
+        except Exception as e:
+            print(f"fetch_ticker error ({sym}):", e)
+            return None
+    def timed(stage, fn, *args):
+        with metrics.timer('bot_stage_seconds', stage=stage):
+            return fn(*args)
+    if market_replay is not None:
+        now_ms = clock.ms()
+        return {sym: timed('fetch_candles', market_replay.fetch, sym, now_ms) for sym in syms}
+    if aggregate_candles:
+        jobs = {sym: fetch_pool.submit(timed, 'fetch_candles', fetch_symbol_candles, sym) for sym in syms}
+        return {sym: fut.result() for sym, fut in jobs.items()}
+    jobs = {}
+    for sym in syms:
+        jobs[sym] = (fetch_pool.submit(timed, 'fetch_2h', fetch_ohlcv_ccxt, '2h', fetch_limit_2h, sym),
+                     fetch_pool.submit(timed, 'fetch_30m', fetch_ohlcv_ccxt, '30m', fetch_limit_30m, sym),
+                     fetch_pool.submit(timed, 'ticker', ticker, sym))
+    return {sym: tuple(f.result() for f in futs) for sym, futs in jobs.items()}
+
+def run_symbol_tick(pf, df_2h, df_30m, ticker):
+    with pf.lock:
+        # get latest price from ticker (more granular)
+        if ticker is not None and ticker.get('last') is not None:
+            latest_price = float(ticker['last'])
+            ts_ms = clock.ms()
+        elif not df_30m.empty:
+            latest_price = float(df_30m['close'].iloc[-1])
+            ts_ms = int(df_30m.index[-1].timestamp()*1000)
+        else:
+            return
+
+        record_price(pf, ts_ms, latest_price)
+
+        # 1) entries
+        with metrics.timer('bot_stage_seconds', stage='entries'):
+            new_candidates = try_enter_from_2h_breakout(df_2h, df_30m, trigger_pct, fee_pct, pf.extrema)
+            for c in new_candidates:
+                # check capital sufficiency
+                if pf.capital < order_size_usdt - 1e-9:
+                    print(f"[{pf.symbol}] Insufficient capital for order_size_usdt, skipping entry.")
+                    metrics.inc('entries_skipped_total', symbol=pf.symbol, reason='capital')
+                    continue
+                side = c['side']
+                if pf.positions.count(side) < max_open_per_side:
+                    # open trade (paper)
+                    c['id'] = next(trade_ids)
+                    pf.positions.add(c)
+                    pf.analytics.on_open(c)
+                    if pf.journal is not None:
+                        pf.journal.log_open(c)
+                    metrics.inc('trades_opened_total', symbol=pf.symbol, side=side)
+                    send_telegram_message(f"[{pf.symbol}] OPEN {c['side'].upper()} Entry: {c['entry_price']:.2f} | Size: {c['order_size']:.2f} USDT")
+                    # capital remains until close (we don't deduct margin here; paper logic)
+                else:
+                    print(f"[{pf.symbol}] Pyramiding limit reached for {side}, skip.")
+                    metrics.inc('entries_skipped_total', symbol=pf.symbol, reason='pyramiding')
+
+        # 2) evaluate and close
+        with metrics.timer('bot_stage_seconds', stage='exits'):
+            evaluate_and_close_trades(pf, df_2h, fee_pct, profit_target, stop_loss)
+
+        # 3) one versioned state per tick for /api/state + /stream
+        with metrics.timer('bot_stage_seconds', stage='publish'):
+            pf.publisher.publish()
+
+        # 4) compact snapshot once enough journal records piled up (written by the journal thread)
+        if pf.journal is not None and pf.journal.snapshot_due():
+            pf.journal.snapshot(pf)
+
+def run_live_paper_bot():
+    global last_status_update
+
+    print(f"Starting live paper bot loop (Binance public data) — strategy exact — {', '.join(symbols)}")
+    send_telegram_message("Paper bot started (paper mode) — strategy active.") if TELEGRAM_TOKEN else None
+
+    last_start = None
+    errors = 0          # consecutive failed iterations, for the backoff below
+    last_status_update = clock.now()
+    while market_replay is None or not market_replay.finished(clock.ms()):
+        try:
+            tick_start = clock.time()
+            if last_start is not None:
+                metrics.set('bot_loop_drift_seconds', tick_start - last_start - loop_sleep)
+            last_start = tick_start
+            t0 = time.perf_counter()
+            if market_replay is None and not exchange.markets:
+                exchange_call('load_markets')
+            market = fetch_market_data(symbols)
+            for sym, (df_2h, df_30m, ticker) in market.items():
+                try:
+                    run_symbol_tick(portfolios[sym], df_2h, df_30m, ticker)
+                    if sym in shadow_books:
+                        with metrics.timer('bot_stage_seconds', stage='shadow'):
+                            shadow_books[sym].tick(df_2h, df_30m)
+                except Exception as e:
+                    print(f"ERROR {sym}:", e)
+                    metrics.inc('bot_errors_total', symbol=sym)
+            metrics.observe('bot_loop_seconds', time.perf_counter() - t0)
+            metrics.inc('bot_loop_iterations_total')
+
+            # periodic status
+            now = clock.now()
+            if (now - last_status_update).total_seconds() >= 15*60:
+                for pf in portfolios.values():
+                    print(f"[STATUS {now.isoformat()}] {pf.symbol} Capital: {pf.capital:.2f} | Open trades: {len(pf.positions)} | Closed trades: {len(pf.ledger)}")
+                last_status_update = now
+
+            errors = 0
+            clock.sleep(max(0.0, loop_sleep - (clock.time() - tick_start)))
+        except Exception as e:
+            print("ERROR main loop:", e)
+            metrics.inc('bot_errors_total', symbol='*')
+            errors += 1
+            # back off (jittered, growing up to loop_sleep) and wait out an open circuit breaker
+            clock.sleep(max(breaker.retry_in(), 1.0 + backoff_delay(errors, base=1.0, cap=loop_sleep)))
+
+# -------------------------
+# === BACKTEST CLI ===
+# -------------------------
+def run_backtest_cli(args):
+    since_ms = exchange.parse8601(args.since + 'T00:00:00Z')
+    until_ms = exchange.parse8601(args.until + 'T00:00:00Z') if args.until else None
+    print(f"Downloading {args.symbol} 2h/30m candles since {args.since} ...")
+    df_2h = fetch_ohlcv_history('2h', since_ms, until_ms, sym=args.symbol)
+    df_30m = fetch_ohlcv_history('30m', since_ms, until_ms, sym=args.symbol)
+
+    t0 = time.perf_counter()
+    res = run_backtest(df_2h, df_30m)
+    elapsed = time.perf_counter() - t0
+
+    closed = res['closed_trades']
+    wins = sum(1 for x in closed if x['pnl_usdt'] > 0)
+    win_rate = (wins/len(closed)*100) if closed else 0.0
+    print(f"[BACKTEST] {len(df_2h)} x 2h / {len(df_30m)} x 30m candles in {elapsed*1000:.1f} ms")
+    print(f"[BACKTEST] Capital: {res['capital']:.2f} | Closed: {len(closed)} | Open: {len(res['open_trades'])} | Winrate: {win_rate:.2f}%")
+    if args.out:
+        pd.DataFrame(closed).to_csv(args.out, index=False)
+        print("Trade ledger written to", args.out)
+
+def parse_sweep_values(text, cast=float):
+    # "1,1.5,2" or "start:stop:step" (stop inclusive)
+    if ':' in text:
+        start, stop, step = (float(x) for x in text.split(':'))
+        return [cast(round(v, 10)) for v in np.arange(start, stop + step/2, step)]
+    return [cast(x) for x in text.split(',') if x]
+
+def run_sweep_cli(args):
+    since_ms = exchange.parse8601(args.since + 'T00:00:00Z')
+    until_ms = exchange.parse8601(args.until + 'T00:00:00Z') if args.until else None
+    print(f"Downloading {args.symbol} 2h/30m candles since {args.since} ...")
+    df_2h = fetch_ohlcv_history('2h', since_ms, until_ms, sym=args.symbol)
+    df_30m = fetch_ohlcv_history('30m', since_ms, until_ms, sym=args.symbol)
+
+    grid = sweep_grid(t_trigger_pct=parse_sweep_values(args.trigger),
+                      t_fee=parse_sweep_values(args.fee),
+                      t_tp=parse_sweep_values(args.tp),
+                      t_sl=parse_sweep_values(args.sl),
+                      t_max_open=parse_sweep_values(args.max_open, int),
+                      t_order_size=parse_sweep_values(args.size))
+    t0 = time.perf_counter()
+    res = run_parameter_sweep(df_2h, df_30m, grid, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"[SWEEP] {len(grid)} combinations in {elapsed:.2f} s")
+    print(res.head(args.top).to_string())
+    if args.out:
+        res.to_csv(args.out)
+        print("Ranking written to", args.out)
+
+# -------------------------
+# === SSE LOAD TEST ===
+# -------------------------
+# Starts the dashboard in a child process (no exchange access, synthetic ticks every
+# --interval s) and ramps up idle /stream connections from one asyncio loop. For every
+# step it reports server RSS and publish->receive latency of the broadcast frames.
+
+def _raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _loadtest_server(port, interval):
+    _raise_fd_limit()
+
+    pf = portfolios[symbols[0]]
+
+    def synthetic_ticks():
+        rng = np.random.default_rng(0)
+        px = 30000.0
+        while True:
+            px *= 1 + rng.normal(0, 0.0005)
+            record_price(pf, int(time.time()*1000), px)
+            pf.publisher.publish()
+            time.sleep(interval)
+    threading.Thread(target=synthetic_ticks, daemon=True).start()
+    serve_app(port)
+
+async def _sse_client(host, port, sink):
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        sink['failed'] += 1
+        return
+    writer.write(f"GET /stream HTTP/1.0\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    sink['connected'] += 1
+    try:
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data: '):
+                msg = json.loads(line[6:])
+                if 'published_ms' in msg:
+                    sink['latency_ms'].append(time.time()*1000 - msg['published_ms'])
+    except (OSError, ValueError):
+        pass
+    finally:
+        sink['connected'] -= 1
+        writer.close()
+
+async def _sse_loadtest(host, port, steps, hold):
+    sink = {'connected': 0, 'failed': 0, 'latency_ms': []}
+    tasks, rows = [], []
+    for n in steps:
+        while len(tasks) < n:
+            tasks.append(asyncio.create_task(_sse_client(host, port, sink)))
+            if len(tasks) % 100 == 0:
+                await asyncio.sleep(0.05)       # don't overflow the accept backlog
+        await asyncio.sleep(1.0)
+        sink['latency_ms'] = []
+        await asyncio.sleep(hold)
+        lat = np.array(sink['latency_ms']) if sink['latency_ms'] else np.zeros(1)
+        srv = await asyncio.to_thread(lambda: requests.get(f"http://{host}:{port}/api/stream/stats", timeout=10).json())
+        rows.append({'clients': n, 'connected': sink['connected'], 'failed': sink['failed'],
+                     'subscribers': srv['subscribers'], 'evicted': srv['evicted'], 'rss_mb': round(srv['rss_mb'], 1),
+                     'lat_p50_ms': round(float(np.percentile(lat, 50)), 2),
+                     'lat_p99_ms': round(float(np.percentile(lat, 99)), 2), 'frames': len(sink['latency_ms'])})
+        print(rows[-1])
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return rows
+
+def run_sse_loadtest_cli(args):
+    _raise_fd_limit()
+    os.environ['SERVER_MODE'] = args.server_mode      # picked up by the spawned child on import
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(target=_loadtest_server, args=(args.port, args.interval), daemon=True)
+    proc.start()
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"http://127.0.0.1:{args.port}/api/stream/stats", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.2)
+        steps = [int(x) for x in args.clients.split(',')]
+        rows = asyncio.run(_sse_loadtest('127.0.0.1', args.port, steps, args.hold))
+        print(pd.DataFrame(rows).to_string(index=False))
+    finally:
+        proc.terminate()
+        proc.join(5)
+
+# -------------------------
+# === STATE STRESS TEST ===
+# -------------------------
+# Dashboard in a child process on a bench portfolio whose writer thread ticks every
+# --interval s (price, capital, an opened and a closed trade every few ticks, publish).
+# Open-loop readers, each at --rate requests/s, fetch /api/state; for every concurrency
+# step it reports reader latency percentiles, the writer's tick time, and how many
+# bodies were inconsistent (not valid JSON, or a version that doesn't match the ETag).
+
+def _stress_server(port, n_closed, interval):
+    pf = bench_portfolio(n_closed)
+    portfolios[pf.symbol] = pf
+    ids = itertools.count(n_closed + len(pf.positions) + 1)
+    writer = {'stats': LatencyStats()}
+
+    def ticks():
+        rng = np.random.default_rng(1)
+        px = pf.price_history.last[1]
+        for k in itertools.count():
+            t0 = time.perf_counter_ns()
+            with pf.lock:
+                px *= 1 + rng.normal(0, 0.001)
+                now = int(time.time()*1000)
+                record_price(pf, now, px)
+                if k % 5 == 0:
+                    t = {'id': next(ids), 'side': 'long' if k % 10 else 'short', 'entry_price': px,
+                         'entry_time': _ms_to_dt(now), 'amount': order_size_usdt / px,
+                         'order_size': order_size_usdt, 'status': 'open'}
+                    pf.positions.add(t)
+                    pf.analytics.on_open(t)
+                    oldest = pf.positions.remove(next(iter(pf.positions))['id'])
+                    close_trade(pf, oldest, px, _ms_to_dt(now), 'TP' if rng.random() < 0.5 else 'SL')
+                pf.publisher.publish()
+            writer['stats'].add(time.perf_counter_ns() - t0)
+            time.sleep(interval)
+
+    def writer_stats():
+        stats, writer['stats'] = writer['stats'], LatencyStats()
+        return jsonify(stats.summary())
+
+    app.add_url_rule('/api/stress/writer', 'stress_writer', writer_stats)
+    threading.Thread(target=ticks, daemon=True).start()
+    serve_app(port)
+
+async def _state_reader(host, port, path, rate, until, sink):
+    loop = asyncio.get_running_loop()
+    next_at = loop.time() + random.uniform(0, 1 / rate)
+    last_version = 0
+    while next_at < until:
+        await asyncio.sleep(max(0.0, next_at - loop.time()))
+        next_at += 1 / rate
+        t0 = time.perf_counter()
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(f"GET {path} HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+            raw = await reader.read()
+            writer.close()
+        except OSError:
+            sink['errors'] += 1
+            continue
+        sink['latency_ms'].append((time.perf_counter() - t0) * 1000)
+        head, _, body = raw.partition(b'\r\n\r\n')
+        etag = next((line.split(b':', 1)[1].strip().strip(b'"') for line in head.split(b'\r\n')
+                     if line.lower().startswith(b'etag:')), b'')
+        try:
+            version = json.loads(body)['version']
+            ok = str(version).encode() == etag and version >= last_version
+            last_version = version
+        except (ValueError, KeyError):
+            ok = False
+        sink['inconsistent'] += not ok
+
+async def _state_stress(host, port, steps, rate, hold):
+    path = f"/api/state?symbol={urllib.parse.quote('BENCH/USDT')}"
+    warmup = {'latency_ms': [], 'errors': 0, 'inconsistent': 0}
+    await _state_reader(host, port, path, 10.0, asyncio.get_running_loop().time() + 1.0, warmup)
+    rows = []
+    for n in steps:
+        await asyncio.to_thread(requests.get, f"http://{host}:{port}/api/stress/writer", timeout=10)
+        sink = {'latency_ms': [], 'errors': 0, 'inconsistent': 0}
+        until = asyncio.get_running_loop().time() + hold
+        await asyncio.gather(*(_state_reader(host, port, path, rate, until, sink) for _ in range(n)))
+        w = await asyncio.to_thread(lambda: requests.get(f"http://{host}:{port}/api/stress/writer", timeout=10).json())
+        lat = np.array(sink['latency_ms']) if sink['latency_ms'] else np.zeros(1)
+        rows.append({'readers': n, 'requests': len(sink['latency_ms']), 'errors': sink['errors'],
+                     'inconsistent': sink['inconsistent'],
+                     'p50_ms': round(float(np.percentile(lat, 50)), 2), 'p99_ms': round(float(np.percentile(lat, 99)), 2),
+                     'max_ms': round(float(lat.max()), 2), 'writer_ticks': w.get('count', 0),
+                     'writer_p99_us': w.get('p99_us')})
+        print(rows[-1])
+    return rows
+
+def run_state_stress_cli(args):
+    _raise_fd_limit()
+    os.environ['SERVER_MODE'] = args.server_mode      # picked up by the spawned child on import
+    ctx = multiprocessing.get_context('spawn')
+    proc = ctx.Process(target=_stress_server, args=(args.port, args.closed, args.interval), daemon=True)
+    proc.start()
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"http://127.0.0.1:{args.port}/api/stream/stats", timeout=1)
+                break
+            except requests.RequestException:
+                time.sleep(0.2)
+        steps = [int(x) for x in args.readers.split(',')]
+        rows = asyncio.run(_state_stress('127.0.0.1', args.port, steps, args.rate, args.hold))
+        print(pd.DataFrame(rows).to_string(index=False))
+    finally:
+        proc.terminate()
+        proc.join(5)
+
+# -------------------------
+# === TICK FEED BENCH ===
+# -------------------------
+def run_feed_bench_cli(args):
+    # replays a synthetic random walk through the tick handler against `positions` open trades
+    rng = np.random.default_rng(args.seed)
+    pf = Portfolio('BENCH/USDT', capital=1e12)
+    start_px = 30000.0
+    entry = start_px * (1 + rng.normal(0, 0.02, args.positions))
+    now = datetime.now(timezone.utc)
+    for i, e in enumerate(entry):
+        t = {'id': i, 'side': 'long' if i % 2 else 'short', 'entry_price': float(e),
+             'entry_time': now, 'amount': order_size_usdt / e, 'order_size': order_size_usdt, 'status': 'open'}
+        pf.positions.add(t)
+        pf.analytics.on_open(t)
+    prices = start_px * np.exp(np.cumsum(rng.normal(0, 0.0002, args.ticks)))
+    ts0 = int(time.time()*1000)
+    ticks = (('BENCH/USDT', ts0 + k * 100, float(px)) for k, px in enumerate(prices))
+    stats = LatencyStats(size=args.ticks)
+    t0 = time.perf_counter()
+    ReplayFeed(ticks).run(make_tick_handler({'BENCH/USDT': pf}, stats))
+    elapsed = time.perf_counter() - t0
+    print(f"[FEED-BENCH] {args.ticks} ticks, {args.positions} positions -> {len(pf.ledger)} closed, {len(pf.positions)} open in {elapsed:.2f} s")
+    print("[FEED-BENCH] per-tick decision latency:", stats.summary())
+
+# -------------------------
+# === JOURNAL BENCH ===
+# -------------------------
+def _journal_workload(pf, rng, n_trades=None):
+    # synthetic trade flow through the live code paths: open, close (FIFO beyond the
+    # pyramiding limit), capital points, snapshots
+    now = datetime.now(timezone.utc)
+    k = 0
+    while n_trades is None or k < n_trades:
+        price = 30000.0 * (1 + rng.normal(0, 0.02))
+        t = {'id': next(trade_ids), 'side': 'long' if rng.random() < 0.5 else 'short', 'entry_price': price,
+             'entry_time': now, 'amount': order_size_usdt / price, 'order_size': order_size_usdt, 'status': 'open'}
+        with pf.lock:
+            record_price(pf, int(time.time()*1000), price)
+            pf.positions.add(t)
+            pf.analytics.on_open(t)
+            pf.journal.log_open(t)
+            if len(pf.positions) > max_open_per_side:
+                old = next(iter(pf.positions))
+                pf.positions.remove(old['id'])
+                exit_price = price * (1 + rng.normal(0, 0.03))
+                won = (exit_price > old['entry_price']) == (old['side'] == 'long')
+                close_trade(pf, old, exit_price, now, 'TP' if won else 'SL')
+            if pf.journal.snapshot_due():
+                pf.journal.snapshot(pf)
+        k += 1
+
+def _journal_crash_child(directory, seed, ready):
+    global trade_ids
+    pf = Portfolio('CRASH/USDT')
+    pf.journal = TradeJournal(pf.symbol, directory, writer=JournalWriter(fsync_interval=0.02), snapshot_every=500)
+    pf.journal.recover(pf)
+    trade_ids = itertools.count(pf.journal.max_id + 1)
+    ready.set()
+    _journal_workload(pf, np.random.default_rng(seed))
+
+def _journal_recover(sym, directory):
+    pf = Portfolio(sym)
+    journal = TradeJournal(sym, directory, writer=JournalWriter())
+    t0 = time.perf_counter()
+    replayed = journal.recover(pf)
+    return pf, replayed, (time.perf_counter() - t0) * 1000
+
+def run_journal_bench_cli(args):
+    base = args.dir or tempfile.mkdtemp(prefix='journal_bench_')
+    print(f"[JOURNAL-BENCH] working in {base}")
+    failures = []
+    try:
+
+        # 1) recovery time after `trades` trades: full log replay vs. snapshot + tail
+        for label, every in (('full log', float('inf')), ('snapshot+tail', journal_snapshot_every)):
+            directory = os.path.join(base, 'full' if every == float('inf') else 'snap')
+            writer = JournalWriter()
+            pf = Portfolio('BENCH/USDT')
+            pf.journal = TradeJournal(pf.symbol, directory, writer=writer, snapshot_every=every)
+            t0 = time.perf_counter()
+            _journal_workload(pf, np.random.default_rng(args.seed), args.trades)
+            enqueue_s = time.perf_counter() - t0
+            writer.flush()
+            total_s = time.perf_counter() - t0
+            rec, replayed, ms = _journal_recover(pf.symbol, directory)
+            same = (np.array_equal(rec.ledger.rows(), pf.ledger.rows()) and abs(rec.capital - pf.capital) < 1e-9
+                    and [t['id'] for t in rec.positions] == [t['id'] for t in pf.positions])
+            print(f"[JOURNAL-BENCH] {label}: {args.trades} trades, trading loop {enqueue_s:.2f} s, on disk after {total_s:.2f} s "
+                  f"({writer.stats['records']} records, {writer.stats['batches']} batches, {writer.stats['snapshots']} snapshots)")
+            print(f"[JOURNAL-BENCH] {label}: recovery {ms:.1f} ms, {replayed} records replayed, state identical: {same}")
+            if not same:
+                failures.append(f"{label} recovery does not match the live portfolio")
+
+        # 2) kill -9 at random points while trading; every restart must come back consistent
+        # and never with fewer closed trades than the previous recovery
+        ctx = multiprocessing.get_context('spawn')
+        directory = os.path.join(base, 'crash')
+        rng = np.random.default_rng(args.seed)
+        last_closed, crashes = 0, 0
+        for k in range(args.kills):
+            ready = ctx.Event()
+            proc = ctx.Process(target=_journal_crash_child, args=(directory, args.seed + k, ready))
+            proc.start()
+            ready.wait(60)
+            time.sleep(rng.uniform(0.1, 1.0))
+            proc.kill()
+            proc.join()
+            pf, replayed, ms = _journal_recover('CRASH/USDT', directory)
+            rows = pf.ledger.rows()
+            ids = rows['id'].tolist() + [t['id'] for t in pf.positions]
+            expected = start_capital + float(rows['pnl_usdt'].sum())
+            ok = (abs(pf.capital - expected) < 1e-6 * max(1.0, abs(expected)) and len(ids) == len(set(ids))
+                  and pf.analytics.closed == len(rows) and len(rows) >= last_closed)
+            crashes += not ok
+            print(f"[JOURNAL-BENCH] kill {k+1}/{args.kills}: {len(rows)} closed, {len(pf.positions)} open, "
+                  f"{replayed} records replayed in {ms:.1f} ms -> {'ok' if ok else 'INCONSISTENT'}")
+            last_closed = len(rows)
+        print(f"[JOURNAL-BENCH] kill -9 test: {args.kills - crashes}/{args.kills} recoveries consistent")
+        if crashes:
+            failures.append(f"{crashes}/{args.kills} kill -9 recoveries inconsistent")
+    finally:
+        if not args.dir:
+            shutil.rmtree(base, ignore_errors=True)
+    for msg in failures:
+        print(f"[JOURNAL-BENCH] FAIL: {msg}")
+    print("[JOURNAL-BENCH] OK" if not failures else f"[JOURNAL-BENCH] {len(failures)} check(s) failed")
+    if failures:
+        sys.exit(1)
+
+# -------------------------
+# === NOTIFY BENCH ===
+# -------------------------
+def _fake_telegram_server(latency, flood_every=0):
+    # local stand-in for api.telegram.org: records each sendMessage, answers after `latency`
+    # seconds, and with flood_every=N answers every Nth request with a 429 flood-control error
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+            time.sleep(latency)
+            received.append(urllib.parse.parse_qs(body).get('text', [''])[0])
+            if flood_every and len(received) % flood_every == 0:
+                status, reply = 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 0.2}}
+            else:
+                status, reply = 200, {'ok': True, 'result': {'message_id': len(received)}}
+            data = json.dumps(reply).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, received
+
+def run_notify_bench_cli(args):
+    # trading-loop-like bursts against the fake endpoint: the loop must never wait on Telegram
+    server, received = _fake_telegram_server(args.latency, args.flood_every)
+    n = TelegramNotifier('BENCH', '1', api_base=f"http://127.0.0.1:{server.server_port}",
+                         queue_size=args.queue, rate=args.rps)
+    enqueue = LatencyStats(size=args.ticks * args.burst)
+    t0 = time.perf_counter()
+    for tick in range(args.ticks):
+        for k in range(args.burst):
+            s0 = time.perf_counter_ns()
+            n.send(f"[BENCH/USDT] OPEN LONG Entry: {30000 + tick + k:.2f} | Size: {order_size_usdt:.2f} USDT")
+            enqueue.add(time.perf_counter_ns() - s0)
+        time.sleep(args.interval)
+    loop_s = time.perf_counter() - t0
+    events = args.ticks * args.burst
+    while n.stats['events_sent'] + n.stats['dropped'] < events and time.perf_counter() - t0 < args.timeout:
+        if n.stats['errors']:
+            break
+        time.sleep(0.05)
+    total_s = time.perf_counter() - t0
+    server.shutdown()
+    print(f"[NOTIFY-BENCH] {events} events in {args.ticks} ticks, endpoint latency {args.latency:.2f} s")
+    print(f"[NOTIFY-BENCH] trading loop {loop_s:.2f} s (synchronous sends would add ~{events * args.latency:.1f} s), "
+          f"send() latency: {enqueue.summary()}")
+    print(f"[NOTIFY-BENCH] delivered after {total_s:.2f} s: {len(received)} requests at the fake endpoint, stats: {n.summary()}")
+
+    # every event delivered, no errors, send() never blocked, bursts coalesced: a digest goes out
+    # at most once per coalesce window (plus splits at the Telegram size limit), 429s are retried
+    chars = sum(len(t) + 1 for t in received)
+    max_messages = int(-(-loop_s // n.coalesce)) + 1 + chars // n.MAX_TEXT
+    floods = len(received) // args.flood_every if args.flood_every else 0
+    failures = []
+    if n.stats['dropped'] or n.stats['events_sent'] != events:
+        failures.append(f"{events - n.stats['events_sent']} of {events} events not delivered ({n.stats['dropped']} dropped)")
+    if n.stats['errors']:
+        failures.append(f"{n.stats['errors']} send errors ({n.stats['last_error']})")
+    if enqueue.max_ns > args.max_send_ms * 1e6:
+        failures.append(f"send() blocked the caller for {enqueue.max_ns / 1e6:.1f} ms (limit {args.max_send_ms:g} ms)")
+    if n.stats['messages_sent'] > max_messages or len(received) - floods != n.stats['messages_sent']:
+        failures.append(f"{n.stats['messages_sent']} messages / {len(received)} requests for {events} events "
+                        f"(expected at most {max_messages} messages, one request each plus {floods} flood retries)")
+    for msg in failures:
+        print(f"[NOTIFY-BENCH] FAIL: {msg}")
+    print("[NOTIFY-BENCH] OK" if not failures else f"[NOTIFY-BENCH] {len(failures)} check(s) failed")
+    if failures:
+        sys.exit(1)
+
+# -------------------------
+# === FAKE EXCHANGE ===
+# -------------------------
+# Local stand-in for the public Binance spot endpoints ccxt uses here (exchangeInfo, klines,
+# ticker/24hr). Prices are a seeded 1m random walk per symbol that keeps growing with the
+# wall clock, so candles form and close like the real ones; every response is delayed by
+# `latency` (+ up to `jitter`) s and answered with a 503/429 at `fail_rate`, or always while
+# `down` is set. Requests are logged as (path, started, seconds, status).
+
+class FakeBinance:
+    MINUTE = 60_000
+
+    def __init__(self, syms, latency=0.05, jitter=0.0, fail_rate=0.0, history_days=30, seed=7):
+        self.markets = {s.replace('/', ''): s for s in syms}
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.down = False
+        self.start_ms = (int(time.time() * 1000) // self.MINUTE - history_days * 1440) * self.MINUTE
+        self.log = []
+        self._rng = random.Random(seed)
+        self._paths = {}
+        self._lock = threading.Lock()
+
+    def _closes(self, mid, now_ms):
+        # minute closes from start_ms up to the (forming) minute of now_ms
+        n = (now_ms - self.start_ms) // self.MINUTE + 1
+        with self._lock:
+            if mid not in self._paths:
+                rng = np.random.default_rng(zlib.crc32(mid.encode()))
+                self._paths[mid] = [rng, np.empty(0), 50.0 + zlib.crc32(mid.encode()) % 50000]
+            rng, closes, last = self._paths[mid]
+            if len(closes) < n:
+                steps = rng.normal(0.0, 0.0008, n - len(closes))
+                ext = np.round(last * np.exp(np.cumsum(steps)), 2)
+                closes = self._paths[mid][1] = np.concatenate([closes, ext])
+                self._paths[mid][2] = ext[-1]
+            return closes[:n]
+
+    def exchange_info(self):
+        return {'timezone': 'UTC', 'serverTime': int(time.time() * 1000), 'rateLimits': [], 'exchangeFilters': [],
+                'symbols': [{'symbol': mid, 'status': 'TRADING', 'baseAsset': s.split('/')[0], 'quoteAsset': s.split('/')[1],
+                             'baseAssetPrecision': 8, 'quotePrecision': 8, 'quoteAssetPrecision': 8,
+                             'orderTypes': ['LIMIT', 'MARKET'], 'isSpotTradingAllowed': True,
+                             'isMarginTradingAllowed': False, 'permissions': ['SPOT'], 'permissionSets': [['SPOT']],
+                             'filters': [{'filterType': 'PRICE_FILTER', 'minPrice': '0.01', 'maxPrice': '1000000.00', 'tickSize': '0.01'},
+                                         {'filterType': 'LOT_SIZE', 'minQty': '0.00001', 'maxQty': '9000.00000', 'stepSize': '0.00001'}]}
+                            for mid, s in self.markets.items()]}
+
+    def klines(self, mid, interval, start=None, end=None, limit=500):
+        tf = exchange.parse_timeframe(interval) * 1000
+        now = int(time.time() * 1000)
+        closes = self._closes(mid, now)
+        last_open = now // tf * tf
+        if end is not None:
+            last_open = min(last_open, int(end) // tf * tf)
+        limit = min(int(limit), 1000)
+        first = -(-int(start) // tf) * tf if start is not None else last_open - (limit - 1) * tf
+        first = max(first, -(-self.start_ms // tf) * tf)
+        opens = np.arange(first, last_open + 1, tf, dtype=np.int64)[:limit]
+        if not len(opens):
+            return []
+        i0 = (opens - self.start_ms) // self.MINUTE
+        i1 = np.minimum(i0 + tf // self.MINUTE, len(closes))
+        seg = closes[:i1[-1]]
+        prev = closes[np.maximum(i0 - 1, 0)]
+        high = np.maximum(prev, np.maximum.reduceat(seg, i0))
+        low = np.minimum(prev, np.minimum.reduceat(seg, i0))
+        close = closes[i1 - 1]
+        volume = (i1 - i0) * 1.5
+        return [[int(t), f"{o:.2f}", f"{h:.2f}", f"{l:.2f}", f"{c:.2f}", f"{v:.5f}", int(t) + tf - 1,
+                 f"{v * c:.2f}", int(i1k - i0k), f"{v / 2:.5f}", f"{v * c / 2:.2f}", "0"]
+                for t, o, h, l, c, v, i0k, i1k in zip(opens, prev, high, low, close, volume, i0, i1)]
+
+    def ticker(self, mid):
+        now = int(time.time() * 1000)
+        closes = self._closes(mid, now)
+        day = closes[-1441:]
+        last, open_ = float(day[-1]), float(day[0])
+        return {'symbol': mid, 'priceChange': f"{last - open_:.2f}", 'priceChangePercent': f"{(last / open_ - 1) * 100:.3f}",
+                'weightedAvgPrice': f"{float(day.mean()):.2f}", 'prevClosePrice': f"{open_:.2f}",
+                'lastPrice': f"{last:.2f}", 'lastQty': "0.01000", 'bidPrice': f"{last - 0.01:.2f}", 'bidQty': "1.00000",
+                'askPrice': f"{last + 0.01:.2f}", 'askQty': "1.00000", 'openPrice': f"{open_:.2f}",
+                'highPrice': f"{float(day.max()):.2f}", 'lowPrice': f"{float(day.min()):.2f}",
+                'volume': f"{len(day) * 1.5:.5f}", 'quoteVolume': f"{len(day) * 1.5 * last:.2f}",
+                'openTime': now - 86_400_000, 'closeTime': now, 'firstId': 1, 'lastId': len(day), 'count': len(day)}
+
+    def handle(self, path, params):
+        if self.down or (self.fail_rate and self._rng.random() < self.fail_rate):
+            if not self.down and self._rng.random() < 0.5:
+                return 429, {'code': -1003, 'msg': "Too many requests; current limit is exceeded."}
+            return 503, {'code': -1001, 'msg': "Service Unavailable."}
+        if path == '/api/v3/exchangeInfo':
+            return 200, self.exchange_info()
+        if path in ('/api/v3/ping', '/api/v3/time'):
+            return 200, {'serverTime': int(time.time() * 1000)}
+        mid = params.get('symbol')
+        if path in ('/api/v3/klines', '/api/v3/ticker/24hr') and mid not in self.markets:
+            return 400, {'code': -1121, 'msg': "Invalid symbol."}
+        if path == '/api/v3/klines':
+            return 200, self.klines(mid, params.get('interval', '1m'), params.get('startTime'),
+                                    params.get('endTime'), params.get('limit', 500))
+        if path == '/api/v3/ticker/24hr':
+            return 200, self.ticker(mid)
+        return 404, {'code': -1100, 'msg': f"Unknown path {path}"}
+
+    def serve(self, port=0):
+        fake = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'    # keep-alive, so pooled client connections are reused
+
+            def do_GET(self):
+                t0 = time.perf_counter()
+                url = urllib.parse.urlsplit(self.path)
+                params = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+                time.sleep(fake.latency + (random.uniform(0, fake.jitter) if fake.jitter else 0.0))
+                status, reply = fake.handle(url.path, params)
+                data = json.dumps(reply).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+                fake.log.append((url.path, t0, time.perf_counter() - t0, status))
+
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+# -------------------------
+# === EXCHANGE BENCH ===
+# -------------------------
+def _sequential_fetch(syms):
+    # the pre-concurrency loop: 2h, 30m and the ticker one after another per symbol
+    for sym in syms:
+        exchange.fetch_ohlcv(sym, '2h', limit=fetch_limit_2h)
+        exchange.fetch_ohlcv(sym, '30m', limit=fetch_limit_30m)
+        exchange.fetch_ticker(sym)
+
+def _timed_loops(fake, fn, iterations):
+    # wall time per loop next to the slowest single request the fake served during it
+    rows = []
+    for _ in range(iterations):
+        mark = len(fake.log)
+        t0 = time.perf_counter()
+        fn()
+        wall = time.perf_counter() - t0
+        served = fake.log[mark:]
+        rows.append((wall, max((d for _, _, d, _ in served), default=0.0), len(served)))
+    wall, slowest, n = (float(np.median(col)) for col in zip(*rows))
+    return wall, slowest, n
+
+def run_exchange_bench_cli(args):
+    syms = [f"{base}/USDT" for base in ('BTC', 'ETH', 'SOL', 'BNB', 'XRP', 'ADA', 'DOGE', 'LTC')[:args.symbols]]
+    fake = FakeBinance(syms, latency=args.latency, jitter=args.jitter)
+    server = fake.serve(args.port)
+    url = f"http://127.0.0.1:{server.server_port}"
+    if args.serve:
+        print(f"[EXCHANGE] fake Binance on {url} ({', '.join(syms)}), run the bot against it with:")
+        print(f"[EXCHANGE]   EXCHANGE_API={url} SYMBOLS={','.join(syms)} python \"{os.path.basename(__file__)}\" live")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+    use_exchange_api(url)
+    for sym in syms:    # in-memory stores, the bench must not touch candle_data/
+        candle_stores[(sym, candle_base_timeframe)] = CandleStore(sym, candle_base_timeframe, directory=None)
+    exchange_call('load_markets')
+    fetch_market_data(syms)     # cold start: fills the candle stores
+    print(f"[EXCHANGE] {len(syms)} symbols, fake latency {args.latency * 1000:.0f} ms (+{args.jitter * 1000:.0f} ms jitter), "
+          f"{args.iterations} loops each, medians:")
+
+    wall, slowest, n = _timed_loops(fake, lambda: _sequential_fetch(syms), args.iterations)
+    print(f"[EXCHANGE] sequential (2h + 30m + ticker per symbol): {wall * 1000:8.1f} ms/loop, "
+          f"{n:.0f} requests, slowest request {slowest * 1000:.1f} ms")
+    wall, slowest, n = _timed_loops(fake, lambda: fetch_market_data(syms), args.iterations)
+    print(f"[EXCHANGE] concurrent + pooled:                    {wall * 1000:8.1f} ms/loop, "
+          f"{n:.0f} requests, slowest request {slowest * 1000:.1f} ms")
+
+    # transient failures: retried with backoff instead of surfacing as empty frames
+    fake.fail_rate = args.fail_rate
+    before = metrics.total('exchange_retries_total')
+    empty = 0
+    def faulty_loop():
+        nonlocal empty
+        empty += sum(df_30m.empty for _, df_30m, _ in fetch_market_data(syms).values())
+    wall, slowest, n = _timed_loops(fake, faulty_loop, args.iterations)
+    retries = metrics.total('exchange_retries_total') - before
+    print(f"[EXCHANGE] fail rate {args.fail_rate:.0%}: {wall * 1000:8.1f} ms/loop, {retries:.0f} retries, "
+          f"{empty} of {args.iterations * len(syms)} symbol fetches still failed")
+    fake.fail_rate = 0.0
+
+    # deduplication: identical concurrent calls share one request
+    mark = len(fake.log)
+    start = threading.Barrier(args.dedup)
+    def same_call(_):
+        start.wait()
+        return exchange_call('fetch_ticker', syms[0])
+    with ThreadPoolExecutor(max_workers=args.dedup) as pool:
+        list(pool.map(same_call, range(args.dedup)))
+    print(f"[EXCHANGE] dedup: {args.dedup} identical concurrent fetch_ticker calls -> "
+          f"{len(fake.log) - mark} request(s) at the fake exchange")
+
+    # circuit breaker: an outage trips it, calls fail fast, a trial request closes it again
+    breaker.cooldown = args.cooldown
+    fake.down = True
+    mark = len(fake.log)
+    t0 = time.perf_counter()
+    for _ in range(3):
+        fetch_market_data(syms)
+    outage = time.perf_counter() - t0
+    sent = len(fake.log) - mark
+    t1 = time.perf_counter()
+    fetch_market_data(syms)
+    fast = time.perf_counter() - t1
+    print(f"[EXCHANGE] outage: 3 loops took {outage:.2f} s, {sent} requests reached the exchange, breaker {breaker.state}; "
+          f"next loop failed fast in {fast * 1000:.1f} ms")
+    fake.down = False
+    time.sleep(breaker.retry_in())
+    for loop in (1, 2):     # half-open: the first loop sends one trial request, the rest still fail fast
+        mark = len(fake.log)
+        ok = sum(not df_30m.empty for _, df_30m, _ in fetch_market_data(syms).values())
+        print(f"[EXCHANGE] recovery loop {loop} after the {args.cooldown:.1f} s cooldown: {len(fake.log) - mark} requests, "
+              f"{ok}/{len(syms)} symbols ok, breaker {breaker.state}")
+    server.shutdown()
+
+# -------------------------
+# === BENCHMARK SUITE ===
+# -------------------------
+# Offline micro-benchmarks of the hot paths on exchange responses recorded once with --record
+# (or seeded synthetic data with --synthetic), no network needed. Results go to JSON; --compare
+# flags every case whose median got slower than `threshold` x the baseline and exits non-zero.
+
+def synthetic_ohlcv(n_2h, seed=7, start_ms=1_600_000_000_000):
+    # ccxt-style rows: 30m random walk with occasional jumps, 2h candles aggregated from it
+    rng = np.random.default_rng(seed)
+    n30 = n_2h * 4
+    start_ms -= start_ms % 7_200_000
+    ret = rng.normal(0, 0.004, n30) + rng.normal(0, 0.02, n30) * (rng.random(n30) < 0.01)
+    close = 30000.0 * np.exp(np.cumsum(ret))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.002, n30))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.002, n30))
+    rows30 = np.c_[start_ms + np.arange(n30) * 1_800_000, open_, high, low, close, rng.uniform(1, 10, n30)]
+    g = rows30.reshape(n_2h, 4, 6)
+    rows2h = np.c_[g[:, 0, 0], g[:, 0, 1], g[:, :, 2].max(1), g[:, :, 3].min(1), g[:, 3, 4], g[:, :, 5].sum(1)]
+    return rows2h.tolist(), rows30.tolist()
+
+def synthetic_ticks(n, seed=7, start_px=30000.0, start_ms=1_600_000_000_000, step_ms=100):
+    rng = np.random.default_rng(seed)
+    prices = start_px * np.exp(np.cumsum(rng.normal(0, 0.0002, n)))
+    return start_ms + np.arange(n, dtype=np.int64) * step_ms, prices
+
+def synthetic_ledger(n, seed=7, end_ms=None):
+    # n closed trades, one per minute up to end_ms
+    rng = np.random.default_rng(seed)
+    end_ms = end_ms or int(time.time()*1000)
+    rows = np.zeros(n, dtype=LEDGER_DTYPE)
+    rows['id'] = np.arange(1, n + 1)
+    rows['side'] = np.where(rng.random(n) < 0.5, SIDE_LONG, SIDE_SHORT)
+    rows['exit_time'] = end_ms - (n - 1 - np.arange(n)) * 60_000
+    rows['entry_time'] = rows['exit_time'] - rng.integers(1, 48, n) * 1_800_000
+    rows['entry_price'] = 30000.0 * (1 + rng.normal(0, 0.05, n))
+    rows['exit_price'] = rows['entry_price'] * (1 + rng.normal(0, 0.04, n))
+    rows['order_size'] = order_size_usdt
+    rows['amount'] = order_size_usdt / rows['entry_price']
+    sign = rows['side'].astype(np.float64)
+    rows['pnl_usdt'] = (rows['exit_price'] - rows['entry_price']) * sign * rows['amount']
+    rows['reason'] = np.where(rows['pnl_usdt'] > 0, REASON_CODES['TP'], REASON_CODES['SL'])
+    return rows
+
+def bench_portfolio(n_closed, n_open=24, seed=7):
+    # portfolio as the live loop would have it after n_closed trades
+    rng = np.random.default_rng(seed)
+    pf = Portfolio('BENCH/USDT')
+    rows = synthetic_ledger(n_closed, seed)
+    pf.ledger.extend(rows)
+    pnl = rows['pnl_usdt']
+    pf.analytics.closed, pf.analytics.wins = n_closed, int((pnl > 0).sum())
+    pf.analytics.gross_profit, pf.analytics.gross_loss = float(pnl[pnl > 0].sum()), float(-pnl[pnl <= 0].sum())
+    # only the tail of the capital history is ever read
+    end_ms = int(rows['exit_time'][-1]) if n_closed else int(time.time()*1000)
+    pf.capital = start_capital + float(rows['pnl_usdt'].sum())
+    for k in range(2 * chart_history_points):
+        pf.capital_history.append(end_ms - (2 * chart_history_points - k) * 60_000, pf.capital)
+    ts, prices = synthetic_ticks(price_history_max, seed, start_ms=end_ms - price_history_max * 1000, step_ms=1000)
+    for a, b in zip(ts.tolist(), prices.tolist()):
+        record_price(pf, a, b)
+    now = _ms_to_dt(end_ms)
+    for i in range(n_open):
+        e = float(prices[-1] * (1 + rng.normal(0, 0.01)))
+        t = {'id': n_closed + 1 + i, 'side': 'long' if i % 2 else 'short', 'entry_price': e, 'entry_time': now,
+             'amount': order_size_usdt / e, 'order_size': order_size_usdt, 'status': 'open'}
+        pf.positions.add(t)
+        pf.analytics.on_open(t)
+    return pf
+
+def _bench(fn, setup=lambda: None, repeat=5, number=1):
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn(state)
+        times.append((time.perf_counter() - t0) / number * 1000)
+    return {'median_ms': float(np.median(times)), 'min_ms': float(min(times)), 'mean_ms': float(np.mean(times)),
+            'repeat': repeat, 'number': number}
+
+def fixture_path(directory, sym, name):
+    path = os.path.join(directory, f"{sym.replace('/', '')}_{name}.json")
+    if not os.path.exists(path):
+        raise SystemExit(f"no recorded {sym} {name} data at {path}; record it with: bench --record {directory} "
+                         f"(or pass --synthetic)")
+    return path
+
+def _load_fixture(directory, sym, timeframe, n_rows, seed):
+    if directory:
+        with open(fixture_path(directory, sym, timeframe)) as f:
+            return json.load(f)
+    rows2h, rows30 = synthetic_ohlcv(max(n_rows, n_rows // 4 + 1), seed)
+    return (rows2h if timeframe == '2h' else rows30)[-n_rows:]
+
+def _load_responses(directory, sym, seed):
+    # raw exchangeInfo + klines bodies; synthetic ones in Binance's wire format without a recording
+    if directory:
+        with open(fixture_path(directory, sym, 'responses')) as f:
+            return json.load(f)
+    rows2h, rows30 = synthetic_ohlcv(1000, seed)
+
+    def wire(rows, tf_ms):
+        return [[int(r[0]), *(f"{x:.8f}" for x in r[1:6]), int(r[0]) + tf_ms - 1, "0", 0, "0", "0", "0"] for r in rows]
+    return {'exchangeInfo': FakeBinance([sym]).exchange_info(),
+            'klines': {'2h': wire(rows2h, 7_200_000), '30m': wire(rows30[-1000:], 1_800_000)}}
+
+def record_fixtures(directory, sym=symbol, limit=1000):
+    # one-time capture of real exchange responses: the raw bodies (replayed through ccxt by `bench`)
+    # and the candles ccxt parses from them (`bench`, `candles-verify`, `replay --data`)
+    os.makedirs(directory, exist_ok=True)
+    exchange.load_markets()
+    market = exchange.market(sym)
+    responses = {'exchangeInfo': exchange_call('publicGetExchangeInfo', {'symbol': market['id']}), 'klines': {}}
+    for timeframe in ('2h', '30m'):
+        body = exchange_call('publicGetKlines', {'symbol': market['id'], 'interval': timeframe, 'limit': limit})
+        responses['klines'][timeframe] = body
+        with open(os.path.join(directory, f"{sym.replace('/', '')}_{timeframe}.json"), 'w') as f:
+            json.dump(exchange.parse_ohlcvs(body, market, timeframe), f)
+        print(f"[BENCH] recorded {len(body)} {sym} {timeframe} candles to {directory}")
+    with open(os.path.join(directory, f"{sym.replace('/', '')}_responses.json"), 'w') as f:
+        json.dump(responses, f)
+
+class RecordedResponses:
+    # answers ccxt's HTTP layer (exchange.fetch) from recorded exchangeInfo/klines bodies. Candle
+    # times are shifted by whole bars of the largest timeframe so the last recorded bar is the one
+    # forming now; `hide` holds back that many of the newest candles.
+    def __init__(self, responses, now_ms=None):
+        self.info = responses['exchangeInfo']
+        tf_ms = {tf: exchange.parse_timeframe(tf) * 1000 for tf in responses['klines']}
+        big = max(tf_ms, key=tf_ms.get)
+        now_ms = now_ms or int(time.time() * 1000)
+        shift = (now_ms - int(responses['klines'][big][-1][0])) // tf_ms[big] * tf_ms[big]
+        self.klines = {tf: [[int(r[0]) + shift, *r[1:6], int(r[6]) + shift, *r[7:]] for r in body]
+                       for tf, body in responses['klines'].items()}
+        self.opens = {tf: np.array([r[0] for r in body], dtype=np.int64) for tf, body in self.klines.items()}
+        self.hide = 0
+
+    def fetch(self, url, method='GET', headers=None, body=None):
+        parts = urllib.parse.urlsplit(url)
+        q = dict(urllib.parse.parse_qsl(parts.query))
+        if parts.path.endswith('/exchangeInfo'):
+            return self.info
+        if parts.path.endswith('/klines') and q.get('interval') in self.klines:
+            opens = self.opens[q['interval']]
+            opens = opens[:len(opens) - self.hide]
+            hi = int(np.searchsorted(opens, int(q['endTime']), side='right')) if 'endTime' in q else len(opens)
+            limit = int(q.get('limit', 500))
+            lo = int(np.searchsorted(opens, int(q['startTime']))) if 'startTime' in q else max(0, hi - limit)
+            return self.klines[q['interval']][lo:min(hi, lo + limit)]
+        raise ccxt.BadRequest(f"no recorded response for {method} {url}")
+
+@contextlib.contextmanager
+def recorded_exchange(responses):
+    # the live fetch path (exchange_call -> ccxt -> candle stores) on recorded responses. Nothing
+    # goes out, so the request budget is lifted; candle stores are set aside and restored after.
+    global rate_limiter
+    replay = RecordedResponses(responses)
+    saved_stores, saved_limiter = dict(candle_stores), rate_limiter
+    exchange.fetch = replay.fetch
+    rate_limiter = TokenBucket(1e9, 1e9)
+    try:
+        exchange.load_markets(reload=True)
+        yield replay
+    finally:
+        del exchange.fetch
+        rate_limiter = saved_limiter
+        candle_stores.clear()
+        candle_stores.update(saved_stores)
+
+def _memory_candle_stores(sym):
+    # empty in-memory stores for get_candle_store(), so benches neither read nor write candle_data/
+    candle_stores.clear()
+    for tf in {candle_base_timeframe, '2h', '30m'}:
+        if not aggregate_candles or tf == candle_base_timeframe:
+            candle_stores[(sym, tf)] = CandleStore(sym, tf, directory=None)
+
+def run_benchmarks(sizes=(1000, 100000, 1000000), export_sizes=(1000, 100000), repeat=5, seed=7, fixtures=None):
+    results = {}
+
+    def record(name, res, **info):
+        results[name] = dict(res, **info)
+        print(f"[BENCH] {name:<24} median {res['median_ms']:10.3f} ms   min {res['min_ms']:10.3f} ms")
+
+    # fetch_ohlcv_ccxt -> DataFrame on recorded Binance responses: ccxt request + parsing, candle
+    # store merge / 2h aggregation, window_df. Cold is a fresh store, warm the per-loop update
+    with recorded_exchange(_load_responses(fixtures, symbol, seed)) as replay:
+        for timeframe, limit in (('2h', fetch_limit_2h), ('30m', fetch_limit_30m)):
+            def cold_setup():
+                replay.hide = 0
+                _memory_candle_stores(symbol)
+
+            def warm_setup():
+                _memory_candle_stores(symbol)
+                replay.hide = 1
+                fetch_ohlcv_ccxt(timeframe, limit, symbol)
+                replay.hide = 0
+
+            cold_setup()
+            rows = len(fetch_ohlcv_ccxt(timeframe, limit, symbol))
+            if rows != limit:
+                raise SystemExit(f"[BENCH] fetch_ohlcv_ccxt({timeframe}) returned {rows} of {limit} candles from the recording")
+
+            def fetch(_):
+                fetch_ohlcv_ccxt(timeframe, limit, symbol)
+            record(f'fetch_ohlcv_cold_{timeframe}', _bench(fetch, cold_setup, repeat=repeat), rows=rows)
+            record(f'fetch_ohlcv_warm_{timeframe}', _bench(fetch, warm_setup, repeat=repeat), rows=rows)
+
+    # the store part alone: a full first page, then the per-loop incremental update
+    for timeframe, limit in (('2h', fetch_limit_2h), ('30m', fetch_limit_30m)):
+        page = _load_fixture(fixtures, symbol, timeframe, 1000, seed)
+
+        def cold(_):
+            store = CandleStore(symbol, timeframe, directory=None)
+            store.merge(page)
+            store.window_df(limit)
+
+        def warm_setup():
+            store = CandleStore(symbol, timeframe, directory=None)
+            store.merge(page[:-1])
+            return store
+
+        def warm(store):
+            store.merge(page[-2:])
+            store.window_df(limit)
+        record(f'candles_cold_{timeframe}', _bench(cold, repeat=repeat, number=20))
+        record(f'candles_warm_{timeframe}', _bench(warm, warm_setup, repeat=repeat, number=1))
+
+    # entry signal over sliding live-sized windows
+    rows2h, rows30 = synthetic_ohlcv(2000, seed)
+    df2h, df30 = ohlcv_to_df(rows2h), ohlcv_to_df(rows30)
+    windows = [(df2h.iloc[k - fetch_limit_2h:k], df30.iloc[4 * k - fetch_limit_30m:4 * k])
+               for k in range(fetch_limit_2h, len(df2h), 9)]
+    signals = sum(len(try_enter_from_2h_breakout(a, b, trigger_pct, fee_pct)) for a, b in windows)
+
+    def entries(_):
+        for a, b in windows:
+            try_enter_from_2h_breakout(a, b, trigger_pct, fee_pct)
+    res = _bench(entries, repeat=repeat)
+    res = {k: (v / len(windows) if k.endswith('_ms') else v) for k, v in res.items()}
+    record('entry_signal', res, windows=len(windows), signals=signals)
+
+    # exit evaluation on the 2h close: steady state (nothing crossed) and a crossing close
+    for n_open in (24, 2000):
+        pf = bench_portfolio(0, n_open, seed)
+        px = pf.price_history.last[1]
+        flat = df2h.iloc[-2:].copy()
+        flat['close'] = px
+        record(f'exit_eval_{n_open}', _bench(lambda _: evaluate_and_close_trades(pf, flat, fee_pct, profit_target, stop_loss),
+                                             repeat=repeat, number=200))
+        jump = flat.copy()
+        jump['close'] = px * (1 + profit_target / 100 + 0.01)
+
+        def crossed(p):
+            evaluate_and_close_trades(p, jump, fee_pct, profit_target, stop_loss)
+        record(f'exit_close_{n_open}', _bench(crossed, lambda: bench_portfolio(0, n_open, seed), repeat=repeat))
+
+    # per-tick TP/SL decision on a replayed tick stream
+    pf = bench_portfolio(0, 24, seed)
+    ts, prices = synthetic_ticks(20000, seed)
+    stats = LatencyStats(size=len(ts))
+    handler = make_tick_handler({pf.symbol: pf}, stats)
+    res = _bench(lambda _: [handler(pf.symbol, a, b) for a, b in zip(ts.tolist(), prices.tolist())], repeat=1)
+    record('tick_handler', {k: (v / len(ts) if k.endswith('_ms') else v) for k, v in res.items()}, ticks=len(ts))
+
+    # /api/state body and exports at growing ledger sizes
+    for n in sizes:
+        pf = bench_portfolio(n, 24, seed)
+
+        def swap(_):
+            with pf.publisher._lock:       # what every publish pays under pf.lock for its snapshot
+                return pf.publisher._swap()
+        record(f'api_state_{n}', _bench(swap, repeat=repeat))
+        # + the /api/state body, built once per version by the first reader
+        record(f'api_state_body_{n}', _bench(lambda _: swap(_).state, repeat=repeat))
+        if n in export_sizes:
+            record(f'export_csv_{n}', _bench(lambda _: sum(map(len, csv_chunks(TradeLedger.scan(pf.ledger.views())))),
+                                             repeat=min(repeat, 3)))
+        views = pf.ledger.views()
+        record(f'export_npz_{n}', _bench(lambda _: sum(map(len, npz_chunks(lambda: TradeLedger.scan(views)))),
+                                         repeat=repeat))
+    return results
+
+def bench_meta(seed, fixtures):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {'commit': commit, 'created': datetime.now(timezone.utc).isoformat(), 'seed': seed,
+            'fixtures': fixtures or 'synthetic', 'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+def compare_benchmarks(results, baseline, threshold):
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base or base['median_ms'] <= 0:
+            continue
+        ratio = res['median_ms'] / base['median_ms']
+        flag = ratio > threshold
+        if flag:
+            regressions.append(name)
+        print(f"[BENCH] {name:<24} {base['median_ms']:10.3f} -> {res['median_ms']:10.3f} ms  x{ratio:5.2f}{'  REGRESSION' if flag else ''}")
+    return regressions
+
+def run_bench_cli(args):
+    if args.record:
+        record_fixtures(args.record)
+        return
+    sizes = parse_sweep_values(args.sizes, int)
+    export_sizes = parse_sweep_values(args.export_sizes, int)
+    fixtures = None if args.synthetic else args.fixtures
+    results = run_benchmarks(sizes, export_sizes, args.repeat, args.seed, fixtures)
+    report = {'meta': bench_meta(args.seed, fixtures), 'results': results}
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] results written to {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"[BENCH] compare against {args.compare} (commit {baseline['meta'].get('commit')}), threshold x{args.threshold}")
+        regressions = compare_benchmarks(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"[BENCH] {len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("[BENCH] no regressions")
+
+# -------------------------
+# === CANDLE AGGREGATION CHECK ===
+# -------------------------
+def verify_aggregation(base_rows, native_rows, base_tf, timeframe, seed=7):
+    # feeds the base candles the way the live loop sees them (the forming bar revised in place
+    # before it closes), rolls them up and compares every complete bar with the native candles
+    rng = np.random.default_rng(seed)
+    base = CandleStore('VERIFY/USDT', base_tf, directory=None)
+    agg = AggregatedCandles(base, timeframe)
+    for row in base_rows:
+        ts, o, h, l, c, v = row
+        for frac in np.sort(rng.random(2)):
+            cp = o + (c - o) * frac
+            base.merge([[ts, o, max(o, cp), min(o, cp), cp, v * frac]])
+            agg.update()
+        base.merge([row])
+        agg.update()
+    batch = AggregatedCandles(base, timeframe)
+    batch.update()
+    rolled = agg.window(len(agg))
+    same_as_batch = np.array_equal(rolled, batch.window(len(batch)))
+
+    # complete buckets only: every base candle present, and not the still-forming last bar
+    base_ts = base.window(len(base))[:, 0]
+    buckets, counts = np.unique(base_ts - base_ts % agg.tf_ms, return_counts=True)
+    complete = set(buckets[counts == agg.ratio].tolist()) - {rolled[-1, 0]}
+    native = {r[0]: r for r in native_rows[:-1]}
+    compared, ohlc_mismatch, vol_err = 0, [], 0.0
+    for r in rolled:
+        n = native.get(r[0])
+        if n is None or r[0] not in complete:
+            continue
+        compared += 1
+        if not np.array_equal(np.asarray(n[1:5], dtype=np.float64), r[1:5]):
+            ohlc_mismatch.append(int(r[0]))
+        vol_err = max(vol_err, float(abs(r[5] - n[5]) / max(abs(n[5]), 1e-12)))
+    return {'bars': len(rolled), 'compared': compared, 'ohlc_mismatches': ohlc_mismatch[:10],
+            'n_ohlc_mismatches': len(ohlc_mismatch), 'max_volume_rel_err': vol_err, 'incremental_equals_batch': bool(same_as_batch)}
+
+def verify_tick_bars(n_ticks=200000, timeframe='30m', seed=7):
+    # ticks -> 1m bars via apply_tick -> rolled up, against a pandas resample of the raw ticks
+    ts, prices = synthetic_ticks(n_ticks, seed, step_ms=997)
+    qty = np.random.default_rng(seed).uniform(0.001, 1, n_ticks)
+    base = CandleStore('VERIFY/USDT', '1m', directory=None)
+    agg = AggregatedCandles(base, timeframe)
+    for a, b, q in zip(ts.tolist(), prices.tolist(), qty.tolist()):
+        base.apply_tick(a, b, q)
+        if a % 60_000 < 997:
+            agg.update()
+    agg.update()
+    s = pd.Series(prices, index=pd.to_datetime(ts, unit='ms', utc=True))
+    freq = f"{agg.tf_ms}ms"
+    ref = s.resample(freq).ohlc()
+    ref['volume'] = pd.Series(qty, index=s.index).resample(freq).sum()
+    rolled = agg.window(len(agg))
+    ok = (len(ref) == len(rolled) and np.array_equal(ref[['open', 'high', 'low', 'close']].to_numpy(), rolled[:, 1:5])
+          and np.allclose(ref['volume'].to_numpy(), rolled[:, 5], rtol=1e-9))
+    return {'ticks': n_ticks, 'bars': len(rolled), 'matches_resample': bool(ok)}
+
+def run_candles_verify_cli(args):
+    if args.synthetic:
+        # the synthetic 2h rows are aggregated from the same 30m rows: this only exercises the code paths
+        rows2h, rows30 = synthetic_ohlcv(1000, args.seed)
+        rows = {'30m': rows30, '2h': rows2h}
+        source = "synthetic data (aggregated from the same 30m rows, not a check against the exchange)"
+        if (args.base, args.timeframe) != ('30m', '2h'):
+            raise SystemExit("synthetic data only covers 30m -> 2h")
+    else:
+        rows = {}
+        for tf in (args.base, args.timeframe):
+            with open(fixture_path(args.fixtures, args.symbol, tf)) as f:
+                rows[tf] = json.load(f)
+        source = f"recorded fixtures in {args.fixtures}"
+    res = verify_aggregation(rows[args.base], rows[args.timeframe], args.base, args.timeframe, args.seed)
+    print(f"[CANDLES] {args.symbol} {args.base} -> {args.timeframe} vs native candles from {source}: {res}")
+    ticks = verify_tick_bars(seed=args.seed)
+    print(f"[CANDLES] ticks -> 1m -> 30m vs pandas resample: {ticks}")
+    ok = (res['compared'] > 0 and not res['n_ohlc_mismatches'] and res['max_volume_rel_err'] < 1e-6
+          and res['incremental_equals_batch'] and ticks['matches_resample'])
+    print("[CANDLES] OK" if ok else "[CANDLES] MISMATCH")
+    if not ok:
+        sys.exit(1)
+
+# -------------------------
+# === INDICATOR PARITY CHECK ===
+# -------------------------
+# IndicatorEngine against the pandas reference it replaced (ewm(span, adjust=False) and the
+# rolling-mean RSI of the old compute_rsi) over a seeded price walk. The capacity is small
+# so the check also covers the 2x-array compaction and the periodic re-sum of the RSI window.
+
+def verify_indicators(n=50000, capacity=1000, seed=7):
+    ts, prices = synthetic_ticks(n, seed)
+    eng = IndicatorEngine(capacity=capacity)
+    for a, b in zip(ts.tolist(), prices.tolist()):
+        eng.update(a, b)
+    s = pd.Series(prices)
+    delta = s.diff()
+    ma_up = delta.clip(lower=0).rolling(rsi_period).mean()
+    ma_down = (-delta.clip(upper=0)).rolling(rsi_period).mean()
+    ref = {'ema_short': s.ewm(span=ema_short, adjust=False).mean().to_numpy(),
+           'ema_long': s.ewm(span=ema_long, adjust=False).mean().to_numpy(),
+           'rsi': (100 - 100 / (1 + ma_up / ma_down)).to_numpy()}
+    t_ts, _, ema_s, ema_l, rsi_vals = eng.tail(capacity)
+    got = {'ema_short': ema_s, 'ema_long': ema_l, 'rsi': rsi_vals}
+    res = {'prices': n, 'compared': len(t_ts), 'timestamps_equal': bool(np.array_equal(t_ts, ts[-len(t_ts):]))}
+    for name, arr in got.items():
+        want = ref[name][-len(arr):]
+        res[f'{name}_nan_mismatches'] = int((np.isnan(want) != np.isnan(arr)).sum())
+        res[f'{name}_max_abs_err'] = float(np.nanmax(np.abs(arr - want)))
+    return res
+
+def run_indicators_verify_cli(args):
+    res = verify_indicators(args.n, args.capacity, args.seed)
+    print(f"[INDICATORS] IndicatorEngine vs pandas ewm/rolling RSI: {res}")
+    ok = (res['compared'] > 0 and res['timestamps_equal']
+          and all(res[f'{k}_nan_mismatches'] == 0 and res[f'{k}_max_abs_err'] <= args.tol
+                  for k in ('ema_short', 'ema_long', 'rsi')))
+    print("[INDICATORS] OK" if ok else f"[INDICATORS] MISMATCH (tolerance {args.tol:g})")
+    if not ok:
+        sys.exit(1)
+
+# -------------------------
+# === ANALYTICS CHECK ===
+# -------------------------
+# PortfolioAnalytics' running Sharpe/Sortino against a from-scratch computation over the
+# same window, after every capital change of seeded paths that end in a winning streak
+# longer than the window (no downside left: Sortino must be None, not a rounding artefact).
+
+def verify_analytics(seeds=200, window=analytics_window, seed=7, tol=1e-6):
+    def close(a, b):
+        return (a is None and b is None) or (a is not None and b is not None and abs(a - b) <= tol * max(1.0, abs(b)))
+
+    res = {'paths': seeds, 'checked': 0, 'mismatches': 0, 'streak_sortino_not_none': 0}
+    for k in range(seeds):
+        rng = np.random.default_rng(seed + k)
+        mixed = rng.normal(0, 0.01, int(rng.integers(window, 4 * window)))
+        streak = np.abs(rng.normal(0.002, 0.001, window + int(rng.integers(1, 3 * window)))) + 1e-4
+        caps = start_capital * np.cumprod(np.concatenate([[1.0], 1 + mixed, 1 + streak]))
+        an = PortfolioAnalytics(window)
+        for i, cap in enumerate(caps.tolist()):
+            an.on_capital(cap)
+            if i < 2:
+                continue
+            r = (caps[1:i + 1] / caps[:i] - 1)[-window:]
+            var = r.var(ddof=1)
+            down = float(np.sqrt((np.minimum(r, 0.0) ** 2).mean()))
+            want = (r.mean() / var ** 0.5 if var > 0 else None, r.mean() / down if down > 0 else None)
+            got = an.summary()
+            res['checked'] += 1
+            res['mismatches'] += not (close(got['sharpe'], want[0]) and close(got['sortino'], want[1]))
+        res['streak_sortino_not_none'] += an.summary()['sortino'] is not None
+    return res
+
+def run_analytics_verify_cli(args):
+    res = verify_analytics(args.seeds, args.window, args.seed)
+    print(f"[ANALYTICS] running Sharpe/Sortino vs window recomputation: {res}")
+    ok = res['checked'] > 0 and not res['mismatches'] and not res['streak_sortino_not_none']
+    print("[ANALYTICS] OK" if ok else "[ANALYTICS] MISMATCH")
+    if not ok:
+        sys.exit(1)
+
+# -------------------------
+# === START THREAD + APP ===
+# -------------------------
+def recover_portfolios(directory=journal_dir):
+    # rebuild every portfolio from its journal, then keep journaling into it
+    global trade_ids
+    max_id = 0
+    for pf in portfolios.values():
+        journal = TradeJournal(pf.symbol, directory)
+        t0 = time.perf_counter()
+        with pf.lock:
+            replayed = journal.recover(pf)
+            pf.journal = journal
+            pf.publisher.reset()
+        if replayed or len(pf.ledger) or len(pf.positions):
+            print(f"[JOURNAL] {pf.symbol}: capital {pf.capital:.2f}, {len(pf.positions)} open, {len(pf.ledger)} closed "
+                  f"recovered in {(time.perf_counter() - t0)*1000:.1f} ms ({replayed} records replayed)")
+        max_id = max(max_id, journal.max_id)
+    trade_ids = itertools.count(max_id + 1)
+    atexit.register(journal_writer.flush, 5)
+
+def run_live(args=None):
+    if journal_dir:
+        recover_portfolios()
+    spec = getattr(args, 'shadow', None) or shadow_grid
+    if spec:
+        enable_shadow(spec)
+    # ensure initial capital history
+    for pf in portfolios.values():
+        record_capital(pf, int(time.time()*1000))
+
+    t = threading.Thread(target=run_live_paper_bot, daemon=True)
+    t.start()
+    if tick_feed_mode != 'off':
+        threading.Thread(target=run_tick_feed, daemon=True).start()
+
+    port = int(os.environ.get("PORT", 5000))
+    serve_app(port)
+
+def replay_digest(pf):
+    # fingerprint of the trading result: identical digests = identical decisions
+    h = hashlib.sha256(pf.ledger.rows().tobytes())
+    h.update(json.dumps([_trade_record(t) for t in sorted(pf.positions, key=lambda t: t['id'])]).encode())
+    h.update(repr(pf.capital).encode())
+    return h.hexdigest()[:16]
+
+def run_replay(args):
+    # the live loop (and dashboard) driven by recorded candles on a virtual clock
+    global clock, market_replay, loop_sleep
+    if args.data:
+        rows = {sym: load_replay_rows(args.data, sym) for sym in symbols}
+        source = args.data
+    else:
+        n_2h = -(-max(base_limit('2h', fetch_limit_2h), base_limit('30m', fetch_limit_30m)) // 4) + args.days * 12
+        rows = {sym: synthetic_ohlcv(n_2h, args.seed + i)[1] for i, sym in enumerate(symbols)}
+        source = f"synthetic (seed {args.seed})"
+    replay = CandleReplay(rows)
+    if args.days:
+        replay.end_ms = min(replay.end_ms, replay.start_ms + args.days * 86_400_000)
+    loop_sleep = args.step
+    clock = ReplayClock(replay.start_ms, speed=args.speed)
+    market_replay = replay
+    notifier.enabled = False
+    for pf in portfolios.values():
+        record_capital(pf, clock.ms())
+    if args.shadow or shadow_grid:
+        enable_shadow(args.shadow or shadow_grid)
+    span_days = (replay.end_ms - replay.start_ms) / 86_400_000
+    print(f"[REPLAY] {', '.join(symbols)} from {source}: {clock.now():%Y-%m-%d %H:%M} + {span_days:.1f} days, "
+          f"{loop_sleep:g} s steps at {'unthrottled' if not args.speed else f'{args.speed:g}x'}")
+
+    def replay_and_report():
+        t0 = time.perf_counter()
+        run_live_paper_bot()
+        elapsed = time.perf_counter() - t0
+        for pf in portfolios.values():
+            print(f"[REPLAY] {pf.symbol}: capital {pf.capital:.2f}, {len(pf.ledger)} closed, {len(pf.positions)} open, "
+                  f"digest {replay_digest(pf)}")
+            book = shadow_books.get(pf.symbol)
+            if book is not None:
+                best = ShadowBook.leaderboard(book.grid, book.snapshot, limit=1)[0]
+                print(f"[SHADOW] {pf.symbol}: best of {len(book.grid)} configs: trigger {best['trigger_pct']:g} "
+                      f"tp {best['tp']:g} sl {best['sl']:g} -> pnl {best['pnl']:.2f} ({best['closed']} closed)")
+        print(f"[REPLAY] {span_days:.1f} days replayed in {elapsed:.1f} s ({span_days * 86400 / elapsed:,.0f}x real time)")
+
+    if args.no_server:
+        replay_and_report()
+        return
+    threading.Thread(target=replay_and_report, daemon=True).start()
+    serve_app(args.port)
+
+def serve_app(port):
+    if SERVER_MODE == 'gevent':
+        from gevent.pywsgi import WSGIServer
+        print(f"Serving dashboard with gevent on :{port}")
+        WSGIServer(('0.0.0.0', port), app, log=None).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=port, threaded=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Paper-Trading Bot + Dashboard")
+    sub = parser.add_subparsers(dest='mode')
+    p_lv = sub.add_parser('live', help="live paper trading + dashboard (default)")
+    p_lv.add_argument('--shadow', default=None, help="shadow grid, e.g. 'trigger=1:3:0.25;tp=4,6,8;sl=1,2' (default: SHADOW_GRID)")
+    p_rp = sub.add_parser('replay', help="live loop + dashboard on recorded candles with a virtual clock")
+    p_rp.add_argument('--data', default=None, help=f"candle cache or fixtures directory (e.g. {candle_store_dir}/), default: synthetic")
+    p_rp.add_argument('--days', type=int, default=30, help="replayed days (synthetic length / cap for recorded data)")
+    p_rp.add_argument('--speed', type=float, default=1000.0, help="virtual seconds per real second, 0 = unthrottled")
+    p_rp.add_argument('--step', type=float, default=loop_sleep, help="virtual seconds between loop iterations")
+    p_rp.add_argument('--seed', type=int, default=7)
+    p_rp.add_argument('--port', type=int, default=int(os.environ.get("PORT", 5000)))
+    p_rp.add_argument('--no-server', action='store_true', help="no dashboard: replay, print the result and exit")
+    p_rp.add_argument('--shadow', default=None, help="shadow grid, e.g. 'trigger=1:3:0.25;tp=4,6,8;sl=1,2' (default: SHADOW_GRID)")
+    p_bt = sub.add_parser('backtest', help="vectorized backtest over historical candles")
+    p_bt.add_argument('--symbol', default=symbol)
+    p_bt.add_argument('--since', required=True, help="start date YYYY-MM-DD")
+    p_bt.add_argument('--until', default=None, help="end date YYYY-MM-DD")
+    p_bt.add_argument('--out', default=None, help="write closed trades as CSV")
+    p_sw = sub.add_parser('sweep', help="parallel parameter sweep (values: 'a,b,c' or 'start:stop:step')")
+    p_sw.add_argument('--symbol', default=symbol)
+    p_sw.add_argument('--since', required=True, help="start date YYYY-MM-DD")
+    p_sw.add_argument('--until', default=None, help="end date YYYY-MM-DD")
+    p_sw.add_argument('--trigger', default=str(trigger_pct))
+    p_sw.add_argument('--tp', default=str(profit_target))
+    p_sw.add_argument('--sl', default=str(stop_loss))
+    p_sw.add_argument('--max-open', default=str(max_open_per_side))
+    p_sw.add_argument('--fee', default=str(fee_pct))
+    p_sw.add_argument('--size', default=str(order_size_usdt))
+    p_sw.add_argument('--workers', type=int, default=None, help="processes (default: all cores)")
+    p_sw.add_argument('--top', type=int, default=20)
+    p_sw.add_argument('--out', default=None, help="write full ranking as CSV")
+    p_lt = sub.add_parser('sse-loadtest', help="SSE fan-out load test: connections vs memory/latency")
+    p_lt.add_argument('--clients', default="10,100,500,1000", help="comma separated connection counts")
+    p_lt.add_argument('--hold', type=float, default=5.0, help="seconds measured per step")
+    p_lt.add_argument('--interval', type=float, default=0.5, help="synthetic publish interval (s)")
+    p_lt.add_argument('--port', type=int, default=5055)
+    p_lt.add_argument('--server-mode', default=SERVER_MODE, choices=['threaded', 'gevent'])
+    p_ss = sub.add_parser('state-stress', help="/api/state latency vs reader concurrency while the writer ticks")
+    p_ss.add_argument('--readers', default="1,4,16,64", help="comma separated concurrent reader counts")
+    p_ss.add_argument('--rate', type=float, default=2.0, help="requests/s per reader (open loop)")
+    p_ss.add_argument('--hold', type=float, default=5.0, help="seconds measured per step")
+    p_ss.add_argument('--closed', type=int, default=100000, help="closed trades in the bench portfolio")
+    p_ss.add_argument('--interval', type=float, default=0.05, help="writer tick interval (s)")
+    p_ss.add_argument('--port', type=int, default=5056)
+    p_ss.add_argument('--server-mode', default=SERVER_MODE, choices=['threaded', 'gevent'])
+    p_fb = sub.add_parser('feed-bench', help="per-tick TP/SL decision latency on a replayed tick stream")
+    p_fb.add_argument('--ticks', type=int, default=100000)
+    p_fb.add_argument('--positions', type=int, default=24)
+    p_fb.add_argument('--seed', type=int, default=7)
+    p_jb = sub.add_parser('journal-bench', help="journal recovery time + kill -9 crash test")
+    p_jb.add_argument('--trades', type=int, default=50000)
+    p_jb.add_argument('--kills', type=int, default=5)
+    p_jb.add_argument('--seed', type=int, default=7)
+    p_jb.add_argument('--dir', default=None, help="working directory (default: new temp dir)")
+    p_nb = sub.add_parser('notify-bench', help="Telegram notifier against a local fake endpoint")
+    p_nb.add_argument('--ticks', type=int, default=20)
+    p_nb.add_argument('--burst', type=int, default=12, help="events per tick (e.g. pyramided entries)")
+    p_nb.add_argument('--interval', type=float, default=0.1, help="seconds between ticks")
+    p_nb.add_argument('--latency', type=float, default=0.5, help="fake endpoint response time (s)")
+    p_nb.add_argument('--flood-every', type=int, default=0, help="answer every Nth request with 429")
+    p_nb.add_argument('--queue', type=int, default=telegram_queue_size)
+    p_nb.add_argument('--rps', type=float, default=telegram_max_rps)
+    p_nb.add_argument('--timeout', type=float, default=60.0)
+    p_nb.add_argument('--max-send-ms', type=float, default=50.0,
+                      help="fail if one send() takes longer (a GIL hand-off alone can take ~5 ms)")
+    p_eb = sub.add_parser('exchange-bench', help="exchange access layer against a local fake Binance")
+    p_eb.add_argument('--symbols', type=int, default=4, help="number of symbols (max 8)")
+    p_eb.add_argument('--latency', type=float, default=0.2, help="fake response time (s)")
+    p_eb.add_argument('--jitter', type=float, default=0.05, help="extra random response time up to this (s)")
+    p_eb.add_argument('--fail-rate', type=float, default=0.2, help="share of 503/429 answers in the failure phase")
+    p_eb.add_argument('--iterations', type=int, default=5)
+    p_eb.add_argument('--dedup', type=int, default=16, help="identical concurrent calls in the dedup check")
+    p_eb.add_argument('--cooldown', type=float, default=2.0, help="breaker cooldown used by the bench (s)")
+    p_eb.add_argument('--port', type=int, default=0)
+    p_eb.add_argument('--serve', action='store_true', help="only run the fake exchange (for EXCHANGE_API=...)")
+    p_be = sub.add_parser('bench', help="offline benchmark suite (JSON output, regression check)")
+    p_be.add_argument('--sizes', default="1000,100000,1000000", help="closed trades for the api_state / export cases")
+    p_be.add_argument('--export-sizes', default="1000,100000", help="sizes that also run the CSV export")
+    p_be.add_argument('--repeat', type=int, default=5)
+    p_be.add_argument('--seed', type=int, default=7)
+    p_be.add_argument('--fixtures', default=fixtures_dir, help="directory with recorded exchange responses (bench --record)")
+    p_be.add_argument('--synthetic', action='store_true', help="seeded synthetic candles instead of the recorded ones")
+    p_be.add_argument('--record', default=None, help="record candle fixtures from the exchange into this directory and exit")
+    p_be.add_argument('--out', default=None, help="write results as JSON")
+    p_be.add_argument('--compare', default=None, help="baseline JSON from an earlier run")
+    p_be.add_argument('--threshold', type=float, default=1.25, help="allowed slowdown factor vs. baseline")
+    p_cv = sub.add_parser('candles-verify', help="check locally aggregated candles against native exchange candles")
+    p_cv.add_argument('--fixtures', default=fixtures_dir, help="directory with recorded candles (bench --record)")
+    p_cv.add_argument('--synthetic', action='store_true', help="seeded synthetic candles instead of the recorded ones")
+    p_cv.add_argument('--symbol', default=symbol)
+    p_cv.add_argument('--base', default=candle_base_timeframe)
+    p_cv.add_argument('--timeframe', default='2h')
+    p_cv.add_argument('--seed', type=int, default=7)
+    p_iv = sub.add_parser('indicators-verify', help="check the streaming EMA/RSI against the pandas reference")
+    p_iv.add_argument('--n', type=int, default=50000, help="prices in the seeded walk")
+    p_iv.add_argument('--capacity', type=int, default=1000, help="engine capacity (small = many compactions)")
+    p_iv.add_argument('--seed', type=int, default=7)
+    p_iv.add_argument('--tol', type=float, default=1e-8, help="max absolute error")
+    p_av = sub.add_parser('analytics-verify', help="check the running Sharpe/Sortino, incl. after long winning streaks")
+    p_av.add_argument('--seeds', type=int, default=200, help="seeded capital paths")
+    p_av.add_argument('--window', type=int, default=analytics_window)
+    p_av.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    if args.mode == 'replay':
+        run_replay(args)
+    elif args.mode == 'backtest':
+        run_backtest_cli(args)
+    elif args.mode == 'sweep':
+        run_sweep_cli(args)
+    elif args.mode == 'sse-loadtest':
+        run_sse_loadtest_cli(args)
+    elif args.mode == 'state-stress':
+        run_state_stress_cli(args)
+    elif args.mode == 'feed-bench':
+        run_feed_bench_cli(args)
+    elif args.mode == 'journal-bench':
+        run_journal_bench_cli(args)
+    elif args.mode == 'notify-bench':
+        run_notify_bench_cli(args)
+    elif args.mode == 'exchange-bench':
+        run_exchange_bench_cli(args)
+    elif args.mode == 'bench':
+        run_bench_cli(args)
+    elif args.mode == 'candles-verify':
+        run_candles_verify_cli(args)
+    elif args.mode == 'indicators-verify':
+        run_indicators_verify_cli(args)
+    elif args.mode == 'analytics-verify':
+        run_analytics_verify_cli(args)
+    else:
+        run_live(args)